@@ -35,6 +35,7 @@ import datastore
 import time
 import json
 import imp
+import heapq
 import threading
 from bsd import setproctitle
 from datetime import timedelta, datetime
@@ -47,7 +48,7 @@ from freenas.serviced import checkin
 
 
 DEFAULT_CONFIGFILE = '/usr/local/etc/middleware.conf'
-REMINDER_SECONDS = 3600
+PERSIST_INTERVAL = 5
 REMINDER_SCHEDULE = {
     'CRITICAL': 1,
     'WARNING': 12,
@@ -66,6 +67,47 @@ operators_table = {
 }
 
 
+def compile_predicate(predicate):
+    prop = predicate['property']
+    value = predicate['value']
+
+    if predicate['operator'] == '~':
+        regex = re.compile(str(value))
+        return lambda props: regex.search(str(props.get(prop)))
+
+    op = operators_table[predicate['operator']]
+    return lambda props: op(props.get(prop), value)
+
+
+class CompiledFilter(object):
+    def __init__(self, alert_filter):
+        self.id = alert_filter['id']
+        self.clazz = alert_filter.get('clazz')
+        self.emitter = alert_filter['emitter']
+        self.parameters = alert_filter['parameters']
+        self.predicates = []
+
+        for pr in alert_filter.get('predicates', []):
+            if pr['operator'] not in operators_table:
+                continue
+
+            try:
+                self.predicates.append(compile_predicate(pr))
+            except re.error:
+                continue
+
+    def match(self, alert):
+        props = alert.get('properties') or {}
+        for pr in self.predicates:
+            try:
+                if not pr(props):
+                    return False
+            except:
+                continue
+
+        return True
+
+
 class AlertEmitter(object):
     def __init__(self, context):
         self.context = context
@@ -100,7 +142,7 @@ class AlertService(RpcService):
         self.context.emit_alert(alert)
 
     def cancel(self, id):
-        pass
+        self.context.unschedule_reminder(id)
 
 
 class Main(object):
@@ -112,6 +154,14 @@ class Main(object):
         self.client = None
         self.plugin_dirs = []
         self.emitters = {}
+        self.filters_lock = threading.Lock()
+        self.filters = None
+        self.filters_by_class = {}
+        self.persist_lock = threading.Lock()
+        self.pending_updates = {}
+        self.reminder_cv = threading.Condition()
+        self.reminder_queue = []
+        self.reminders = {}
 
     def init_datastore(self):
         try:
@@ -132,7 +182,19 @@ class Main(object):
         self.client.on_error(on_error)
         self.connect()
 
+        # Handlers stay registered on the client across reconnects; connect() only renews the subscriptions
+        self.client.register_event_handler('alert.filter.changed', lambda args: self.invalidate_filters())
+        self.client.register_event_handler('alert.changed', self.on_alert_changed)
+
+    def init_persist(self):
+        t = threading.Thread(target=self.persist_thread)
+        t.daemon = True
+        t.start()
+
     def init_reminder(self):
+        for i in self.datastore.query('alerts', ('active', '=', True), ('dismissed', '=', False)):
+            self.schedule_reminder(i)
+
         t = threading.Thread(target=self.reminder_thread)
         t.daemon = True
         t.start()
@@ -163,6 +225,9 @@ class Main(object):
                 self.client.resume_service('alertd.management')
                 self.client.resume_service('alertd.alert')
                 self.client.resume_service('alertd.debug')
+                self.client.subscribe_events('alert.filter.changed', 'alert.changed')
+                # Filters may have changed while disconnected
+                self.invalidate_filters()
                 return
             except (OSError, RpcException) as err:
                 self.logger.warning('Cannot connect to dispatcher: {0}, retrying in 1 second'.format(str(err)))
@@ -185,50 +250,110 @@ class Main(object):
             except:
                 self.logger.error('Cannot initialize plugin {0}'.format(f), exc_info=True)
 
+    def load_filters(self):
+        order = self.configstore.get('alert.filter.order') or []
+        filters = [CompiledFilter(i) for i in self.datastore.query('alert.filters')]
+        filters.sort(key=lambda f: order.index(f.id) if f.id in order else len(order))
+
+        by_class = {}
+        for f in filters:
+            if f.clazz is not None:
+                by_class.setdefault(f.clazz, None)
+
+        for clazz in by_class:
+            by_class[clazz] = [f for f in filters if f.clazz in (None, clazz)]
+
+        # Classes without dedicated filters only match the catch-all ones
+        by_class[None] = [f for f in filters if f.clazz is None]
+        self.filters = filters
+        self.filters_by_class = by_class
+
+    def invalidate_filters(self):
+        self.logger.debug('Alert filters changed, reloading')
+        with self.filters_lock:
+            self.filters = None
+
+    def get_filters(self, clazz):
+        with self.filters_lock:
+            if self.filters is None:
+                self.load_filters()
+
+            return self.filters_by_class.get(clazz, self.filters_by_class[None])
+
     def emit_alert(self, alert):
         if 'clazz' not in alert or 'id' not in alert:
             self.logger.warning('Ignoring invalid alert <id:{0}>'.format(alert.get('id')))
             return
 
+        with self.persist_lock:
+            pending = self.pending_updates.get(alert['id'])
+            if pending:
+                alert.update(pending)
+
         self.logger.debug('Emitting alert <id:{0}> (class {1})'.format(alert['id'], alert['clazz']))
-        for i in self.datastore.query('alert.filters', ('or', [
-            ('clazz', '=', None),
-            ('clazz', '=', alert['clazz'])
-        ])):
-            for pr in i.get('predicates', []):
-                if pr['operator'] not in operators_table:
-                    continue
+        for i in self.get_filters(alert['clazz']):
+            if not i.match(alert):
+                continue
 
-                try:
-                    if not operators_table[pr['operator']](alert.properties.get(pr['property']), pr['value']):
-                        break
-                except:
+            try:
+                emitter = self.emitters.get(i.emitter)
+                if not emitter:
+                    self.logger.warning('Invalid emitter {0} for alert filter {1}'.format(i.emitter, i.id))
                     continue
-            else:
-                try:
-                    emitter = self.emitters.get(i['emitter'])
-                    if not emitter:
-                        self.logger.warning('Invalid emitter {0} for alert filter {1}'.format(i['emitter'], i['id']))
-                        continue
-
-                    self.logger.debug('Alert <id:{0}> matched filter {1}'.format(alert['id'], i['id']))
-                    if alert['send_count'] > 0:
-                        if not alert['one_shot']:
-                            emitter.emit_again(alert, i['parameters'])
-                    else:
-                        emitter.emit_first(alert, i['parameters'])
-                except BaseException as err:
-                    # Failed to emit alert using alert emitter
-                    # XXX: generate another alert about that
-                    self.logger.error('Cannot emit alert <id:{0}> using {1}: {2}'.format(
-                        alert['id'],
-                        i['emitter'],
-                        str(err))
-                    )
+
+                self.logger.debug('Alert <id:{0}> matched filter {1}'.format(alert['id'], i.id))
+                if alert['send_count'] > 0:
+                    if not alert['one_shot']:
+                        emitter.emit_again(alert, i.parameters)
+                else:
+                    emitter.emit_first(alert, i.parameters)
+            except BaseException as err:
+                # Failed to emit alert using alert emitter
+                # XXX: generate another alert about that
+                self.logger.error('Cannot emit alert <id:{0}> using {1}: {2}'.format(
+                    alert['id'],
+                    i.emitter,
+                    str(err))
+                )
 
         alert['send_count'] += 1
         alert['last_emitted_at'] = datetime.utcnow()
-        self.datastore.update('alerts', alert['id'], alert)
+
+        with self.persist_lock:
+            self.pending_updates[alert['id']] = {
+                'send_count': alert['send_count'],
+                'last_emitted_at': alert['last_emitted_at']
+            }
+
+        self.schedule_reminder(alert)
+
+    def persist_updates(self):
+        with self.persist_lock:
+            updates = self.pending_updates
+            self.pending_updates = {}
+
+        if not updates:
+            return
+
+        try:
+            for alert in self.datastore.query('alerts', ('id', 'in', list(updates.keys()))):
+                alert.update(updates[alert['id']])
+                self.datastore.update('alerts', alert['id'], alert)
+        except:
+            # Retry on the next round, newer updates take precedence
+            with self.persist_lock:
+                for id, update in updates.items():
+                    self.pending_updates.setdefault(id, update)
+
+            raise
+
+    def persist_thread(self):
+        while True:
+            time.sleep(PERSIST_INTERVAL)
+            try:
+                self.persist_updates()
+            except BaseException as err:
+                self.logger.error('Cannot persist alert emission state: {0}'.format(str(err)))
 
     def cancel_alert(self, alert):
         self.logger.debug('Cancelling alert <id:{0}> (class {1})'.format(alert['id'], alert['clazz']))
@@ -244,21 +369,75 @@ class Main(object):
         self.emitters[name] = cls(self)
         self.logger.info('Registered emitter {0} (class {1})'.format(name, cls))
 
-    def reminder_thread(self):
-        while True:
-            time.sleep(REMINDER_SECONDS)
-            for i in self.datastore.query('alerts'):
-                if not i['active'] or i['dismissed']:
-                    continue
+    def schedule_reminder(self, alert):
+        with self.persist_lock:
+            pending = self.pending_updates.get(alert['id'])
+            if pending:
+                alert.update(pending)
+
+        with self.reminder_cv:
+            self.reminders.pop(alert['id'], None)
+            interval = REMINDER_SCHEDULE.get(alert['severity'])
+            if alert['active'] and not alert['dismissed'] and interval:
+                last_emission = alert.get('last_emitted_at') or alert['created_at']
+                due = last_emission + timedelta(hours=interval)
+                self.reminders[alert['id']] = due
+                heapq.heappush(self.reminder_queue, (due, alert['id']))
+
+            self.reminder_cv.notify_all()
+
+    def unschedule_reminder(self, id):
+        with self.reminder_cv:
+            # Heap entry is discarded lazily once it reaches the top
+            self.reminders.pop(id, None)
+
+    def on_alert_changed(self, args):
+        if args['operation'] == 'delete':
+            for i in args['ids']:
+                self.unschedule_reminder(i)
 
-                last_emission = i.get('last_emitted_at') or i['created_at']
-                interval = REMINDER_SCHEDULE[i['severity']]
+            return
 
-                if not interval:
-                    continue
+        if args['operation'] != 'update':
+            return
 
-                if last_emission + timedelta(seconds=interval) <= datetime.utcnow():
-                    self.emit_alert(i)
+        for i in args['ids']:
+            alert = self.datastore.get_by_id('alerts', i)
+            if alert:
+                self.schedule_reminder(alert)
+            else:
+                self.unschedule_reminder(i)
+
+    def next_reminder(self):
+        with self.reminder_cv:
+            while True:
+                while self.reminder_queue:
+                    due, id = self.reminder_queue[0]
+                    if self.reminders.get(id) == due:
+                        break
+
+                    heapq.heappop(self.reminder_queue)
+
+                timeout = None
+                if self.reminder_queue:
+                    due, id = self.reminder_queue[0]
+                    timeout = (due - datetime.utcnow()).total_seconds()
+                    if timeout <= 0:
+                        heapq.heappop(self.reminder_queue)
+                        del self.reminders[id]
+                        return id
+
+                self.reminder_cv.wait(timeout)
+
+    def reminder_thread(self):
+        while True:
+            id = self.next_reminder()
+            try:
+                alert = self.datastore.get_by_id('alerts', id)
+                if alert and alert['active'] and not alert['dismissed']:
+                    self.emit_alert(alert)
+            except BaseException as err:
+                self.logger.error('Cannot emit reminder for alert <id:{0}>: {1}'.format(id, str(err)))
 
     def checkin(self):
         checkin()
@@ -275,6 +454,7 @@ class Main(object):
         self.init_datastore()
         self.init_dispatcher()
         self.scan_plugins()
+        self.init_persist()
         self.init_reminder()
         self.checkin()
         self.client.wait_forever()
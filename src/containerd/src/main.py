@@ -41,6 +41,7 @@ import string
 import random
 import gevent
 import gevent.os
+import gevent.pool
 import subprocess
 import serial
 import netif
@@ -87,6 +88,10 @@ MGMT_INTERFACE = 'mgmt0'
 NAT_INTERFACE = 'nat0'
 DEFAULT_CONFIGFILE = '/usr/local/etc/middleware.conf'
 SCROLLBACK_SIZE = 20 * 1024
+CONSOLE_FRAME_SIZE = 64 * 1024
+CONSOLE_COALESCE_INTERVAL = 0.01
+DOCKER_INSPECT_CONCURRENCY = 8
+DOCKER_INVENTORY_TIMEOUT = 30
 
 vtx_enabled = False
 svm_features = False
@@ -227,15 +232,63 @@ def unpack_docker_error(err):
 
 
 class BinaryRingBuffer(object):
+    """
+    Fixed-size circular byte buffer used for console scrollback.
+
+    Writes copy the incoming data into a preallocated buffer at the
+    current write position, so pushing is O(len(data)) regardless of
+    the buffer size. `segments` returns memoryviews into the live buffer
+    in chronological order; use `read` for a copy that stays valid across
+    later pushes.
+    """
     def __init__(self, size):
+        self.size = size
         self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.pos = 0
+        self.length = 0
 
     def push(self, data):
-        del self.data[0:len(data)]
-        self.data += data
+        count = len(data)
+        if not count or not self.size:
+            return
+
+        if count >= self.size:
+            # Only the tail of oversized writes can ever be read back
+            data = memoryview(data)[count - self.size:]
+            self.view[:] = data
+            self.pos = 0
+            self.length = self.size
+            return
+
+        first = min(count, self.size - self.pos)
+        self.view[self.pos:self.pos + first] = data[:first]
+        if first < count:
+            self.view[:count - first] = data[first:]
+
+        self.pos = (self.pos + count) % self.size
+        self.length = min(self.length + count, self.size)
+
+    def segments(self):
+        if self.length < self.size:
+            return [self.view[:self.length]] if self.length else []
+
+        return [s for s in (self.view[self.pos:], self.view[:self.pos]) if len(s)]
 
     def read(self):
-        return self.data
+        return b''.join(self.segments())
+
+    def resize(self, size):
+        if size == self.size:
+            return
+
+        contents = self.read()
+        self.size = size
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.pos = 0
+        self.length = 0
+        self.push(contents)
 
 
 class VirtualMachine(object):
@@ -590,6 +643,7 @@ class VirtualMachine(object):
         self.context.init_mgmt()
         self.context.logger.info('Starting VM {0} ({1})'.format(self.name, self.id))
         self.nmdm = self.get_nmdm()
+        self.scrollback.resize(q.get(self.config, 'console_scrollback') or SCROLLBACK_SIZE)
         dropped_devices = list(self.drop_invalid_devices())
         self.thread = gevent.spawn(self.run)
         self.console_thread = gevent.spawn(self.console_worker)
@@ -890,7 +944,10 @@ class DockerHost(object):
         self.listener = None
         self.mapped_ports = {}
         self.active_consoles = {}
+        self.containers = {}
+        self.networks = {}
         self.ready = Event()
+        self.inventory_ready = Event()
         self.logger = logging.getLogger(self.__class__.__name__)
         gevent.spawn(self.wait_ready)
 
@@ -973,6 +1030,79 @@ class DockerHost(object):
                         'Failed to start {0} container automatically: {1}'.format(q.get(container, 'Names.0'), err)
                     )
 
+    def inspect_container(self, id):
+        try:
+            return self.connection.inspect_container(id)
+        except NotFound:
+            return None
+
+    def inspect_network(self, id):
+        try:
+            return self.connection.inspect_network(id)
+        except NotFound:
+            return None
+
+    def resync(self):
+        pool = gevent.pool.Pool(DOCKER_INSPECT_CONCURRENCY)
+        container_ids = [c['Id'] for c in self.connection.containers(all=True)]
+        network_ids = [n['Id'] for n in self.connection.networks()]
+        containers = {d['Id']: d for d in pool.imap_unordered(self.inspect_container, container_ids) if d}
+        networks = {d['Id']: d for d in pool.imap_unordered(self.inspect_network, network_ids) if d}
+
+        self.clear_inventory()
+        self.containers = containers
+        self.networks = networks
+        self.context.container_hosts.update({id: self for id in containers})
+        self.context.network_hosts.update({id: self for id in networks})
+        self.inventory_ready.set()
+        self.logger.debug('Inventory of {0} synced: {1} containers, {2} networks'.format(
+            self.vm.name,
+            len(containers),
+            len(networks)
+        ))
+
+    def clear_inventory(self):
+        for id in self.containers:
+            if self.context.container_hosts.get(id) is self:
+                del self.context.container_hosts[id]
+
+        for id in self.networks:
+            if self.context.network_hosts.get(id) is self:
+                del self.context.network_hosts[id]
+
+        self.containers = {}
+        self.networks = {}
+
+    def update_container(self, id):
+        details = self.inspect_container(id)
+        if not details:
+            self.remove_container(id)
+            return None
+
+        self.containers[details['Id']] = details
+        self.context.container_hosts[details['Id']] = self
+        return details
+
+    def remove_container(self, id):
+        self.containers.pop(id, None)
+        if self.context.container_hosts.get(id) is self:
+            del self.context.container_hosts[id]
+
+    def update_network(self, id):
+        details = self.inspect_network(id)
+        if not details:
+            self.remove_network(id)
+            return None
+
+        self.networks[details['Id']] = details
+        self.context.network_hosts[details['Id']] = self
+        return details
+
+    def remove_network(self, id):
+        self.networks.pop(id, None)
+        if self.context.network_hosts.get(id) is self:
+            del self.context.network_hosts[id]
+
     def listen(self):
         self.logger.debug('Listening for docker events on {0}'.format(self.vm.name))
         actions = {
@@ -985,14 +1115,21 @@ class DockerHost(object):
         }
 
         while True:
-            events = self.connection.events(decode=True)
-            self.logger.debug(f'Docker host VM {self.vm.name} starting to listen on events')
-            self.context.client.call_sync('docker.host.refresh_cache', self.vm.id, timeout=600)
-            self.logger.debug(f'Docker host VM {self.vm.name} local cache synced')
             try:
+                events = self.connection.events(decode=True)
+                self.logger.debug(f'Docker host VM {self.vm.name} starting to listen on events')
+                self.resync()
+                self.context.client.call_sync('docker.host.refresh_cache', self.vm.id, timeout=600)
+                self.logger.debug(f'Docker host VM {self.vm.name} local cache synced')
                 for ev in events:
                     self.logger.debug('Received docker event: {0}'.format(ev))
                     if ev['Type'] == 'container':
+                        if ev['Action'] == 'destroy':
+                            self.remove_container(ev['id'])
+                            details = None
+                        else:
+                            details = self.update_container(ev['id'])
+
                         self.context.client.emit_event('containerd.docker.container.changed', {
                             'operation': actions.get(ev['Action'], 'update'),
                             'ids': [ev['id']]
@@ -1000,8 +1137,7 @@ class DockerHost(object):
                         name = q.get(ev, 'Actor.Attributes.name')
 
                         if ev['Action'] == 'die':
-                            details = self.connection.inspect_container(ev['id'])
-                            state = details['State']
+                            state = details['State'] if details else {}
                             if not state.get('Running') and state.get('ExitCode') not in (None, 0, 137):
                                 self.context.client.call_sync('alert.emit', {
                                     'clazz': 'DockerContainerDied',
@@ -1056,13 +1192,14 @@ class DockerHost(object):
                                 continue
                             if primary_network_mode != 'NAT':
                                 continue
+                            if not details:
+                                continue
 
                             self.logger.debug('Redirecting container {0} ports on host firewall'.format(ev['id']))
 
                             mapped_ports = []
 
                             # Setup or destroy port redirection now, if needed
-                            details = self.connection.inspect_container(ev['id'])
                             for i in get_docker_ports(details):
                                 if i['host_port'] in mapped_ports:
                                     continue
@@ -1127,7 +1264,13 @@ class DockerHost(object):
                         netw_id = q.get(ev, 'Actor.ID')
                         cont_id = q.get(ev, 'Actor.Attributes.container')
                         operation = actions.get(ev['Action'], 'update')
+                        if ev['Action'] == 'destroy':
+                            self.remove_network(netw_id)
+                        else:
+                            self.update_network(netw_id)
+
                         if cont_id:
+                            self.update_container(cont_id)
                             self.context.client.emit_event('containerd.docker.container.changed', {
                                 'operation': operation,
                                 'ids': [cont_id]
@@ -1150,6 +1293,7 @@ class DockerHost(object):
         return self.active_consoles[id]
 
     def shutdown(self):
+        self.clear_inventory()
         p = pf.PF()
         for container_ports in self.mapped_ports.values():
             for i in container_ports:
@@ -1297,6 +1441,14 @@ class ManagementService(RpcService):
         self.context = context
         self.retry_lock = RLock()
 
+    @private
+    def get_status_many(self, ids):
+        return {id: self.get_status(id) for id in ids}
+
+    @private
+    def get_devices_status_many(self, ids):
+        return {id: self.get_devices_status(id) for id in ids}
+
     @private
     def get_status(self, id):
         vm = self.context.vms.get(id)
@@ -1614,13 +1766,12 @@ class DockerService(RpcService):
 
         result = []
         for host in self.context.iterate_docker_hosts():
-            for container in host.connection.containers(all=True):
-                obj = {}
-                try:
-                    details = host.connection.inspect_container(container['Id'])
-                except NotFound:
-                    continue
+            if not host.inventory_ready.wait(DOCKER_INVENTORY_TIMEOUT):
+                # A partial result would look to callers as if the host's objects were gone
+                raise RpcException(errno.ETIMEDOUT, 'Inventory of Docker host {0} is not available'.format(host.vm.name))
 
+            for details in list(host.containers.values()):
+                obj = {}
                 host_config = q.get(details, 'HostConfig')
                 net_mode = host_config.get('NetworkMode')
                 bridge_enabled = net_mode == 'external'
@@ -1638,13 +1789,12 @@ class DockerService(RpcService):
                 # Docker does not assign the <container>.NetworkSettings.Networks.<network>.NetworkID
                 # untill the container is started, hence the below gymnastics to retrive the network id
                 network_names = list(q.get(details, 'NetworkSettings.Networks', {}).keys())
-                if network_names:
-                    for n in host.connection.networks(names=network_names):
-                        if n.get('Name') not in hidden_builtin_networks:
-                            networks.append(n.get('Id'))
+                for n in host.networks.values():
+                    if n.get('Name') in network_names and n.get('Name') not in hidden_builtin_networks:
+                        networks.append(n.get('Id'))
                 labels = q.get(details, 'Config.Labels')
                 environment = q.get(details, 'Config.Env')
-                names = list(normalize_names(container['Names']))
+                names = list(normalize_names([details['Name']]))
                 external = q.get(details, 'NetworkSettings.Networks.external')
                 bridge_ipaddress = q.get(external, 'IPAMConfig.IPv4Address') if bridge_enabled else None
                 bridge_macaddress = q.get(details, 'Config.MacAddress') if bridge_enabled else None
@@ -1660,9 +1810,9 @@ class DockerService(RpcService):
                         })
 
                 obj.update({
-                    'id': container['Id'],
-                    'image': container['Image'],
-                    'image_id': container['ImageID'],
+                    'id': details['Id'],
+                    'image': q.get(details, 'Config.Image'),
+                    'image_id': details['Image'],
                     'name': names[0],
                     'names': names,
                     'command': command if isinstance(command, list) else [command],
@@ -1721,10 +1871,13 @@ class DockerService(RpcService):
         result = []
 
         for host in self.context.iterate_docker_hosts():
-            networks = host.connection.networks()
+            if not host.inventory_ready.wait(DOCKER_INVENTORY_TIMEOUT):
+                # A partial result would look to callers as if the host's objects were gone
+                raise RpcException(errno.ETIMEDOUT, 'Inventory of Docker host {0} is not available'.format(host.vm.name))
+
+            networks = list(host.networks.values())
             networks_containers_map = {n['Name']: [] for n in networks}
-            containers = host.connection.containers(all=True)
-            for c in containers:
+            for c in list(host.containers.values()):
                 network_names = list(q.get(c, 'NetworkSettings.Networks', {}).keys())
                 for n in network_names:
                     try:
@@ -1732,8 +1885,7 @@ class DockerService(RpcService):
                     except KeyError:
                         pass
 
-            for network in networks:
-                details = host.connection.inspect_network(network['Id'])
+            for details in networks:
                 config = q.get(details, 'IPAM.Config.0')
 
                 result.append({
@@ -2127,8 +2279,39 @@ class ServerResource(Resource):
             return current_app(environ, start_response)
 
 
+def drain_console_queue(queue, interval=0, limit=CONSOLE_FRAME_SIZE):
+    """
+    Block for the first chunk on a console queue, then keep collecting
+    whatever arrives within `interval` seconds (up to `limit` bytes).
+
+    Returns a (data, sentinel) tuple, where sentinel is the non-bytes item
+    (None or StopIteration) that ended the stream, if any.
+    """
+    chunks = []
+    size = 0
+    deadline = None
+    while size < limit:
+        try:
+            if deadline is None:
+                item = queue.get()
+            else:
+                remaining = deadline - time.monotonic()
+                item = queue.get(timeout=remaining) if remaining > 0 else queue.get_nowait()
+        except gevent.queue.Empty:
+            break
+
+        if not isinstance(item, (bytes, bytearray)):
+            return b''.join(chunks), item
+
+        chunks.append(item)
+        size += len(item)
+        if deadline is None:
+            deadline = time.monotonic() + interval
+
+    return b''.join(chunks), None
+
+
 class ConsoleConnection(WebSocketApplication, EventEmitter):
-    BUFSIZE = 1024
 
     def __init__(self, ws, context):
         super(ConsoleConnection, self).__init__(ws)
@@ -2145,23 +2328,32 @@ class ConsoleConnection(WebSocketApplication, EventEmitter):
         self.logger.info('Opening console to %s...', self.console_provider.name)
 
         def read_worker():
-            for data in self.console_queue:
-                if data is None:
-                    return
+            while True:
+                data, end = drain_console_queue(self.console_queue, CONSOLE_COALESCE_INTERVAL)
+                if data:
+                    try:
+                        self.ws.send(data.replace(b'\n\n', b'\r\n'), binary=True)
+                    except WebSocketError as err:
+                        self.logger.info('WebSocket connection terminated: {0}'.format(str(err)))
+                        return
 
-                try:
-                    self.ws.send(data.replace(b'\n\n', b'\r\n'))
-                except WebSocketError as err:
-                    self.logger.info('WebSocket connection terminated: {0}'.format(str(err)))
+                if end is StopIteration:
+                    self.ws.close()
                     return
 
-            self.ws.close()
+                if end is not None:
+                    return
 
         def write_worker():
-            for i in self.inq:
-                try:
-                    self.console_provider.console_write(i)
-                except BrokenPipeError:
+            while True:
+                data, end = drain_console_queue(self.inq)
+                if data:
+                    try:
+                        self.console_provider.console_write(data)
+                    except BrokenPipeError:
+                        return
+
+                if end is not None:
                     return
 
         self.wr = gevent.spawn(write_worker)
@@ -2220,7 +2412,10 @@ class ConsoleConnection(WebSocketApplication, EventEmitter):
 
             self.console_queue = self.console_provider.console_register()
             self.ws.send(json.dumps({'status': 'ok'}))
-            self.ws.send(self.console_provider.scrollback.read())
+            # Snapshot first: sending yields, and console output pushed meanwhile would overwrite the views
+            scrollback = self.console_provider.scrollback.read()
+            if scrollback:
+                self.ws.send(scrollback, binary=True)
 
             gevent.spawn(self.worker)
             return
@@ -2228,11 +2423,7 @@ class ConsoleConnection(WebSocketApplication, EventEmitter):
         if isinstance(message, str):
             message = message.encode('utf-8')
 
-        for i in message:
-            i = bytes([i])
-            if i == '\r':
-                i = '\n'
-            self.inq.put(i)
+        self.inq.put(message.replace(b'\r\n', b'\n').replace(b'\r', b'\n'))
 
 
 class VncConnection(WebSocketApplication, EventEmitter):
@@ -2300,6 +2491,8 @@ class Main(object):
         self.vms = {}
         self.failed_autostart_vms = []
         self.docker_hosts = {}
+        self.container_hosts = {}
+        self.network_hosts = {}
         self.tokens = {}
         self.logger = logging.getLogger('containerd')
         self.bridge_interface = None
@@ -2460,6 +2653,11 @@ class Main(object):
                 return i.vm()
 
     def docker_host_by_container_id(self, id):
+        host = self.container_hosts.get(id)
+        if host:
+            host.ready.wait()
+            return host
+
         for host in self.docker_hosts.values():
             try:
                 if host.connection.containers(all=True, quiet=True, filters={'id': id}):
@@ -2473,6 +2671,11 @@ class Main(object):
         raise RpcException(errno.ENOENT, 'Container {0} not found'.format(id))
 
     def docker_host_by_network_id(self, id):
+        host = self.network_hosts.get(id)
+        if host:
+            host.ready.wait()
+            return host
+
         for host in self.docker_hosts.values():
             for n in host.connection.networks():
                 if n['Id'] == id:
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Console input throughput benchmark for containerd.
+
+Uses a pty pair as a stand-in for the nmdm device a VM console is attached
+to and compares writing pasted input one byte at a time (flushing the serial
+port after each byte) against writing it as whole buffers, e.g.:
+
+    ./consolebench.py -s 262144 -c 4096
+"""
+import os
+import pty
+import tty
+import time
+import argparse
+import threading
+import serial
+
+
+def drain(fd, expected, done):
+    received = 0
+    while received < expected:
+        data = os.read(fd, 65536)
+        if not data:
+            break
+
+        received += len(data)
+
+    done.set()
+
+
+def run(name, payload, chunks):
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    port = serial.Serial(os.ttyname(slave), 115200)
+    done = threading.Event()
+    reader = threading.Thread(target=drain, args=(master, len(payload), done), daemon=True)
+    reader.start()
+
+    started_at = time.monotonic()
+    for chunk in chunks:
+        port.write(chunk)
+        port.flush()
+
+    done.wait()
+    elapsed = time.monotonic() - started_at
+    print('{0:>10}: {1} bytes in {2:.3f}s, {3:.1f} KiB/s, {4} writes'.format(
+        name, len(payload), elapsed, len(payload) / elapsed / 1024, len(chunks)
+    ))
+
+    port.close()
+    os.close(master)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--size', default=64 * 1024, type=int, help='Payload size in bytes')
+    parser.add_argument('-c', '--chunk', default=4096, type=int, help='Websocket message size in bytes')
+    args = parser.parse_args()
+
+    payload = (b'echo the quick brown fox jumps over the lazy dog\n' * (args.size // 50 + 1))[:args.size]
+    run('per-byte', payload, [payload[i:i + 1] for i in range(len(payload))])
+    run('batched', payload, [payload[i:i + args.chunk] for i in range(0, len(payload), args.chunk)])
+
+
+if __name__ == '__main__':
+    main()
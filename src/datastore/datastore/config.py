@@ -26,6 +26,8 @@
 #####################################################################
 
 import re
+import copy
+import threading
 from datastore import DatastoreException
 
 
@@ -58,10 +60,7 @@ class ConfigNode(object):
         return result
 
     def __getstate__(self):
-        if not self.has_children:
-            return self.value
-
-        return {k: self[k].__getstate__() for k in self.children}
+        return self.root.get_tree(self.path)
 
     def __getitem__(self, item):
         return ConfigNode(self.path + '.' + item, self.root)
@@ -90,8 +89,23 @@ class ConfigNode(object):
 
 
 class ConfigStore(object):
-    def __init__(self, datastore):
+    """
+    Access to the `config` collection. With `cache` enabled, values read by
+    `get` and subtrees read by `get_tree` are kept in memory until a write
+    through this instance or an explicit `invalidate` call (e.g. from a
+    `config.changed` event handler) drops them. Processes writing through
+    a ConfigStore of their own are expected to announce their changes with
+    that event (see `add_listener`), otherwise caches keep the old values.
+    """
+    def __init__(self, datastore, cache=False):
         self.__datastore = datastore
+        self.__cache_enabled = cache
+        self.__cache_lock = threading.RLock()
+        self.__generation = 0
+        self.__values = {}
+        self.__trees = {}
+        self.__listeners = []
+        self.__stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
         if not self.__datastore.collection_exists('config'):
             raise DatastoreException("'config' collection doesn't exist")
 
@@ -99,15 +113,96 @@ class ConfigStore(object):
     def create(datastore):
         datastore.collection_create('config', 'ltree', 'config')
 
+    @property
+    def stats(self):
+        with self.__cache_lock:
+            return dict(self.__stats, size=len(self.__values) + len(self.__trees))
+
+    def add_listener(self, callback):
+        self.__listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.__listeners.remove(callback)
+
+    def invalidate(self, keys=None):
+        with self.__cache_lock:
+            self.__stats['invalidations'] += 1
+            self.__generation += 1
+            if keys is None:
+                self.__values.clear()
+                self.__trees.clear()
+                return
+
+            for key in keys:
+                self.__values.pop(key, None)
+                for root in list(self.__trees):
+                    if root == key or key.startswith(root + '.') or root.startswith(key + '.'):
+                        del self.__trees[root]
+
+    def __cached(self, cache, key):
+        if not self.__cache_enabled:
+            return False, None
+
+        with self.__cache_lock:
+            if key in cache:
+                self.__stats['hits'] += 1
+                return True, cache[key]
+
+            self.__stats['misses'] += 1
+            return False, None
+
+    def __store(self, cache, key, value, generation):
+        if self.__cache_enabled:
+            with self.__cache_lock:
+                # Something was invalidated while the value was being fetched, it may be outdated already
+                if generation == self.__generation:
+                    cache[key] = value
+
     def exists(self, key):
         return self.__datastore.exists('config', ('id', '=', key))
 
     def get(self, key, default=None):
-        ret = self.__datastore.get_one('config', ('id', '=', key))
-        return ret['value'] if ret is not None else default
+        generation = self.__generation
+        hit, ret = self.__cached(self.__values, key)
+        if not hit:
+            ret = self.__datastore.get_one('config', ('id', '=', key))
+            self.__store(self.__values, key, ret, generation)
+
+        return copy.deepcopy(ret['value']) if ret is not None else default
+
+    def get_tree(self, root):
+        """
+        Returns the subtree under `root` as nested dicts, fetched with a single
+        query. A key with no children evaluates to its value.
+        """
+        generation = self.__generation
+        hit, tree = self.__cached(self.__trees, root)
+        if not hit:
+            tree = {}
+            for item in self.__datastore.query('config', ('id', '~', '^' + re.escape(root) + '\\.'), wrap=False):
+                *path, name = item['id'][len(root) + 1:].split('.')
+                node = tree
+                for i in path:
+                    if not isinstance(node.get(i), dict):
+                        node[i] = {}
+
+                    node = node[i]
+
+                if not isinstance(node.get(name), dict):
+                    node[name] = item['value']
+
+            self.__store(self.__trees, root, tree, generation)
+
+        if not tree:
+            return self.get(root)
+
+        return copy.deepcopy(tree)
 
     def set(self, key, value):
         self.__datastore.upsert('config', key, value, config=True)
+        self.invalidate([key])
+        for callback in self.__listeners:
+            callback([key])
 
     def list_children(self, key=None):
         if key is None:
@@ -480,11 +480,82 @@ class MongodbDatastore(object):
     def upsert(self, collection, pkey, obj, config=False):
         return self.update(collection, pkey, obj, upsert=True, config=config)
 
+    def _bulk_documents(self, collection, objs):
+        pkey_type = self.collection_get_pkey_type(collection)
+        result = {}
+        for obj in objs:
+            obj = copy.deepcopy(obj)
+            if 'id' not in obj:
+                raise DatastoreException('Bulk operations require objects with explicit id')
+
+            pkey = obj.pop('id')
+            if pkey_type == 'uuid':
+                pkey = pkey.lower()
+
+            result[pkey] = obj
+
+        return result
+
+    @auto_retry
+    def insert_many(self, collection, objs, timestamp=True):
+        docs = self._bulk_documents(collection, objs)
+        if not docs:
+            return []
+
+        t = datetime.utcnow()
+        for pkey, obj in docs.items():
+            obj['_id'] = pkey
+            if timestamp:
+                obj['updated_at'] = t
+                obj['created_at'] = t
+
+        try:
+            db = self._get_db(collection)
+            db.insert_many(list(docs.values()), ordered=False)
+        except pymongo.errors.BulkWriteError as err:
+            if any(e.get('code') == 11000 for e in err.details.get('writeErrors', [])):
+                raise DuplicateKeyException('Document with given key already exists')
+
+            raise DatastoreException('Bulk insert failed: {0}'.format(err.details))
+
+        return list(docs.keys())
+
+    @auto_retry
+    def update_many(self, collection, objs, upsert=False, timestamp=True):
+        docs = self._bulk_documents(collection, objs)
+        if not docs:
+            return
+
+        db = self._get_db(collection)
+        if timestamp:
+            t = datetime.utcnow()
+            created = {
+                i['_id']: i.get('created_at')
+                for i in db.find({'_id': {'$in': list(docs.keys())}}, {'created_at': True})
+            }
+
+            for pkey, obj in docs.items():
+                obj['updated_at'] = t
+                obj['created_at'] = created.get(pkey) or t
+
+        try:
+            db.bulk_write(
+                [pymongo.ReplaceOne({'_id': pkey}, obj, upsert=upsert) for pkey, obj in docs.items()],
+                ordered=False
+            )
+        except pymongo.errors.BulkWriteError as err:
+            raise DatastoreException('Bulk update failed: {0}'.format(err.details))
+
     @auto_retry
     def delete(self, collection, pkey):
         db = self._get_db(collection)
         db.delete_one({'_id': pkey})
 
+    @auto_retry
+    def delete_many(self, collection, pkeys):
+        db = self._get_db(collection)
+        db.delete_many({'_id': {'$in': list(pkeys)}})
+
     def lock(self):
         self.conn_db.fsync(lock=True)
 
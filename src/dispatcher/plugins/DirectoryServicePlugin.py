@@ -255,7 +255,10 @@ def _init(dispatcher, plugin):
             },
             'cache_ttl': {'type': 'integer'},
             'cache_enumerations': {'type': 'boolean'},
-            'cache_lookups': {'type': 'boolean'}
+            'cache_lookups': {'type': 'boolean'},
+            'cache_size': {'type': 'integer'},
+            'negative_cache_ttl': {'type': 'integer'},
+            'enumeration_ttl': {'type': 'integer'}
         }
     })
 
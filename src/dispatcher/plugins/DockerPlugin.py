@@ -1924,6 +1924,15 @@ def normalize_image_name(name):
     return name
 
 
+def diff_by_id(current, old):
+    current = {o['id']: o for o in current}
+    old = {o['id']: exclude(o, 'created_at', 'updated_at') for o in old}
+    created = [o for k, o in current.items() if k not in old]
+    updated = [o for k, o in current.items() if k in old and o != old[k]]
+    deleted = [k for k in old if k not in current]
+    return created, updated, deleted
+
+
 def refresh_database_cache(dispatcher, collection, event, query, lock, host_id=None):
     filter = []
     if host_id:
@@ -1933,40 +1942,26 @@ def refresh_database_cache(dispatcher, collection, event, query, lock, host_id=N
         filter.append(('host', 'in', active_hosts))
 
     with lock:
-        current = list(dispatcher.call_sync(query, filter))
+        current = [exclude(o, 'running', 'health') for o in dispatcher.call_sync(query, filter)]
         old = dispatcher.datastore_log.query(collection, *filter)
-        created = []
-        updated = []
-        deleted = []
-        for obj in map(lambda o: exclude(o, 'running', 'health'), current):
-            old_obj = first_or_default(lambda o: o['id'] == obj['id'], old)
-            if old_obj:
-                if obj != old_obj:
-                    dispatcher.datastore_log.update(collection, obj['id'], obj)
-                    updated.append(obj['id'])
-
-            else:
-                dispatcher.datastore_log.insert(collection, obj)
-                created.append(obj['id'])
-
-        for obj in old:
-            if not first_or_default(lambda o: o['id'] == obj['id'], current):
-                dispatcher.datastore_log.delete(collection, obj['id'])
-                deleted.append(obj['id'])
+        created, updated, deleted = diff_by_id(current, old)
 
         if created:
+            dispatcher.datastore_log.insert_many(collection, created)
             dispatcher.dispatch_event(event, {
                 'operation': 'create',
-                'ids': created
+                'ids': [o['id'] for o in created]
             })
 
         if updated:
+            dispatcher.datastore_log.update_many(collection, updated)
             dispatcher.dispatch_event(event, {
                 'operation': 'update',
-                'ids': updated
+                'ids': [o['id'] for o in updated]
             })
 
         if deleted:
+            dispatcher.datastore_log.delete_many(collection, deleted)
             dispatcher.dispatch_event(event, {
                 'operation': 'delete',
                 'ids': deleted
@@ -1993,14 +1988,32 @@ def sync_images(dispatcher, ids=None, host_id=None):
     if host_id:
         filter.append(('hosts', 'contains', host_id))
 
-    objects = list(dispatcher.call_sync(IMAGES_QUERY, filter))
-    images.update(**{i['id']: i for i in objects})
+    objects = {i['id']: i for i in dispatcher.call_sync(IMAGES_QUERY, filter)}
+    cached = dict(images.itervalid())
+    changed = {k: v for k, v in objects.items() if cached.get(k) != v}
+    nonexistent_ids = []
+
     if not ids:
-        nonexistent_ids = []
-        for k, v in images.itervalid():
-            if not first_or_default(lambda o: o['id'] == k, objects):
+        for k, v in cached.items():
+            if k in objects:
+                continue
+
+            if not host_id:
                 nonexistent_ids.append(k)
+                continue
+
+            # Image went away from this host only - keep it if other hosts still have it
+            if host_id in v['hosts']:
+                hosts = [h for h in v['hosts'] if h != host_id]
+                if hosts:
+                    changed[k] = dict(v, hosts=hosts)
+                else:
+                    nonexistent_ids.append(k)
+
+    if changed:
+        images.update(**changed)
 
+    if nonexistent_ids:
         images.remove_many(nonexistent_ids)
 
 
@@ -43,8 +43,7 @@ from freenas.utils import query as q
 from lxml import etree
 from bsd import sysctl
 from freenas.dispatcher.rpc import RpcException, description, accepts, SchemaHelper as h
-from datastore import get_datastore
-from datastore.config import ConfigStore, ConfigNode
+from datastore.config import ConfigNode
 from task import (
     Task,
     ProgressTask,
@@ -1247,8 +1246,6 @@ class ServiceMigrateTask(Task):
     def __init__(self, dispatcher):
         super(ServiceMigrateTask, self).__init__(dispatcher)
         self._notifier = notifier()
-        self.ds = get_datastore()
-        self.cs = ConfigStore(self.ds)
 
     @classmethod
     def early_describe(cls):
@@ -1429,7 +1426,7 @@ class ServiceMigrateTask(Task):
         # Migrating SSHD service
         fn9_sshd = get_table('select * from services_ssh', dictionary=False)[0]
         try:
-            sshd_node = ConfigNode('service.sshd', self.cs)
+            sshd_node = ConfigNode('service.sshd', self.configstore)
             for keytype in ('rsa', 'dsa', 'ecdsa', 'ed25519'):
                 pubkey = fn9_sshd['ssh_host_{0}_key'.format(keytype)]
                 privkey = fn9_sshd['ssh_host_{0}_key_pub'.format(keytype)]
@@ -34,6 +34,8 @@ import copy
 import gevent
 import socket
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from cache import CacheStore
 from resources import Resource
 from datetime import datetime, timedelta
@@ -46,6 +48,7 @@ from freenas.utils import first_or_default, query as q, normalize, human_readabl
 from freenas.utils.decorators import throttle
 
 logger = logging.getLogger(__name__)
+ESTIMATE_CONCURRENCY = 8
 
 link_cache = None
 current_state_cache = None
@@ -72,6 +75,163 @@ class ReplicationAction(object):
         return d
 
 
+class ReplicationDeltaPlanner(object):
+    """
+    Computes replication actions for a (possibly recursive) dataset pair.
+
+    The remote snapshot list is indexed by dataset once, and each dataset's
+    remote snapshots by (snapshot_name, created_at), so planning is linear in
+    the number of local and remote snapshots.
+    """
+    def __init__(self, localds, remoteds, snapshots_list, followdelete=False, intermediate=False):
+        self.localds = localds
+        self.remoteds = remoteds
+        self.followdelete = followdelete
+        self.intermediate = intermediate
+        self.remote_datasets = {}
+        self.remote_snapshots = {}
+
+        for i in snapshots_list:
+            name, _, snapshot_name = i['name'].partition('@')
+            i['snapshot_name'] = snapshot_name or None
+            if snapshot_name:
+                self.remote_snapshots.setdefault(name, []).append(i)
+            else:
+                self.remote_datasets[name] = i
+
+    @staticmethod
+    def convert_snapshot(snap):
+        return {
+            'name': snap['name'],
+            'snapshot_name': snap['snapshot_name'],
+            'created_at': int(q.get(snap, 'properties.creation.rawvalue')),
+            'txg': int(q.get(snap, 'properties.createtxg.rawvalue')),
+            'uuid': q.get(snap, 'properties.org\\.freenas:uuid.value')
+        }
+
+    def remote_name(self, localfs):
+        return localfs.replace(self.localds, self.remoteds, 1)
+
+    def resume_token(self, localfs):
+        remote_ds = self.remote_datasets.get(self.remote_name(localfs))
+        return remote_ds.get('resume_token') if remote_ds else None
+
+    def send_actions(self, localfs, remotefs, snapshots, anchor=None):
+        if self.intermediate and snapshots:
+            if anchor is None:
+                yield ReplicationAction(
+                    ReplicationActionType.SEND_STREAM,
+                    localfs,
+                    remotefs,
+                    incremental=False,
+                    anchor=None,
+                    snapshot=snapshots[0]['snapshot_name']
+                )
+                anchor = snapshots[0]['snapshot_name']
+                snapshots = snapshots[1:]
+
+            if snapshots:
+                # Single stream carrying every snapshot after the anchor
+                yield ReplicationAction(
+                    ReplicationActionType.SEND_STREAM,
+                    localfs,
+                    remotefs,
+                    incremental=True,
+                    intermediate=len(snapshots) > 1,
+                    anchor=anchor,
+                    snapshot=snapshots[-1]['snapshot_name']
+                )
+
+            return
+
+        for snap in snapshots:
+            yield ReplicationAction(
+                ReplicationActionType.SEND_STREAM,
+                localfs,
+                remotefs,
+                incremental=anchor is not None,
+                anchor=anchor,
+                snapshot=snap['snapshot_name']
+            )
+            anchor = snap['snapshot_name']
+
+    def plan_dataset(self, localfs, local_snapshots, token_info=None):
+        remotefs = self.remote_name(localfs)
+        local_snapshots = sorted(map(self.convert_snapshot, local_snapshots), key=lambda x: x['txg'])
+        remote_snapshots = self.remote_snapshots.get(remotefs, [])
+        remote_ds = self.remote_datasets.get(remotefs)
+        actions = []
+        found = None
+
+        if token_info:
+            # There's unfinished replication
+            actions.append(ReplicationAction(
+                ReplicationActionType.SEND_STREAM,
+                localfs,
+                remotefs,
+                resume=True,
+                incremental=False,
+                token=remote_ds.get('resume_token'),
+                bytes=token_info['bytes'],
+                snapshot=token_info['toname'].split('@')[-1]
+            ))
+
+            found = first_or_default(lambda s: s['name'] == token_info['toname'], local_snapshots)
+
+        if not remote_snapshots and not found:
+            logger.info('New dataset {0} -> {1}'.format(localfs, remotefs))
+            actions.extend(self.send_actions(localfs, remotefs, local_snapshots))
+            return actions
+
+        if not found:
+            # Find out the last common snapshot
+            remote_keys = {(s['snapshot_name'], s['created_at']) for s in remote_snapshots}
+            common = [s for s in local_snapshots if (s['snapshot_name'], s['created_at']) in remote_keys]
+            if common:
+                found = max(common, key=lambda s: s['created_at'])
+
+        if not found:
+            actions.append(ReplicationAction(
+                ReplicationActionType.CLEAR_SNAPSHOTS,
+                localfs,
+                remotefs,
+                snapshots=[snap['snapshot_name'] for snap in remote_snapshots]
+            ))
+            actions.extend(self.send_actions(localfs, remotefs, local_snapshots))
+            return actions
+
+        if self.followdelete:
+            local_names = {s['snapshot_name'] for s in local_snapshots}
+            delete = [s['snapshot_name'] for s in remote_snapshots if s['snapshot_name'] not in local_names]
+            if delete:
+                actions.append(ReplicationAction(
+                    ReplicationActionType.DELETE_SNAPSHOTS,
+                    localfs,
+                    remotefs,
+                    snapshots=delete
+                ))
+
+        index = next(i for i, s in enumerate(local_snapshots) if s is found)
+        actions.extend(self.send_actions(
+            localfs,
+            remotefs,
+            local_snapshots[index + 1:],
+            anchor=found['snapshot_name']
+        ))
+        return actions
+
+    def plan_deletions(self, datasets):
+        datasets = set(datasets)
+        for remotefs in self.remote_datasets:
+            localfs = remotefs.replace(self.remoteds, self.localds, 1)
+            if localfs not in datasets:
+                yield ReplicationAction(
+                    ReplicationActionType.DELETE_DATASET,
+                    localfs,
+                    remotefs
+                )
+
+
 @description('Provides information about replication tasks')
 class ReplicationLinkProvider(Provider):
     @query('Replication')
@@ -408,6 +568,8 @@ class ReplicationCreateTask(ReplicationBaseTask):
                 'transport_options': [],
                 'snapshot_lifetime': 365 * 24 * 60 * 60,
                 'followdelete': False,
+                'intermediate_snapshots': False,
+                'parallel_streams': 1,
                 'status': []
             }
         )
@@ -939,7 +1101,9 @@ class ReplicationSyncTask(ReplicationBaseTask):
                                 'recursive': link['recursive'],
                                 'nomount': True,
                                 'lifetime': link['snapshot_lifetime'],
-                                'followdelete': link['followdelete']
+                                'followdelete': link['followdelete'],
+                                'intermediate_snapshots': link.get('intermediate_snapshots', False),
+                                'parallel_streams': link.get('parallel_streams', 1)
                             },
                             link['transport_options'],
                             progress_callback=lambda p, m, e=None: report_progress(p, m, e)
@@ -1133,45 +1297,21 @@ class CalculateReplicationDeltaTask(Task):
     def early_describe(cls):
         return "Calculating replication delta"
 
-    def describe(self, localds, remoteds, snapshots, recursive=False, followdelete=False):
+    def describe(self, localds, remoteds, snapshots, recursive=False, followdelete=False, intermediate=False):
         return TaskDescription(
             "Calculating replication delta between the {name} and the {remoteds}",
             name=localds,
             remoteds=remoteds
         )
 
-    def verify(self, localds, remoteds, snapshots, recursive=False, followdelete=False):
+    def verify(self, localds, remoteds, snapshots, recursive=False, followdelete=False, intermediate=False):
         return ['zfs:{0}'.format(localds)]
 
-    def run(self, localds, remoteds, snapshots_list, recursive=False, followdelete=False):
+    def run(self, localds, remoteds, snapshots_list, recursive=False, followdelete=False, intermediate=False):
         datasets = [localds]
-        remote_datasets = list(filter(lambda s: '@' not in s['name'], snapshots_list))
+        planner = ReplicationDeltaPlanner(localds, remoteds, snapshots_list, followdelete, intermediate)
         actions = []
 
-        def matches(src, tgt):
-            return src['snapshot_name'] == tgt['snapshot_name'] and src['created_at'] == tgt['created_at']
-
-        def match_snapshots(local, remote):
-            for i in local:
-                match = first_or_default(lambda s: matches(i, s), remote)
-                if match:
-                    yield i, match
-
-        def convert_snapshot(snap):
-            return {
-                'name': snap['name'],
-                'snapshot_name': snap['snapshot_name'],
-                'created_at': int(q.get(snap, 'properties.creation.rawvalue')),
-                'txg': int(q.get(snap, 'properties.createtxg.rawvalue')),
-                'uuid': q.get(snap, 'properties.org\\.freenas:uuid.value')
-            }
-
-        def extend_with_snapshot_name(snap):
-            snap['snapshot_name'] = snap['name'].split('@')[-1] if '@' in snap['name'] else None
-
-        for i in snapshots_list:
-            extend_with_snapshot_name(i)
-
         if recursive:
             datasets = list(self.dispatcher.call_sync(
                 'zfs.dataset.query',
@@ -1179,140 +1319,70 @@ class CalculateReplicationDeltaTask(Task):
                 {'select': 'name'}
             ))
 
-        for ds in datasets:
-            localfs = ds
-            remotefs = localfs.replace(localds, remoteds, 1)
+        for localfs in datasets:
+            local_snapshots = self.dispatcher.call_sync('zfs.dataset.get_snapshots', localfs)
+            token = planner.resume_token(localfs)
+            token_info = self.dispatcher.call_sync('zfs.dataset.describe_resume_token', token) if token else None
+            actions.extend(planner.plan_dataset(localfs, local_snapshots, token_info))
 
-            local_snapshots = sorted(
-                list(map(
-                    convert_snapshot,
-                    self.dispatcher.call_sync('zfs.dataset.get_snapshots', localfs)
-                )),
-                key=lambda x: x['txg']
-            )
-
-            remote_snapshots = q.query(
-                snapshots_list,
-                ('name', '~', '^{0}@'.format(remotefs))
-            )
+        actions.extend(planner.plan_deletions(datasets))
 
-            remote_ds = first_or_default(lambda s: s['name'] == remotefs, snapshots_list)
-            snapshots = local_snapshots[:]
-            found = None
+        def estimate(action):
+            if getattr(action, 'resume', False):
+                return action.bytes
 
-            if remote_ds and remote_ds.get('resume_token'):
-                # There's unfinished replication
-                token_info = self.dispatcher.call_sync(
-                    'zfs.dataset.describe_resume_token',
-                    remote_ds.get('resume_token')
-                )
-
-                actions.append(ReplicationAction(
-                    ReplicationActionType.SEND_STREAM,
-                    localfs,
-                    remotefs,
-                    resume=True,
-                    incremental=False,
-                    token=remote_ds.get('resume_token'),
-                    bytes=token_info['bytes'],
-                    snapshot=token_info['toname'].split('@')[-1]
-                ))
+            return self.dispatcher.call_sync(
+                'zfs.dataset.estimate_send_size',
+                action.localfs,
+                action.snapshot,
+                getattr(action, 'anchor', None)
+            )
 
-                found = first_or_default(lambda s: s['name'] == token_info['toname'], local_snapshots)
-
-            if remote_snapshots or found:
-                # Find out the last common snapshot.
-                if not found:
-                    pairs = list(match_snapshots(local_snapshots, remote_snapshots))
-                    if pairs:
-                        pairs.sort(key=lambda p: p[0]['created_at'], reverse=True)
-                        found, _ = first_or_default(None, pairs)
-
-                if found:
-                    if followdelete:
-                        delete = []
-                        for snap in remote_snapshots:
-                            rsnap = snap['snapshot_name']
-                            if not first_or_default(lambda s: s['snapshot_name'] == rsnap, local_snapshots):
-                                delete.append(rsnap)
-
-                        if delete:
-                            actions.append(ReplicationAction(
-                                ReplicationActionType.DELETE_SNAPSHOTS,
-                                localfs,
-                                remotefs,
-                                snapshots=delete
-                            ))
+        sends = [a for a in actions if a.type == ReplicationActionType.SEND_STREAM]
+        with ThreadPoolExecutor(max_workers=ESTIMATE_CONCURRENCY) as executor:
+            for action, size in zip(sends, executor.map(estimate, sends)):
+                action.send_size = size
 
-                    index = local_snapshots.index(found)
-
-                    for idx in range(index + 1, len(local_snapshots)):
-                        actions.append(ReplicationAction(
-                            ReplicationActionType.SEND_STREAM,
-                            localfs,
-                            remotefs,
-                            incremental=True,
-                            anchor=local_snapshots[idx - 1]['snapshot_name'],
-                            snapshot=local_snapshots[idx]['snapshot_name']
-                        ))
-                else:
-                    actions.append(ReplicationAction(
-                        ReplicationActionType.CLEAR_SNAPSHOTS,
-                        localfs,
-                        remotefs,
-                        snapshots=[snap['snapshot_name'] for snap in remote_snapshots]
-                    ))
+        return actions, sum(a.send_size for a in sends)
 
-                    for idx in range(0, len(snapshots)):
-                        actions.append(ReplicationAction(
-                            ReplicationActionType.SEND_STREAM,
-                            localfs,
-                            remotefs,
-                            incremental=idx > 0,
-                            anchor=snapshots[idx - 1]['snapshot_name'] if idx > 0 else None,
-                            snapshot=snapshots[idx]['snapshot_name']
-                        ))
-            else:
-                logger.info('New dataset {0} -> {1}'.format(localfs, remotefs))
-                for idx in range(0, len(snapshots)):
-                    actions.append(ReplicationAction(
-                        ReplicationActionType.SEND_STREAM,
-                        localfs,
-                        remotefs,
-                        incremental=idx > 0,
-                        anchor=snapshots[idx - 1]['snapshot_name'] if idx > 0 else None,
-                        snapshot=snapshots[idx]['snapshot_name']
-                    ))
 
-        for rds in remote_datasets:
-            remotefs = rds['name']
-            localfs = remotefs.replace(remoteds, localds, 1)
+def run_dataset_groups(groups, concurrency, fn):
+    """
+    Runs fn(actions) for every dataset in `groups`, at most `concurrency` at a
+    time. A dataset is started only after its closest ancestor in `groups`
+    has finished, since the remote side needs the parent to receive into.
+    """
+    finished = {ds: threading.Event() for ds in groups}
+    errors = []
 
-            if localfs not in datasets:
-                actions.append(ReplicationAction(
-                    ReplicationActionType.DELETE_DATASET,
-                    localfs,
-                    remotefs
-                ))
+    def parent_of(ds):
+        parent = ds.rpartition('/')[0]
+        while parent and parent not in groups:
+            parent = parent.rpartition('/')[0]
 
-        total_send_size = 0
+        return parent or None
 
-        for action in actions:
-            if action.type == ReplicationActionType.SEND_STREAM:
-                if getattr(action, 'resume', False):
-                    size = action.bytes
-                else:
-                    size = self.dispatcher.call_sync(
-                        'zfs.dataset.estimate_send_size',
-                        action.localfs,
-                        action.snapshot,
-                        getattr(action, 'anchor', None)
-                    )
+    def worker(ds):
+        try:
+            parent = parent_of(ds)
+            if parent:
+                finished[parent].wait()
+
+            if not errors:
+                fn(groups[ds])
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            finished[ds].set()
 
-                action.send_size = size
-                total_send_size += size
+    # Parents sort before their children, so workers only ever wait for
+    # datasets submitted earlier and the pool cannot deadlock
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for ds in sorted(groups):
+            executor.submit(worker, ds)
 
-        return actions, total_send_size
+    if errors:
+        raise errors[0]
 
 
 @accepts(str, h.ref('ReplicationOptions'), h.one_of(None, h.array(h.ref('ReplicationTransportOption'))), bool)
@@ -1320,8 +1390,8 @@ class CalculateReplicationDeltaTask(Task):
 class ReplicateDatasetTask(ProgressTask):
     def __init__(self, dispatcher):
         super(ReplicateDatasetTask, self).__init__(dispatcher)
-        self.rd_fd = None
-        self.wr_fd = None
+        self.fds = set()
+        self.fds_lock = threading.RLock()
         self.aborted = False
 
     @classmethod
@@ -1343,6 +1413,8 @@ class ReplicateDatasetTask(ProgressTask):
         force = options.get('force', True)
         peer = options.get('peer')
         nomount = options.get('nomount', False)
+        intermediate = options.get('intermediate_snapshots', False)
+        parallel_streams = options.get('parallel_streams') or 1
 
         self.run_subtask_sync(
             'volume.snapshot_dataset',
@@ -1423,34 +1495,56 @@ class ReplicateDatasetTask(ProgressTask):
             remoteds,
             remote_data,
             recursive,
-            followdelete
+            followdelete,
+            intermediate
         )
 
         if dry_run:
             return actions, send_size
 
         # 2nd pass - actual send
-        progress = 0
+        progress_lock = threading.Lock()
+        streams = {}
+        transferred = {}
         done = 0
+        completed = 0
+        last_message = None
         actions_len = len(actions)
 
-        for idx, action in enumerate(actions):
-            def get_progress(delta=None):
-                nonlocal progress, done, idx
-                if delta:
-                    done += delta
+        def report(key=None, message=None, speed=None, nbytes=None, finished=False):
+            nonlocal done, completed, last_message
+            with progress_lock:
+                if finished:
+                    completed += 1
+                    streams.pop(key, None)
+                    sent = transferred.pop(key, 0)
+                    done += nbytes or sent
+                elif key:
+                    streams[key] = (message, speed)
+                    transferred[key] = nbytes or 0
+
+                sent = done + sum(transferred.values())
+                progress = min(100, max(
+                    (completed / (actions_len or 1)) * 100,
+                    (sent / (send_size or 1)) * 100 if send_size else 0
+                ))
 
-                progress = ((idx / actions_len) * 100) + ((1 / actions_len) * 100 * (done / (send_size or 1)))
-                if progress > 100:
-                    progress = 100
+                if streams:
+                    message = '; '.join(
+                        '{0} - speed {1}'.format(m, human_readable_bytes(s or 0, '/s'))
+                        for m, s in streams.values()
+                    )
 
-                return progress
+                last_message = message or last_message
+                self.set_progress(progress, last_message, extra=sum(s or 0 for _, s in streams.values()))
 
+        def run_action(action):
+            stream_size = None
             if self.aborted:
-                break
+                return
 
             if action['type'] in (ReplicationActionType.DELETE_SNAPSHOTS.name, ReplicationActionType.CLEAR_SNAPSHOTS.name):
-                self.set_progress(get_progress(), 'Removing snapshots on remote dataset {0}'.format(action['remotefs']))
+                report(message='Removing snapshots on remote dataset {0}'.format(action['remotefs']))
                 # Remove snapshots on remote side
                 result = remote_client.call_task_sync(
                     'zfs.delete_multiple_snapshots',
@@ -1464,29 +1558,37 @@ class ReplicateDatasetTask(ProgressTask):
                     ))
 
             if action['type'] == ReplicationActionType.SEND_STREAM.name:
-                self.rd_fd, self.wr_fd = os.pipe()
+                rd_fd, wr_fd = os.pipe()
+                with self.fds_lock:
+                    self.fds.update((rd_fd, wr_fd))
+
                 fromsnap = action['anchor'] if 'anchor' in action else None
+                key = (action['localfs'], action['snapshot'])
+                stream_size = action.get('send_size') or send_size or 1
 
-                if action.get('resume'):
-                    send_task = self.run_subtask(
-                        'zfs.send_resume',
-                        action['token'],
-                        FileDescriptor(self.wr_fd)
-                    )
-                else:
-                    send_task = self.run_subtask(
-                        'zfs.send',
-                        action['localfs'],
-                        fromsnap,
-                        action['snapshot'],
-                        FileDescriptor(self.wr_fd)
-                    )
+                try:
+                    # Subtasks get their own copies of the pipe ends; ours are closed as soon as
+                    # each one is handed over, otherwise the reading side would never see EOF
+                    if action.get('resume'):
+                        send_task = self.run_subtask(
+                            'zfs.send_resume',
+                            action['token'],
+                            FileDescriptor(wr_fd, close=False)
+                        )
+                    else:
+                        send_task = self.run_subtask(
+                            'zfs.send',
+                            action['localfs'],
+                            fromsnap,
+                            action['snapshot'],
+                            FileDescriptor(wr_fd, close=False),
+                            action.get('intermediate', False)
+                        )
 
-                self.join_subtasks(
-                    send_task,
-                    self.run_subtask(
+                    self.close_fd(wr_fd)
+                    recv_task = self.run_subtask(
                         'replication.transport.send',
-                        FileDescriptor(self.rd_fd),
+                        FileDescriptor(rd_fd, close=False),
                         {
                             'client_address': remote,
                             'transport_plugins': transport_plugins,
@@ -1496,24 +1598,28 @@ class ReplicateDatasetTask(ProgressTask):
                                 'nomount': nomount,
                                 'props': {'mountpoint': None}
                             },
-                            'estimated_size': send_size or 1
+                            'estimated_size': stream_size
                         },
-                        progress_callback=lambda p, m, e=None: self.set_progress(
-                            get_progress(e),
-                            'Sending {0} stream of snapshot {1}@{2} - {3}% - speed {4}'.format(
+                        progress_callback=lambda p, m, e=None: report(
+                            key,
+                            'Sending {0} stream of snapshot {1}@{2} - {3}%'.format(
                                 'incremental' if action['incremental'] else 'full',
                                 action['localfs'],
                                 action['snapshot'],
-                                int(p),
-                                human_readable_bytes(e, '/s')
+                                int(p)
                             ),
-                            extra=e
+                            e,
+                            int(stream_size * min(p, 100) / 100)
                         )
                     )
-                )
+                    self.close_fd(rd_fd)
+                    self.join_subtasks(send_task, recv_task)
+                finally:
+                    self.close_fd(rd_fd)
+                    self.close_fd(wr_fd)
 
             if action['type'] == ReplicationActionType.DELETE_DATASET.name:
-                self.set_progress(get_progress(), 'Removing remote dataset {0}'.format(action['remotefs']))
+                report(message='Removing remote dataset {0}'.format(action['remotefs']))
                 result = remote_client.call_task_sync(
                     'zfs.destroy',
                     action['remotefs']
@@ -1525,6 +1631,21 @@ class ReplicateDatasetTask(ProgressTask):
                         result['error']['message']
                     ))
 
+            report(key=(action['localfs'], action.get('snapshot')), nbytes=stream_size, finished=True)
+
+        # Actions for a single dataset have to run in order, but datasets are
+        # independent of each other once their parent exists on the remote side
+        groups = {}
+        for action in actions:
+            if action['type'] != ReplicationActionType.DELETE_DATASET.name:
+                groups.setdefault(action['localfs'], []).append(action)
+
+        run_dataset_groups(groups, parallel_streams, lambda group: [run_action(a) for a in group])
+
+        for action in actions:
+            if action['type'] == ReplicationActionType.DELETE_DATASET.name:
+                run_action(action)
+
         remote_client.disconnect()
 
         subtasks = []
@@ -1536,10 +1657,21 @@ class ReplicateDatasetTask(ProgressTask):
 
         return actions, send_size
 
+    def close_fd(self, fd):
+        # Closes a pipe end only while it is still ours, so a descriptor number
+        # reused by another stream in the meantime is never touched
+        with self.fds_lock:
+            if fd in self.fds:
+                self.fds.discard(fd)
+                os.close(fd)
+
     def abort(self):
         self.aborted = True
-        self.rd_fd.close()
-        self.wr_fd.close()
+        with self.fds_lock:
+            for fd in list(self.fds):
+                self.close_fd(fd)
+
+        self.abort_subtasks()
 
 
 @private
@@ -1814,7 +1946,9 @@ def _init(dispatcher, plugin):
             'lifetime': {'type': ['number', 'null']},
             'recursive': {'type': 'boolean'},
             'force': {'type': 'boolean'},
-            'nomount': {'type': 'boolean'}
+            'nomount': {'type': 'boolean'},
+            'intermediate_snapshots': {'type': 'boolean'},
+            'parallel_streams': {'type': ['integer', 'null'], 'minimum': 1}
         },
         'additionalProperties': False,
     })
@@ -1847,7 +1981,9 @@ def _init(dispatcher, plugin):
                 'items': {'$ref': 'ReplicationTransportOption'}
             },
             'snapshot_lifetime': {'type': 'number'},
-            'followdelete': {'type': 'boolean'}
+            'followdelete': {'type': 'boolean'},
+            'intermediate_snapshots': {'type': 'boolean'},
+            'parallel_streams': {'type': 'integer', 'minimum': 1}
         },
         'additionalProperties': False,
     })
@@ -1909,7 +2045,9 @@ def _init(dispatcher, plugin):
         'type': 'object',
         'properties': {
             '%type': {'enum': ['CompressReplicationTransportOption']},
-            'level': {'$ref': 'CompressPluginLevel'}
+            'level': {'$ref': 'CompressPluginLevel'},
+            'codec': {'$ref': 'CompressPluginCodec'},
+            'threads': {'type': ['integer', 'null'], 'minimum': 1}
         },
         'additionalProperties': False
     })
@@ -31,6 +31,9 @@ import os
 import threading
 import time
 import base64
+import struct
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from freenas.dispatcher import AsyncResult
 from freenas.utils import first_or_default, human_readable_bytes
 from freenas.dispatcher.fd import FileDescriptor
@@ -131,10 +134,32 @@ cdef extern from "zlib.h" nogil:
     int inflateEnd(z_stream *strm)
 
 
+cdef extern from "lz4.h" nogil:
+    int LZ4_compressBound(int inputSize)
+    int LZ4_compress_fast(const char *src, char *dst, int srcSize, int dstCapacity, int acceleration)
+    int LZ4_decompress_safe(const char *src, char *dst, int compressedSize, int dstCapacity)
+
+
+cdef extern from "lz4hc.h" nogil:
+    int LZ4_compress_HC(const char *src, char *dst, int srcSize, int dstCapacity, int compressionLevel)
+
+
+cdef extern from "zstd.h" nogil:
+    size_t ZSTD_compressBound(size_t srcSize)
+    size_t ZSTD_compress(void *dst, size_t dstCapacity, const void *src, size_t srcSize, int compressionLevel)
+    size_t ZSTD_decompress(void *dst, size_t dstCapacity, const void *src, size_t compressedSize)
+    unsigned ZSTD_isError(size_t code)
+
+
 #Globals declaration
 cdef uint32_t encrypt_transfer_magic = 0xbadbeef0
 cdef uint32_t encrypt_rekey_magic = 0xbeefd00d
 cdef uint32_t transport_header_magic = 0xdeadbeef
+cdef uint32_t compress_block_magic = 0xb10cc0de
+
+cdef enum:
+    CODEC_LZ4 = 1
+    CODEC_ZSTD = 2
 
 
 logger = logging.getLogger('ReplicationTransportPlugin')
@@ -162,6 +187,27 @@ cipher_types = {
 }
 
 
+# Block codecs compress fixed size blocks independently, so that blocks can be
+# processed by several threads at once. For LZ4 negative levels select the
+# acceleration factor of the fast compressor and positive ones the LZ4HC level.
+compression_codecs = {
+    'LZ4': {
+        'id': CODEC_LZ4,
+        'levels': {'FAST': -8, 'DEFAULT': -1, 'BEST': 9}
+    },
+    'ZSTD': {
+        'id': CODEC_ZSTD,
+        'levels': {'FAST': 1, 'DEFAULT': 3, 'BEST': 19}
+    }
+}
+
+
+block_header = struct.Struct('!III')
+
+
+DEFAULT_COMPRESSION_THREADS = min(4, os.cpu_count() or 1)
+
+
 cdef uint32_t read_fd(int fd, void *buf, uint32_t nbytes, uint32_t curr_pos) nogil:
     cdef int ret
     cdef uint32_t done = 0
@@ -196,6 +242,137 @@ cdef uint32_t write_fd(int fd, void *buf, uint32_t nbytes) nogil:
             return done
 
 
+cdef size_t block_bound(int codec, size_t size) nogil:
+    if codec == CODEC_LZ4:
+        return LZ4_compressBound(size)
+
+    return ZSTD_compressBound(size)
+
+
+cdef size_t compress_buffer(int codec, int level, const char *src, size_t src_size, char *dst, size_t dst_size) nogil:
+    cdef size_t ret
+
+    if codec == CODEC_LZ4:
+        if level > 0:
+            return LZ4_compress_HC(src, dst, src_size, dst_size, level)
+
+        return LZ4_compress_fast(src, dst, src_size, dst_size, -level)
+
+    ret = ZSTD_compress(dst, dst_size, src, src_size, level)
+    if ZSTD_isError(ret):
+        return 0
+
+    return ret
+
+
+cdef size_t decompress_buffer(int codec, const char *src, size_t src_size, char *dst, size_t dst_size) nogil:
+    cdef int lz4_ret
+    cdef size_t ret
+
+    if codec == CODEC_LZ4:
+        lz4_ret = LZ4_decompress_safe(src, dst, src_size, dst_size)
+        if lz4_ret < 0:
+            return 0
+
+        return lz4_ret
+
+    ret = ZSTD_decompress(dst, dst_size, src, src_size)
+    if ZSTD_isError(ret):
+        return 0
+
+    return ret
+
+
+def compress_block(int codec, int level, bytearray data):
+    cdef const char *src = data
+    cdef size_t src_size = len(data)
+    cdef size_t bound = block_bound(codec, src_size)
+    cdef size_t header_size = block_header.size
+    cdef size_t ret
+    cdef char *dst
+
+    out = bytearray(header_size + bound)
+    dst = out
+    with nogil:
+        ret = compress_buffer(codec, level, src, src_size, dst + header_size, bound)
+
+    if ret == 0:
+        raise TaskException(EINVAL, 'Compression of a {0} bytes block failed'.format(src_size))
+
+    if ret >= src_size:
+        # Incompressible data is passed as is, marked by equal sizes in the header
+        return block_header.pack(compress_block_magic, src_size, src_size) + data
+
+    block_header.pack_into(out, 0, compress_block_magic, src_size, ret)
+    return memoryview(out)[:header_size + ret]
+
+
+def decompress_block(int codec, uint32_t raw_size, bytearray payload):
+    cdef const char *src = payload
+    cdef size_t src_size = len(payload)
+    cdef size_t ret
+    cdef char *dst
+
+    if src_size == raw_size:
+        return payload
+
+    out = bytearray(raw_size)
+    dst = out
+    with nogil:
+        ret = decompress_buffer(codec, src, src_size, dst, raw_size)
+
+    if ret != raw_size:
+        raise TaskException(EINVAL, 'Compressed replication stream is corrupted')
+
+    return out
+
+
+def read_block(fd, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    done = 0
+    while done < size:
+        ret = os.readv(fd, [view[done:]])
+        if ret == 0:
+            break
+
+        done += ret
+
+    del view
+    if done < size:
+        del buffer[done:]
+
+    return buffer
+
+
+def write_block(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def run_block_pipeline(read, transform, wr_fd, threads):
+    # Blocks are transformed on a pool of threads and written out in the order
+    # they were read; at most 2 * threads blocks are in flight at any time.
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        try:
+            while True:
+                block = read()
+                if block is None:
+                    break
+
+                pending.append(pool.submit(transform, *block))
+                if len(pending) >= 2 * threads:
+                    write_block(wr_fd, pending.popleft().result())
+
+            while pending:
+                write_block(wr_fd, pending.popleft().result())
+        finally:
+            for f in pending:
+                f.cancel()
+
+
 @description('Provides information about replication transport layer')
 class TransportProvider(Provider):
     def __init__(self):
@@ -802,7 +979,8 @@ class TransportCompressTask(Task):
 
     def describe(self, plugin):
         return TaskDescription(
-            "Compressing replication stream using the {method} method",
+            "Compressing replication stream using the {codec} codec and the {method} method",
+            codec=plugin.get('codec', 'ZLIB'),
             method=plugin.get('level', 'DEFAULT')
         )
 
@@ -832,6 +1010,11 @@ class TransportCompressTask(Task):
         self.fds.append(rd_fd)
         self.fds.append(wr_fd)
 
+        codec = plugin.get('codec', 'ZLIB')
+        if codec != 'ZLIB':
+            self.run_blocks(plugin, codec)
+            return
+
         comp_level = plugin.get('level', 'DEFAULT')
         if comp_level == 'BEST':
             level = Z_BEST_COMPRESSION
@@ -905,6 +1088,27 @@ class TransportCompressTask(Task):
             free(out_buffer)
             close_fds(self.fds)
 
+    def run_blocks(self, plugin, codec):
+        rd_fd = plugin['read_fd'].fd
+        wr_fd = plugin['write_fd'].fd
+        block_size = plugin.get('buffer_size', 1024*1024)
+        codec_id = compression_codecs[codec]['id']
+        level = compression_codecs[codec]['levels'][plugin.get('level', 'DEFAULT')]
+
+        def read():
+            block = read_block(rd_fd, block_size)
+            return (codec_id, level, block) if block else None
+
+        try:
+            run_block_pipeline(read, compress_block, wr_fd, plugin.get('threads') or DEFAULT_COMPRESSION_THREADS)
+        except OSError as err:
+            if not self.aborted:
+                raise TaskException(err.errno, 'Compression task failed: {0}'.format(err.strerror))
+        finally:
+            close_fds(self.fds)
+
+        logger.debug('Compression task finished')
+
     def abort(self):
         self.aborted = True
         close_fds(self.fds)
@@ -949,6 +1153,12 @@ class TransportDecompressTask(Task):
 
         self.fds.append(rd_fd)
         self.fds.append(wr_fd)
+
+        codec = plugin.get('codec', 'ZLIB')
+        if codec != 'ZLIB':
+            self.run_blocks(plugin, codec)
+            return
+
         try:
             with nogil:
                 in_buffer = <unsigned char *>malloc(buffer_size * sizeof(uint8_t))
@@ -1024,6 +1234,35 @@ class TransportDecompressTask(Task):
             free(out_buffer)
             close_fds(self.fds)
 
+    def run_blocks(self, plugin, codec):
+        rd_fd = plugin['read_fd'].fd
+        wr_fd = plugin['write_fd'].fd
+        codec_id = compression_codecs[codec]['id']
+
+        def read():
+            header = read_block(rd_fd, block_header.size)
+            if not header:
+                return None
+
+            if len(header) == block_header.size:
+                magic, raw_size, size = block_header.unpack(header)
+                if magic != compress_block_magic:
+                    raise TaskException(EINVAL, 'Invalid block header in compressed replication stream')
+
+                payload = read_block(rd_fd, size)
+                if len(payload) == size:
+                    return codec_id, raw_size, payload
+
+            raise TaskException(EINVAL, 'Compressed replication stream ended unexpectedly')
+
+        try:
+            run_block_pipeline(read, decompress_block, wr_fd, plugin.get('threads') or DEFAULT_COMPRESSION_THREADS)
+        except OSError as err:
+            if not self.aborted:
+                raise TaskException(err.errno, 'Decompression task failed: {0}'.format(err.strerror))
+        finally:
+            close_fds(self.fds)
+
     def abort(self):
         self.aborted = True
         close_fds(self.fds)
@@ -1686,6 +1925,8 @@ def _init(dispatcher, plugin):
             'read_fd': {'type': 'fd'},
             'write_fd': {'type': 'fd'},
             'level': {'$ref': 'CompressPluginLevel'},
+            'codec': {'$ref': 'CompressPluginCodec'},
+            'threads': {'type': ['integer', 'null'], 'minimum': 1},
             'buffer_size': {'type': 'integer'}
         },
         'additionalProperties': False
@@ -1696,6 +1937,11 @@ def _init(dispatcher, plugin):
         'enum': ['FAST', 'DEFAULT', 'BEST']
     })
 
+    plugin.register_schema_definition('CompressPluginCodec', {
+        'type': 'string',
+        'enum': ['ZLIB', 'LZ4', 'ZSTD']
+    })
+
     plugin.register_schema_definition('EncryptReplicationTransportPlugin', {
         'type': 'object',
         'properties': {
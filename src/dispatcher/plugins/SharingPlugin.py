@@ -27,15 +27,113 @@
 
 import os
 import errno
+import bisect
+from gevent.lock import RLock
 from freenas.dispatcher.rpc import description, accepts, returns, private
 from freenas.dispatcher.rpc import SchemaHelper as h, generator
 from task import Task, TaskException, TaskDescription, VerifyException, Provider, RpcException, query, TaskWarning
-from freenas.utils import normalize, in_directory, remove_unchanged, query as q
+from freenas.utils import normalize, remove_unchanged, query as q
 from freenas.utils.lazy import lazy
+from event import sync
 from utils import split_dataset, save_config, load_config, delete_config
 
 
 CONFIG_VERSION = 100000
+share_paths = None
+
+
+def expand_share_path(root, path, type):
+    if type == 'DATASET':
+        return os.path.join(root, path)
+
+    if type == 'ZVOL':
+        return os.path.join('/dev/zvol', path)
+
+    if type in ('DIRECTORY', 'FILE'):
+        return path
+
+    raise RpcException(errno.EINVAL, 'Invalid share target type {0}'.format(type))
+
+
+def directory_key(path):
+    return os.path.join(os.path.realpath(path), '')
+
+
+class SharePathIndex(object):
+    """
+    Maps filesystem paths to the ids of shares exported from them, so that
+    dependency lookups do not have to expand the path of every share.
+
+    The index is loaded with a single datastore query on first use; shares
+    named in share.changed events are marked dirty and re-read on the next
+    lookup.
+    """
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self.lock = RLock()
+        self.entries = None
+        self.dirty = set()
+        self.root = None
+        self.by_path = {}
+        self.keys = []
+
+    def invalidate(self, ids=None):
+        with self.lock:
+            if ids is None:
+                self.entries = None
+                return
+
+            self.dirty.update(ids)
+
+    def add(self, share):
+        try:
+            path = expand_share_path(self.root, share['target_path'], share['target_type'])
+        except RpcException:
+            return
+
+        self.entries[share['id']] = (path, directory_key(path), share['enabled'])
+
+    def refresh(self):
+        if self.entries is not None and not self.dirty:
+            return
+
+        if self.entries is None:
+            self.root = self.dispatcher.call_sync('volume.get_volumes_root')
+            self.entries = {}
+            self.dirty.clear()
+            for i in self.dispatcher.datastore.query_stream('shares'):
+                self.add(i)
+        else:
+            ids = list(self.dirty)
+            self.dirty.clear()
+            for i in ids:
+                self.entries.pop(i, None)
+
+            for i in self.dispatcher.datastore.query('shares', ('id', 'in', ids)):
+                self.add(i)
+
+        self.by_path = {}
+        for id, (path, _, _) in self.entries.items():
+            self.by_path.setdefault(path, []).append(id)
+
+        self.keys = sorted((key, id) for id, (_, key, _) in self.entries.items())
+
+    def lookup(self, path, enabled_only=True, recursive=True):
+        with self.lock:
+            self.refresh()
+            if recursive:
+                prefix = directory_key(path)
+                start = bisect.bisect_left(self.keys, (prefix, ''))
+                ids = []
+                for key, id in self.keys[start:]:
+                    if not key.startswith(prefix):
+                        break
+
+                    ids.append(id)
+            else:
+                ids = self.by_path.get(path, [])
+
+            return [i for i in ids if not enabled_only or self.entries[i][2]]
 
 
 @description("Provides information on shares")
@@ -43,10 +141,12 @@ class SharesProvider(Provider):
     @query('Share')
     @generator
     def query(self, filter=None, params=None):
+        root = self.dispatcher.call_sync('volume.get_volumes_root')
+
         def extend(share):
             path = None
             try:
-                path = self.translate_path(share['id'])
+                path = expand_share_path(root, share['target_path'], share['target_type'])
             except RpcException:
                 pass
 
@@ -104,22 +204,11 @@ class SharesProvider(Provider):
     @accepts(str, bool, bool)
     @returns(h.array(h.ref('Share')))
     def get_dependencies(self, path, enabled_only=True, recursive=True):
-        result = []
-        if enabled_only:
-            shares = self.datastore.query_stream('shares', ('enabled', '=', True))
-        else:
-            shares = self.datastore.query_stream('shares')
+        ids = share_paths.lookup(path, enabled_only, recursive)
+        if not ids:
+            return []
 
-        for i in shares:
-            target_path = self.translate_path(i['id'])
-            if recursive:
-                if in_directory(target_path, path):
-                    result.append(i)
-            else:
-                if target_path == path:
-                    result.append(i)
-
-        return result
+        return self.datastore.query('shares', ('id', 'in', ids))
 
     @private
     def translate_path(self, share_id):
@@ -132,16 +221,7 @@ class SharesProvider(Provider):
     @private
     def expand_path(self, path, type):
         root = self.dispatcher.call_sync('volume.get_volumes_root')
-        if type == 'DATASET':
-            return os.path.join(root, path)
-
-        if type == 'ZVOL':
-            return os.path.join('/dev/zvol', path)
-
-        if type in ('DIRECTORY', 'FILE'):
-            return path
-
-        raise RpcException(errno.EINVAL, 'Invalid share target type {0}'.format(type))
+        return expand_share_path(root, path, type)
 
     @private
     def get_directory_path(self, share_id):
@@ -671,6 +751,8 @@ def _depends():
 
 
 def _init(dispatcher, plugin):
+    global share_paths
+
     plugin.register_schema_definition('Share', {
         'type': 'object',
         'properties': {
@@ -788,6 +870,10 @@ def _init(dispatcher, plugin):
         set_related_enabled(args['name'], True)
         return True
 
+    @sync
+    def on_share_change(args):
+        share_paths.invalidate(args['ids'])
+
     def update_share_properties_schema():
         plugin.register_schema_definition('ShareProperties', {
             'discriminator': '%type',
@@ -796,6 +882,8 @@ def _init(dispatcher, plugin):
             ]
         })
 
+    share_paths = SharePathIndex(dispatcher)
+
     # Register providers
     plugin.register_provider('share', SharesProvider)
 
@@ -825,6 +913,7 @@ def _init(dispatcher, plugin):
 
     update_share_properties_schema()
     dispatcher.register_event_handler('server.plugin.loaded', update_share_properties_schema)
+    plugin.register_event_handler('share.changed', on_share_change)
 
     # Register Hooks
     plugin.attach_hook('volume.pre_destroy', volume_pre_destroy)
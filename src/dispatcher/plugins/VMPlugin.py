@@ -35,7 +35,6 @@ import hashlib
 import gevent
 import uuid
 import pygit2
-import urllib.request
 import urllib.parse
 import urllib.error
 import shutil
@@ -43,6 +42,8 @@ import tarfile
 import logging
 import datetime
 import tempfile
+import time
+from gevent.lock import RLock
 from cache import EventCacheStore
 from bsd.copy import copytree
 from bsd import sysctl
@@ -56,6 +57,7 @@ from freenas.dispatcher.rpc import SchemaHelper as h, description, accepts, retu
 from freenas.utils import first_or_default, normalize, deep_update, process_template, in_directory
 from freenas.utils import sha256, exclude, query as q
 from utils import save_config, load_config, delete_config
+from lib.download import Download, DownloadException
 from freenas.utils.decorators import throttle
 from freenas.utils.lazy import lazy
 from debug import AttachRPC, AttachDirectory
@@ -65,10 +67,50 @@ VM_OUI = '02:a0:98'  # NetApp
 VM_ROOT = '/vm'
 CACHE_ROOT = '/.vm_cache'
 BLOCKSIZE = 65536
+DOWNLOAD_CONNECTIONS = 4
 MAX_VM_TOOLS_FILE_SIZE = 102400
 CONFIG_VERSION = 100000
+STATUS_CACHE_TTL = 5
 logger = logging.getLogger(__name__)
 templates = None
+status_cache = None
+
+
+class VMStatusCache(object):
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self.lock = RLock()
+        self.entries = {}
+
+    def get(self, id, ids=None):
+        with self.lock:
+            now = time.monotonic()
+            entry = self.entries.get(id)
+            if entry and entry[0] > now:
+                return entry[1], entry[2]
+
+            # Refresh every stale VM we've been told about in one round-trip
+            stale = [i for i in set(ids or []) | {id} if self.entries.get(i, (0,))[0] <= now]
+            try:
+                status = self.dispatcher.call_sync('containerd.management.get_status_many', stale)
+            except RpcException:
+                return None, {}
+
+            try:
+                devices_status = self.dispatcher.call_sync('containerd.management.get_devices_status_many', stale)
+            except RpcException:
+                devices_status = {}
+
+            expires_at = now + STATUS_CACHE_TTL
+            for i in stale:
+                self.entries[i] = (expires_at, status.get(i), devices_status.get(i, {}))
+
+            return status.get(id), devices_status.get(id, {})
+
+    def invalidate(self, ids):
+        with self.lock:
+            for i in ids:
+                self.entries.pop(i, None)
 
 
 @description('Provides information about VMs')
@@ -77,9 +119,19 @@ class VMProvider(Provider):
     @generator
     def query(self, filter=None, params=None):
         def extend(obj):
+            def get_root():
+                if 'root' not in memo:
+                    memo['root'] = self.dispatcher.call_sync(
+                        'vm.datastore.get_filesystem_path',
+                        obj['target'],
+                        get_vm_path(obj['name'])
+                    )
+
+                return memo['root']
+
             def read_readme():
                 try:
-                    root = self.dispatcher.call_sync('vm.get_vm_root', obj['id'])
+                    root = get_root()
                     if os.path.isdir(root):
                         readme = get_readme(root)
                         if readme:
@@ -93,35 +145,29 @@ class VMProvider(Provider):
                 try:
                     path = self.dispatcher.call_sync('vm.get_device_path', id, name, False)
                     dir = os.path.dirname(path)
+                    key = (type, target, dir)
+                    if key not in listings:
+                        listings[key] = {
+                            (o['path'], o['type']): o['size']
+                            for o in self.dispatcher.call_sync('vm.datastore.list', type, target, dir)
+                        }
 
-                    device = first_or_default(
-                        lambda o: o['path'] == path and o['type'] == type,
-                        self.dispatcher.call_sync('vm.datastore.list', type, target, dir)
-                    )
-                    if device:
-                        size = device['size']
+                    size = listings[key].get((path, type), 0)
                 except RpcException:
                     pass
 
                 return size
 
             def get_status():
-                vm_id = obj['id']
-                if obj['target'] in datastores and os.path.isdir(self.dispatcher.call_sync('vm.get_vm_root', vm_id)):
-                    return self.dispatcher.call_sync('containerd.management.get_status', vm_id)
+                if obj['target'] in datastores and os.path.isdir(get_root()):
+                    return status or self.dispatcher.call_sync('containerd.management.get_status', obj['id'])
                 else:
                     return {'state': 'ORPHANED'}
 
-            def get_devices_status():
-                vm_id = obj['id']
-                try:
-                    return self.dispatcher.call_sync('containerd.management.get_devices_status', vm_id)
-                except RpcException:
-                    return {}
-
+            memo = {}
+            status, devices_status = status_cache.get(obj['id'], vm_ids)
             obj['status'] = lazy(get_status)
             obj['config']['readme'] = lazy(read_readme)
-            devices_status = get_devices_status()
             for d in obj['devices']:
                 d['status'] = devices_status.get(d['name'], 'UNKNOWN')
                 if d['type'] == 'DISK':
@@ -135,6 +181,8 @@ class VMProvider(Provider):
             return obj
 
         datastores = list(self.dispatcher.call_sync('vm.datastore.query', [], {'select': 'id'}))
+        vm_ids = self.datastore.query('vms', select='id')
+        listings = {}
 
         return q.query(
             self.datastore.query_stream('vms', callback=extend),
@@ -2240,18 +2288,20 @@ class DownloadFileTask(ProgressTask):
         return resources
 
     def run(self, url, sha256_hash, datastore, destination):
-        done = 0
-
-        @throttle(seconds=1)
-        def progress_hook(nblocks, blocksize, totalsize):
-            nonlocal done
-            current_done = nblocks * blocksize
-            speed = (current_done - done) / 1000
-            self.set_progress((current_done / float(totalsize)) * 100, 'Downloading file {0} KB/s'.format(speed))
-            done = current_done
+        def progress_hook(done, total, rate):
+            self.set_progress(
+                (done / float(total)) * 100 if total else 0,
+                'Downloading file {0:.0f} KB/s'.format(rate / 1000)
+            )
 
         file_path = os.path.join(destination, url.split('/')[-1])
         sha256_path = os.path.join(destination, 'sha256')
+        digest = None
+
+        # Partial downloads are kept outside of the (temporary) destination
+        # directory, keyed by the expected hash, so that a retry can resume
+        partial_dir = os.path.join(os.path.dirname(destination), '.partial')
+        os.makedirs(partial_dir, exist_ok=True)
 
         self.set_progress(0, 'Downloading file')
         try:
@@ -2260,10 +2310,16 @@ class DownloadFileTask(ProgressTask):
                 self.run_subtask_sync('ipfs.get', url.split('/')[-1], destination)
             else:
                 try:
-                    urllib.request.urlretrieve(url, file_path, progress_hook)
+                    digest = Download(
+                        url,
+                        file_path,
+                        part_path=os.path.join(partial_dir, sha256_hash),
+                        connections=DOWNLOAD_CONNECTIONS,
+                        progress=progress_hook
+                    ).run()
                 except ConnectionResetError:
                     raise TaskException(errno.ECONNRESET, 'Cannot access download server to download {0}'.format(url))
-        except OSError:
+        except (OSError, DownloadException):
             raise TaskException(errno.EIO, 'URL {0} could not be downloaded'.format(url))
 
         if os.path.isdir(file_path):
@@ -2273,7 +2329,7 @@ class DownloadFileTask(ProgressTask):
             file_path = os.path.join(destination, f)
 
         self.set_progress(100, 'Verifying checksum')
-        if sha256(file_path, BLOCKSIZE) != sha256_hash:
+        if (digest or sha256(file_path, BLOCKSIZE)) != sha256_hash:
             raise TaskException(errno.EINVAL, 'Invalid SHA256 checksum')
 
         with open(sha256_path, 'w') as sha256_file:
@@ -2633,7 +2689,9 @@ def _depends():
 
 def _init(dispatcher, plugin):
     global templates
+    global status_cache
     templates = EventCacheStore(dispatcher, 'vm.template')
+    status_cache = VMStatusCache(dispatcher)
 
     plugin.register_schema_definition('VmStatus', {
         'type': 'object',
@@ -2712,6 +2770,7 @@ def _init(dispatcher, plugin):
                     'autostart': {'type': 'boolean'},
                     'docker_host': {'type': 'boolean'},
                     'readme': {'type': ['string', 'null']},
+                    'console_scrollback': {'type': ['integer', 'null'], 'minimum': 0},
                     'logging': {
                         'type': 'array',
                         'items': {'type': 'string'}
@@ -3012,6 +3071,12 @@ def _init(dispatcher, plugin):
                     if dispatcher.call_sync('vm.datastore.get_state', vm['target']) == 'ONLINE':
                         dispatcher.call_sync('containerd.management.retry_autostart', vm['id'])
 
+    def on_vm_change(args):
+        status_cache.invalidate(args['ids'])
+
+    def on_vmtools_state_change(args):
+        status_cache.invalidate([args['id']])
+
     def init_templates(args):
         try:
             dispatcher.call_sync('vm.template.update', True)
@@ -3055,6 +3120,8 @@ def _init(dispatcher, plugin):
     plugin.register_event_type('vm.template.changed')
     plugin.register_event_type('vm.snapshot.changed')
 
+    plugin.register_event_handler('vm.changed', on_vm_change)
+    plugin.register_event_handler('vmtools.state.changed', on_vmtools_state_change)
     plugin.register_event_handler('vm.datastore.snapshot.changed', on_snapshot_change)
     plugin.register_event_handler('vm.datastore.changed', on_datastore_change)
     dispatcher.register_event_handler_once('network.changed', init_templates)
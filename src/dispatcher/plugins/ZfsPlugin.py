@@ -1228,21 +1228,23 @@ class ZfsSendTask(ZfsBaseTask):
     def early_describe(cls):
         return 'Sending ZFS replication stream'
 
-    def describe(self, name, fromsnap, tosnap, fd):
+    def describe(self, name, fromsnap, tosnap, fd, intermediate=False):
         return TaskDescription(
             'Sending ZFS replication stream from {fromname} to snapshot {tosnap}',
             fromname='{0}:{1}'.format(name, fromsnap) if fromsnap else name,
             tosnap=tosnap
         )
 
-    def run(self, name, fromsnap, tosnap, fd):
+    def run(self, name, fromsnap, tosnap, fd, intermediate=False):
+        flags = {libzfs.SendFlag.PROGRESS, libzfs.SendFlag.PROPS}
+        if intermediate:
+            # Include all snapshots between fromsnap and tosnap in one stream (zfs send -I)
+            flags.add(libzfs.SendFlag.DOALL)
+
         try:
             zfs = get_zfs()
             obj = zfs.get_object(name)
-            obj.send(fd.fd, fromname=fromsnap, toname=tosnap, flags={
-                libzfs.SendFlag.PROGRESS,
-                libzfs.SendFlag.PROPS
-            })
+            obj.send(fd.fd, fromname=fromsnap, toname=tosnap, flags=flags)
         except libzfs.ZFSException as err:
             raise TaskException(zfs_error_to_errno(err.code), str(err))
         finally:
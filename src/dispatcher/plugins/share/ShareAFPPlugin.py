@@ -127,8 +127,8 @@ class CreateAFPShareTask(Task):
         })
 
         id = self.datastore.insert('shares', share)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'afp')
-        self.dispatcher.call_sync('service.reload', 'afp', timeout=60)
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'afp'):
+            self.dispatcher.call_sync('service.reload', 'afp', timeout=60)
         self.dispatcher.dispatch_event('share.afp.changed', {
             'operation': 'create',
             'ids': [id]
@@ -156,8 +156,8 @@ class UpdateAFPShareTask(Task):
         share = self.datastore.get_by_id('shares', id)
         share.update(updated_fields)
         self.datastore.update('shares', id, share)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'afp')
-        self.dispatcher.call_sync('service.reload', 'afp', timeout=60)
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'afp'):
+            self.dispatcher.call_sync('service.reload', 'afp', timeout=60)
         self.dispatcher.dispatch_event('share.afp.changed', {
             'operation': 'update',
             'ids': [id]
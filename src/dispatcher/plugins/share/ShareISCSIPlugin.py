@@ -173,8 +173,8 @@ class CreateISCSIShareTask(Task):
 
         props['naa'] = self.dispatcher.call_sync('share.iscsi.generate_naa')
         id = self.datastore.insert('shares', share)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
 
         self.dispatcher.dispatch_event('share.iscsi.changed', {
             'operation': 'create',
@@ -239,8 +239,8 @@ class DeleteiSCSIShareTask(Task):
         self.join_subtasks(*subtasks)
 
         self.datastore.delete('shares', id)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('share.iscsi.changed', {
             'operation': 'delete',
             'ids': [id]
@@ -294,8 +294,8 @@ class CreateISCSITargetTask(Task):
         })
 
         id = self.datastore.insert('iscsi.targets', target)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('iscsi.target.changed', {
             'operation': 'create',
             'ids': [id]
@@ -335,8 +335,8 @@ class UpdateISCSITargetTask(Task):
         target = self.datastore.get_by_id('iscsi.targets', id)
         target.update(updated_params)
         self.datastore.update('iscsi.targets', id, target)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('iscsi.target.changed', {
             'operation': 'update',
             'ids': [id]
@@ -361,8 +361,8 @@ class DeleteISCSITargetTask(Task):
             raise TaskException(errno.ENOENT, 'Target {0} does not exist'.format(id))
 
         self.datastore.delete('iscsi.targets', id)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('iscsi.target.changed', {
             'operation': 'delete',
             'ids': [id]
@@ -396,8 +396,8 @@ class CreateISCSIAuthGroupTask(Task):
         })
 
         id = self.datastore.insert('iscsi.auth', auth_group)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('iscsi.auth.changed', {
             'operation': 'create',
             'ids': [id]
@@ -425,8 +425,8 @@ class UpdateISCSIAuthGroupTask(Task):
         ag = self.datastore.get_by_id('iscsi.auth', id)
         ag.update(updated_params)
         self.datastore.update('iscsi.auth', id, ag)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('iscsi.auth.changed', {
             'operation': 'update',
             'ids': [id]
@@ -451,8 +451,8 @@ class DeleteISCSIAuthGroupTask(Task):
             raise TaskException(errno.ENOENT, 'Auth group {0} does not exist'.format(id))
 
         self.datastore.delete('iscsi.auth', id)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('iscsi.auth.changed', {
             'operation': 'delete',
             'ids': [id]
@@ -484,8 +484,8 @@ class CreateISCSIPortalTask(Task):
         })
 
         id = self.datastore.insert('iscsi.portals', portal)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('iscsi.portal.changed', {
             'operation': 'create',
             'ids': [id]
@@ -516,8 +516,8 @@ class UpdateISCSIPortalTask(Task):
         ag = self.datastore.get_by_id('iscsi.portals', id)
         ag.update(updated_params)
         self.datastore.update('iscsi.portals', id, ag)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('iscsi.portal.changed', {
             'operation': 'update',
             'ids': [id]
@@ -542,8 +542,8 @@ class DeleteISCSIPortalTask(Task):
             raise TaskException(errno.ENOENT, 'Portal {0} does not exist'.format(id))
 
         self.datastore.delete('iscsi.portals', id)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl')
-        self.dispatcher.call_sync('service.reload', 'ctl')
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'ctl'):
+            self.dispatcher.call_sync('service.reload', 'ctl')
         self.dispatcher.dispatch_event('iscsi.portal.changed', {
             'operation': 'delete',
             'ids': [id]
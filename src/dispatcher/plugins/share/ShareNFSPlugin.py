@@ -101,8 +101,8 @@ class CreateNFSShareTask(Task):
                 errno.ENXIO, "NFS security option requires NFSv4 support to be enabled in NFS service settings."))
 
         id = self.datastore.insert('shares', share)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'nfs')
-        self.dispatcher.call_sync('service.reload', 'nfs', timeout=60)
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'nfs'):
+            self.dispatcher.call_sync('service.reload', 'nfs', timeout=60)
         return id
 
 
@@ -140,8 +140,8 @@ class UpdateNFSShareTask(Task):
                 errno.ENXIO, "NFS security option requires NFSv4 support to be enabled in NFS service settings."))
 
         self.datastore.update('shares', id, share)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'nfs')
-        self.dispatcher.call_sync('service.reload', 'nfs', timeout=60)
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'nfs'):
+            self.dispatcher.call_sync('service.reload', 'nfs', timeout=60)
         self.dispatcher.dispatch_event('share.nfs.changed', {
             'operation': 'update',
             'ids': [id]
@@ -165,8 +165,8 @@ class DeleteNFSShareTask(Task):
 
     def run(self, id):
         self.datastore.delete('shares', id)
-        self.dispatcher.call_sync('etcd.generation.generate_group', 'nfs')
-        self.dispatcher.call_sync('service.reload', 'nfs', timeout=60)
+        if self.dispatcher.call_sync('etcd.generation.generate_group', 'nfs'):
+            self.dispatcher.call_sync('service.reload', 'nfs', timeout=60)
         self.dispatcher.dispatch_event('share.nfs.changed', {
             'operation': 'delete',
             'ids': [id]
@@ -43,7 +43,7 @@ setup(
         Extension(
             "ReplicationTransportPlugin",
             ["plugins/ReplicationTransportPlugin.pyx"],
-            libraries=['crypto', 'z'],
+            libraries=['crypto', 'z', 'lz4', 'zstd'],
             extra_compile_args=["-g", "-O0"],
             cython_compile_time_env={
                 'FREEBSD_VERSION': freebsd_version,
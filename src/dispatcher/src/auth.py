@@ -155,6 +155,8 @@ class FileToken(Token):
         self.file = kwargs.pop('file')
         self.name = kwargs.pop('name')
         self.size = kwargs.pop('size', None)
+        self.transfers = 0
+        self.sent_ranges = []
         self.revocation_reason = '{0} of file: {1} timed out'.format(
             self.direction or 'Transfer',
             self.name or 'Unknown'
@@ -0,0 +1,338 @@
+#
+# Copyright 2017 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+import threading
+import http.client
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+CHUNK_SIZE = 1024 * 1024
+MIN_SEGMENT_SIZE = 16 * 1024 * 1024
+PROGRESS_INTERVAL = 1
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+
+
+logger = logging.getLogger('download')
+
+
+class DownloadException(Exception):
+    pass
+
+
+class ResourceChangedException(DownloadException):
+    pass
+
+
+class Segment(object):
+    __slots__ = ('start', 'end', 'offset')
+
+    def __init__(self, start, end, offset=None):
+        self.start = start
+        self.end = end
+        self.offset = start if offset is None else offset
+
+    @property
+    def done(self):
+        return self.end is not None and self.offset >= self.end
+
+
+class Download(object):
+    """
+    HTTP(S) file download that hashes data as it lands on disk.
+
+    Data is written to a partial file next to the destination (or to
+    `part_path`) together with a small JSON state file describing which
+    byte ranges are complete, so an interrupted download continues from
+    where it stopped when the server supports range requests. With
+    `connections` > 1 the remaining bytes are split into ranges fetched
+    concurrently; the SHA256 digest is computed in order as the
+    contiguous prefix of the file grows, so no second pass is needed.
+    """
+    def __init__(self, url, path, part_path=None, connections=1, chunk_size=CHUNK_SIZE,
+                 timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, progress=None):
+        self.url = url
+        self.path = path
+        self.part_path = part_path or path + '.part'
+        self.state_path = self.part_path + '.state'
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.retries = retries
+        self.progress = progress
+        self.size = None
+        self.ranges = False
+        self.validator = None
+        self.segments = []
+        self.failed = False
+        self.cv = threading.Condition()
+        self.hasher = None
+        self.hashed = 0
+        self.reported_at = None
+        self.reported_bytes = 0
+
+    @property
+    def downloaded(self):
+        return sum(s.offset - s.start for s in self.segments)
+
+    def run(self):
+        try:
+            return self.download()
+        except ResourceChangedException:
+            logger.info('{0} changed on the server, restarting download'.format(self.url))
+            self.discard()
+            return self.download()
+
+    def discard(self):
+        for p in (self.part_path, self.state_path):
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
+
+    def probe(self):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(self.url, method='HEAD'), timeout=self.timeout) as r:
+                length = r.headers.get('Content-Length')
+                self.size = int(length) if length is not None else None
+                self.ranges = bool(self.size) and r.headers.get('Accept-Ranges') == 'bytes'
+                self.validator = r.headers.get('ETag') or r.headers.get('Last-Modified')
+        except urllib.error.HTTPError as err:
+            if err.code not in (403, 405, 501):
+                raise
+
+            # Server does not do HEAD, fall back to a single streamed GET
+            self.size = None
+            self.ranges = False
+            self.validator = None
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not os.path.exists(self.part_path):
+            return None
+
+        if (state.get('url'), state.get('size'), state.get('validator')) != (self.url, self.size, self.validator):
+            return None
+
+        return [Segment(*s) for s in state['segments']]
+
+    def save_state(self):
+        if not self.ranges:
+            return
+
+        with self.cv:
+            state = {
+                'url': self.url,
+                'size': self.size,
+                'validator': self.validator,
+                'segments': [[s.start, s.end, s.offset] for s in self.segments]
+            }
+
+        with open(self.state_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+
+        os.rename(self.state_path + '.tmp', self.state_path)
+
+    def split(self):
+        if not self.ranges:
+            return [Segment(0, self.size)]
+
+        count = max(1, min(self.connections, self.size // MIN_SEGMENT_SIZE))
+        step = -(-self.size // count)
+        return [Segment(i, min(i + step, self.size)) for i in range(0, self.size, step)]
+
+    def contiguous(self):
+        position = 0
+        for s in sorted(self.segments, key=lambda s: s.start):
+            if s.start > position:
+                break
+
+            position = s.offset
+            if not s.done:
+                break
+
+        return position
+
+    def download(self):
+        self.probe()
+        self.failed = False
+        self.segments = self.load_state() if self.ranges else None
+        if self.segments is None:
+            self.segments = self.split()
+            open(self.part_path, 'wb').close()
+        else:
+            logger.info('Resuming download of {0} at {1} bytes'.format(self.url, self.downloaded))
+
+        self.save_state()
+        self.hasher = hashlib.sha256()
+        self.hashed = 0
+        self.reported_at = time.monotonic()
+        self.reported_bytes = self.downloaded
+
+        try:
+            pending = [s for s in self.segments if not s.done]
+            with ThreadPoolExecutor(max_workers=max(1, len(pending))) as pool:
+                futures = [pool.submit(self.fetch, s) for s in pending]
+                self.hash_behind(futures)
+                for f in futures:
+                    f.result()
+        except BaseException:
+            self.save_state()
+            raise
+
+        if self.size is not None and self.hashed != self.size:
+            raise DownloadException('Download of {0} is incomplete: got {1} of {2} bytes'.format(
+                self.url, self.hashed, self.size
+            ))
+
+        os.rename(self.part_path, self.path)
+        self.discard()
+        self.report(force=True)
+        return self.hasher.hexdigest()
+
+    def hash_behind(self, futures):
+        # Hash the file in order while it is being written; the data read
+        # back here was just written and is still in the buffer cache.
+        fd = os.open(self.part_path, os.O_RDONLY)
+        try:
+            while True:
+                with self.cv:
+                    while self.contiguous() <= self.hashed and not all(f.done() for f in futures):
+                        self.cv.wait(PROGRESS_INTERVAL)
+
+                    end = self.contiguous()
+                    finished = all(f.done() for f in futures)
+
+                while self.hashed < end:
+                    data = os.pread(fd, min(self.chunk_size, end - self.hashed), self.hashed)
+                    if not data:
+                        raise DownloadException('Partial file {0} is truncated'.format(self.part_path))
+
+                    self.hasher.update(data)
+                    self.hashed += len(data)
+
+                self.report()
+                if finished:
+                    return
+        finally:
+            os.close(fd)
+
+    def fetch(self, segment):
+        try:
+            retries = self.retries
+            while not segment.done:
+                try:
+                    self.fetch_range(segment)
+                    if segment.end is None:
+                        with self.cv:
+                            segment.end = segment.offset
+                        return
+
+                    if not segment.done:
+                        raise DownloadException('Connection closed after {0} bytes'.format(segment.offset))
+                except (urllib.error.URLError, http.client.HTTPException, socket.timeout, ConnectionError, DownloadException) as err:
+                    if self.failed or isinstance(err, ResourceChangedException) or not self.ranges or retries <= 0:
+                        raise
+
+                    retries -= 1
+                    logger.warning('Download of {0} interrupted at {1}: {2}, retrying'.format(
+                        self.url, segment.offset, err
+                    ))
+                    time.sleep(1)
+        except BaseException:
+            with self.cv:
+                self.failed = True
+                self.cv.notify_all()
+            raise
+        finally:
+            with self.cv:
+                self.cv.notify_all()
+
+    def fetch_range(self, segment):
+        headers = {}
+        if self.ranges:
+            headers['Range'] = 'bytes={0}-{1}'.format(segment.offset, segment.end - 1)
+            if self.validator and not self.validator.startswith('W/'):
+                headers['If-Range'] = self.validator
+
+        request = urllib.request.Request(self.url, headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as r:
+            if self.ranges and r.status != 206:
+                raise ResourceChangedException('Server ignored range request for {0}'.format(self.url))
+
+            fd = os.open(self.part_path, os.O_WRONLY)
+            try:
+                while not segment.done:
+                    if self.failed:
+                        raise DownloadException('Download aborted')
+
+                    length = self.chunk_size
+                    if segment.end is not None:
+                        length = min(length, segment.end - segment.offset)
+
+                    data = r.read(length)
+                    if not data:
+                        break
+
+                    view = memoryview(data)
+                    while view:
+                        written = os.pwrite(fd, view, segment.offset)
+                        view = view[written:]
+                        with self.cv:
+                            segment.offset += written
+                            self.cv.notify_all()
+            finally:
+                os.close(fd)
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.reported_at < PROGRESS_INTERVAL:
+            return
+
+        downloaded = self.downloaded
+        elapsed = now - self.reported_at
+        rate = (downloaded - self.reported_bytes) / elapsed if elapsed > 0 else 0
+        self.reported_at = now
+        self.reported_bytes = downloaded
+        if not force:
+            self.save_state()
+
+        if self.progress:
+            self.progress(downloaded, self.size, rate)
@@ -46,6 +46,7 @@ import contextlib
 import tempfile
 import cgi
 import subprocess
+import stat
 import struct
 import termios
 import fcntl
@@ -75,6 +76,7 @@ from services import ManagementService, DebugService, EventService, TaskService
 from services import LockService, PluginService, ShellService
 from schemas import register_general_purpose_schemas
 from balancer import Balancer
+from event import sync
 from auth import PasswordAuthenticator, TokenStore, Token, User, Service
 from freenas.utils import FaultTolerantLogHandler, load_module_from_file, serialize_exception
 from freenas.utils.trace_logger import TraceLogger, TRACE
@@ -84,6 +86,9 @@ from freenas.logd import LogdLogHandler
 DEFAULT_CONFIGFILE = '/usr/local/etc/middleware.conf'
 LOGGING_FORMAT = '%(asctime)s %(levelname)s %(filename)s:%(lineno)d %(message)s'
 FEATURES = ['streaming_responses', 'strict_validation']
+TRANSFER_MIN_CHUNK = 64 * 1024
+TRANSFER_MAX_CHUNK = 1024 * 1024
+TRANSFER_KEEPALIVE_INTERVAL = 10
 trace_log_file = None
 
 
@@ -369,7 +374,8 @@ class Dispatcher(object):
         self.logger.info('Initializing')
 
         self.datastore = get_datastore(self.configfile)
-        self.configstore = ConfigStore(self.datastore)
+        self.configstore = ConfigStore(self.datastore, cache=True)
+        self.configstore.add_listener(lambda keys: self.dispatch_event('config.changed', {'keys': keys}))
 
         self.logger.info('Connected to datastore')
 
@@ -400,6 +406,13 @@ class Dispatcher(object):
         self.register_event_type('server.ready')
         self.register_event_type('server.shutdown')
         self.register_event_type('server.schema_document_changed')
+        self.register_event_type('config.changed')
+        self.register_event_handler('config.changed', self.on_config_changed)
+
+    @sync
+    def on_config_changed(self, args):
+        # Emitted by every process writing through a caching ConfigStore
+        self.configstore.invalidate(args['keys'])
 
     def start(self):
         self.started_at = time.time()
@@ -1374,9 +1387,81 @@ class ShellConnection(WebSocketApplication, EventEmitter):
         self.dispatcher.token_store.keepalive_token(self.token)
 
 
-class FileConnection(WebSocketApplication, EventEmitter):
-    BUFSIZE = 1024
+class TransferKeepalive(object):
+    """
+    Keeps a file token alive during a transfer. The token is refreshed at
+    most once per interval (and well within its lifetime) rather than on
+    every chunk.
+    """
+    def __init__(self, dispatcher, token):
+        self.dispatcher = dispatcher
+        self.token = token
+        self.interval = min(TRANSFER_KEEPALIVE_INTERVAL, token.lifetime / 4) if token.lifetime else None
+        self.last = 0
+
+    def __call__(self):
+        now = time.monotonic()
+        if self.interval is not None and now - self.last >= self.interval:
+            self.last = now
+            self.dispatcher.token_store.keepalive_token(self.token)
+
+
+def next_chunk_size(chunk_size, received):
+    # Grow the chunk size for as long as the source keeps filling whole chunks
+    if received < chunk_size:
+        return chunk_size
+
+    return min(chunk_size * 2, TRANSFER_MAX_CHUNK)
+
+
+def regular_file_size(file):
+    try:
+        st = os.fstat(file.fileno())
+    except (OSError, ValueError, UnsupportedOperation):
+        return None
+
+    return st.st_size if stat.S_ISREG(st.st_mode) else None
+
+
+def parse_byte_range(header, size):
+    # Returns (start, end) of a single satisfiable range, None to send the
+    # whole file and False if the range can not be satisfied
+    match = re.match(r'^bytes=(\d*)-(\d*)$', (header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        if int(last) == 0:
+            return False
+
+        return max(0, size - int(last)), size
 
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size:
+        return False
+
+    if end <= start:
+        return None
+
+    return start, end
+
+
+def merge_byte_range(ranges, start, end):
+    # Adds [start, end) to a sorted list of disjoint ranges, joining the ones it touches
+    result = []
+    for s, e in ranges:
+        if e < start or s > end:
+            result.append((s, e))
+        else:
+            start, end = min(s, start), max(e, end)
+
+    result.append((start, end))
+    return sorted(result)
+
+
+class FileConnection(WebSocketApplication, EventEmitter):
     def __init__(self, ws, parent):
         super(FileConnection, self).__init__(ws)
         self.dispatcher = parent.context
@@ -1389,17 +1474,19 @@ class FileConnection(WebSocketApplication, EventEmitter):
         self.logger = logging.getLogger('FileConnection')
 
     def worker(self, file, direction, size=None):
+        keepalive = TransferKeepalive(self.dispatcher, self.token)
         try:
             self.bytes_done = 0
             if self.token.direction == "download":
+                chunk_size = TRANSFER_MIN_CHUNK
                 while True:
-                    data = tp_read(file.fileno(), self.BUFSIZE)
-                    self.bytes_done += self.BUFSIZE
+                    data = tp_read(file.fileno(), chunk_size)
                     if data == b'':
                         break
+                    self.bytes_done += len(data)
                     self.ws.send(data)
-                    # issue keepalive
-                    self.dispatcher.token_store.keepalive_token(self.token)
+                    keepalive()
+                    chunk_size = next_chunk_size(chunk_size, len(data))
             else:
                 for i in self.inq:
                     if i == b'':
@@ -1414,8 +1501,7 @@ class FileConnection(WebSocketApplication, EventEmitter):
                             return
                         self.bytes_done += done
                         num_written += done
-                    # issue keepalive
-                    self.dispatcher.token_store.keepalive_token(self.token)
+                    keepalive()
         finally:
             file.close()
             self.done.set()
@@ -1470,7 +1556,6 @@ class DownloadRequestHandler(object):
 
     def __init__(self, dispatcher):
         self.dispatcher = dispatcher
-        self.token = None
 
     def __call__(self, environ, start_response):
         path = environ['PATH_INFO'][1:].split('/')
@@ -1482,38 +1567,94 @@ class DownloadRequestHandler(object):
         if token_str is None:
             start_response('401 Unauthorized', [('Content-Type', 'text/html')])
             return [b"No Token provided so no cookie for you!"]
-        self.token = self.dispatcher.token_store.lookup_token(token_str[0])
-        if self.token is None or self.token.direction != "download":
+        token = self.dispatcher.token_store.lookup_token(token_str[0])
+        if token is None or token.direction != "download":
             start_response('400 Bad Request', [('Content-Type', 'text/html')])
             return [b"You provided an invalid/timedout token!"]
-        return self.start_file_transfer(environ, start_response)
+        return self.start_file_transfer(environ, start_response, token)
 
-    def start_file_transfer(self, environ, start_response):
-        start_response('200 OK', [
+    def start_file_transfer(self, environ, start_response, token):
+        cors = [
             ('Access-Control-Allow-Origin', '*'),
-            ('Access-Control-Allow-Credentials', 'true'),
+            ('Access-Control-Allow-Credentials', 'true')
+        ]
+        headers = cors + [
             ('Content-Type', 'application/octet-stream'),
-            ('Content-Disposition', 'attachment; filename="{}"'.format(self.token.name)),
-            ('Transfer-Encoding', 'chunked')
+            ('Content-Disposition', 'attachment; filename="{}"'.format(token.name))
+        ]
+
+        size = regular_file_size(token.file)
+        if size is None:
+            start_response('200 OK', headers + [('Transfer-Encoding', 'chunked')])
+            return self.send_stream(token)
+
+        byte_range = parse_byte_range(environ.get('HTTP_RANGE'), size)
+        if byte_range is False:
+            start_response('416 Range Not Satisfiable', cors + [('Content-Range', 'bytes */{0}'.format(size))])
+            return [b""]
+
+        status = '200 OK'
+        start, end = 0, size
+        if byte_range:
+            status = '206 Partial Content'
+            start, end = byte_range
+            headers.append(('Content-Range', 'bytes {0}-{1}/{2}'.format(start, end - 1, size)))
+
+        start_response(status, headers + [
+            ('Accept-Ranges', 'bytes'),
+            ('Content-Length', str(end - start))
         ])
+        return self.send_range(token, start, end, size)
+
+    def send_range(self, token, start, end, size):
+        # Regular files are read with pread, so that several ranges of the
+        # same file can be served at once. The token stays valid after an
+        # interrupted transfer, allowing the client to resume with a Range
+        # request, and is released once every byte of the file has been sent
+        # (segmented downloaders may well fetch the tail first).
+        keepalive = TransferKeepalive(self.dispatcher, token)
+        fd = token.file.fileno()
+        offset = start
+        chunk_size = TRANSFER_MIN_CHUNK
+        token.transfers += 1
+        try:
+            while offset < end:
+                data = self.dispatcher.threaded(os.pread, fd, min(chunk_size, end - offset), offset)
+                if data == b'':
+                    break
+                offset += len(data)
+                keepalive()
+                yield data
+                chunk_size = next_chunk_size(chunk_size, len(data))
+        finally:
+            token.transfers -= 1
+            if offset > start:
+                token.sent_ranges = merge_byte_range(token.sent_ranges, start, offset)
+
+            if (not size or token.sent_ranges == [(0, size)]) and not token.transfers:
+                self.dispatcher.token_store.delete_token(token)
+
+    def send_stream(self, token):
+        keepalive = TransferKeepalive(self.dispatcher, token)
+        chunk_size = TRANSFER_MIN_CHUNK
         try:
             try:
-                self.token.file.seek(0)
+                token.file.seek(0)
             except UnsupportedOperation:
                 # if file object's underlying stream is a pipe
                 # then seek is illegal
                 pass
 
             while True:
-                chunk = self.token.file.read(1024)
+                chunk = token.file.read(chunk_size)
                 if chunk == b'':
                     break
-                # issue keepalive
-                self.dispatcher.token_store.keepalive_token(self.token)
+                keepalive()
                 yield chunk
+                chunk_size = next_chunk_size(chunk_size, len(chunk))
         finally:
-            self.dispatcher.token_store.delete_token(self.token)
-            self.token.file.close()
+            self.dispatcher.token_store.delete_token(token)
+            token.file.close()
 
 
 def run(d, args):
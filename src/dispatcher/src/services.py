@@ -52,7 +52,8 @@ class ManagementService(RpcService):
     def status(self):
         return {
             'started-at': self.dispatcher.started_at,
-            'connected-clients': sum([len(s.connections) for s in self.dispatcher.ws_servers])
+            'connected-clients': sum([len(s.connections) for s in self.dispatcher.ws_servers]),
+            'config-cache': self.dispatcher.configstore.stats
         }
 
     def ping(self):
@@ -213,7 +213,8 @@ class Context(object):
 
         self.datastore = get_datastore()
         self.datastore_log = get_datastore(log=True)
-        self.configstore = ConfigStore(self.datastore)
+        self.configstore = ConfigStore(self.datastore, cache=True)
+        self.configstore.add_listener(lambda keys: self.conn.emit_event('config.changed', {'keys': keys}))
         self.conn = Client()
         self.conn.connect('unix:')
         self.conn.login_service('task.{0}'.format(os.getpid()))
@@ -221,12 +222,15 @@ class Context(object):
         self.conn.call_sync('management.enable_features', ['streaming_responses'])
         self.conn.rpc.register_service_instance('taskproxy', self.service)
         self.conn.register_event_handler('task.progress', self.task_progress_handler)
+        self.conn.register_event_handler('config.changed', lambda args: self.configstore.invalidate(args['keys']))
         self.conn.call_sync('task.checkin', key)
         setproctitle('task executor (idle)')
 
         while True:
             try:
                 task = self.task.get()
+                # Start every task with fresh configuration, change events may still be in flight
+                self.configstore.invalidate()
                 logging.root.setLevel(self.conn.call_sync('management.get_logging_level'))
                 setproctitle('task executor (tid {0})'.format(task['id']))
 
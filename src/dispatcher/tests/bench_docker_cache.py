@@ -0,0 +1,73 @@
+#!/usr/local/bin/python3
+"""
+Compares the docker cache diffing used by refresh_database_cache against the
+previous quadratic first_or_default scan, on synthetic container lists, e.g.:
+
+    ./bench_docker_cache.py -n 1000 5000 10000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.extend([
+    os.path.join(os.path.dirname(__file__), '..', 'src'),
+    os.path.join(os.path.dirname(__file__), '..', 'plugins'),
+])
+
+from freenas.utils import first_or_default  # noqa
+from DockerPlugin import diff_by_id  # noqa
+
+
+def make_containers(count, offset=0, changed=()):
+    return [
+        {
+            'id': '{0:064x}'.format(i),
+            'name': 'container{0}'.format(i),
+            'image': 'freenas/image{0}:latest'.format(i % 50),
+            'host': 'host{0}'.format(i % 4),
+            'ports': [{'container_port': 80, 'host_port': 8000 + i % 1000, 'protocol': 'TCP'}],
+            'environment': ['VERSION={0}'.format(2 if i in changed else 1)],
+        }
+        for i in range(offset, offset + count)
+    ]
+
+
+def diff_quadratic(current, old):
+    created, updated, deleted = [], [], []
+    for obj in current:
+        old_obj = first_or_default(lambda o: o['id'] == obj['id'], old)
+        if old_obj:
+            if obj != old_obj:
+                updated.append(obj)
+        else:
+            created.append(obj)
+
+    for obj in old:
+        if not first_or_default(lambda o: o['id'] == obj['id'], current):
+            deleted.append(obj['id'])
+
+    return created, updated, deleted
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--counts', nargs='+', default=[1000, 5000], type=int)
+    args = parser.parse_args()
+
+    for count in args.counts:
+        # 10% churn: some new, some removed, some changed
+        churn = count // 10
+        old = make_containers(count)
+        current = make_containers(count, offset=churn, changed=range(churn, 2 * churn))
+
+        for name, fn in (('hash join', diff_by_id), ('quadratic', diff_quadratic)):
+            started_at = time.monotonic()
+            created, updated, deleted = fn(current, old)
+            print('{0:>6} objects, {1:>9}: {2:.3f}s ({3} created, {4} updated, {5} deleted)'.format(
+                count, name, time.monotonic() - started_at, len(created), len(updated), len(deleted)
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/local/bin/python3
+"""
+Downloads a file through a running dispatcher's /filedownload endpoint and
+reports throughput, then checks that an interrupted download resumes with a
+Range request on the same token, e.g.:
+
+    ./bench_file_transfer.py -s 2048
+    ./bench_file_transfer.py -f /var/tmp/debug.tar.gz
+"""
+import os
+import time
+import hashlib
+import argparse
+import tempfile
+import http.client
+from freenas.dispatcher.client import Client
+
+
+def get_token(client, path):
+    return client.call_sync('filesystem.download', path)
+
+
+def fetch(port, token, headers=None, limit=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', '/filedownload?token={0}'.format(token), headers=headers or {})
+    response = conn.getresponse()
+    hasher = hashlib.sha256()
+    received = 0
+    while limit is None or received < limit:
+        data = response.read(1024 * 1024)
+        if not data:
+            break
+
+        hasher.update(data)
+        received += len(data)
+
+    conn.close()
+    return response, received, hasher
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--file', help='File to download (a temporary one is created by default)')
+    parser.add_argument('-s', '--size', default=1024, type=int, help='Size of the temporary file in MiB')
+    parser.add_argument('-p', '--port', default=5000, type=int, help='Dispatcher port')
+    args = parser.parse_args()
+
+    client = Client()
+    client.connect('unix:')
+    client.login_service('bench_file_transfer')
+
+    tmp = None
+    path = args.file
+    if not path:
+        tmp = tempfile.NamedTemporaryFile(dir='/var/tmp')
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size):
+            tmp.write(block)
+
+        tmp.flush()
+        path = tmp.name
+
+    try:
+        size = os.path.getsize(path)
+        started_at = time.monotonic()
+        response, received, hasher = fetch(args.port, get_token(client, path))
+        elapsed = time.monotonic() - started_at
+        print('full: HTTP {0}, {1} of {2} bytes in {3:.2f}s, {4:.1f} MB/s'.format(
+            response.status, received, size, elapsed, received / elapsed / 1000000
+        ))
+
+        # Stop half way through, then resume where the first request stopped
+        token = get_token(client, path)
+        _, first, partial = fetch(args.port, token, limit=size // 2)
+        response, rest, resumed = fetch(args.port, token, headers={'Range': 'bytes={0}-'.format(first)})
+        print('resume: HTTP {0} ({1}), {2} + {3} of {4} bytes'.format(
+            response.status, response.getheader('Content-Range'), first, rest, size
+        ))
+    finally:
+        if tmp:
+            tmp.close()
+
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/local/bin/python3
+"""
+Times ReplicationDeltaPlanner on synthetic snapshot lists, e.g.:
+
+    ./bench_replication_delta.py -d 1000 -s 2000 -b 24
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.extend([
+    os.path.join(os.path.dirname(__file__), '..', 'src'),
+    os.path.join(os.path.dirname(__file__), '..', 'plugins'),
+])
+
+from ReplicationPlugin import ReplicationDeltaPlanner  # noqa
+
+
+def make_snapshots(dataset, count):
+    return [
+        {
+            'name': '{0}@auto-{1}'.format(dataset, i),
+            'snapshot_name': 'auto-{0}'.format(i),
+            'properties': {
+                'creation': {'rawvalue': str(1480000000 + i * 3600)},
+                'createtxg': {'rawvalue': str(i)},
+            }
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--datasets', default=500, type=int, help='Number of datasets in the link')
+    parser.add_argument('-s', '--snapshots', default=1000, type=int, help='Snapshots per dataset')
+    parser.add_argument('-b', '--behind', default=24, type=int, help='How many snapshots the remote side lags')
+    args = parser.parse_args()
+
+    datasets = ['tank/src'] + ['tank/src/ds{0}'.format(i) for i in range(args.datasets - 1)]
+    local = {ds: make_snapshots(ds, args.snapshots) for ds in datasets}
+    remote = []
+    for ds in datasets:
+        remotefs = ds.replace('tank/src', 'backup/dst', 1)
+        remote.append({'name': remotefs})
+        remote.extend(
+            {'name': remotefs + '@' + s['snapshot_name'], 'created_at': int(s['properties']['creation']['rawvalue'])}
+            for s in local[ds][:-args.behind]
+        )
+
+    started_at = time.monotonic()
+    planner = ReplicationDeltaPlanner('tank/src', 'backup/dst', remote, followdelete=True)
+    indexed_at = time.monotonic()
+    actions = []
+    for ds in datasets:
+        actions.extend(planner.plan_dataset(ds, local[ds]))
+
+    actions.extend(planner.plan_deletions(datasets))
+    finished_at = time.monotonic()
+
+    print('{0} datasets x {1} snapshots ({2} remote entries): index {3:.3f}s, plan {4:.3f}s, {5} actions'.format(
+        len(datasets), args.snapshots, len(remote), indexed_at - started_at, finished_at - indexed_at, len(actions)
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/local/bin/python3
+"""
+Measures throughput of the replication transport compression stages over a
+loopback TCP connection: data source -> compress -> socket -> decompress ->
+sink, for every codec and thread count given. Needs the compiled
+ReplicationTransportPlugin module, e.g.:
+
+    ./bench_replication_transport.py -s 2048 -c ZLIB LZ4 ZSTD -t 1 4
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+
+sys.path.extend([
+    os.path.join(os.path.dirname(__file__), '..', 'src'),
+    os.path.join(os.path.dirname(__file__), '..', 'plugins'),
+])
+
+from freenas.dispatcher.fd import FileDescriptor  # noqa
+from ReplicationTransportPlugin import TransportCompressTask, TransportDecompressTask  # noqa
+
+
+class Context(object):
+    datastore = None
+    datastore_log = None
+    configstore = None
+
+
+def make_payload(size):
+    # Roughly zfs send like: a mix of incompressible and highly redundant records
+    record = 128 * 1024
+    noise = os.urandom(record)
+    text = (b'replication stream benchmark payload ' * (record // 37 + 1))[:record]
+    return b''.join(noise if i % 3 == 0 else text for i in range(size // record))
+
+
+def source(fd, payload, total):
+    view = memoryview(payload)
+    written = 0
+    with os.fdopen(fd, 'wb', buffering=0) as f:
+        while written < total:
+            chunk = view[:min(len(view), total - written)]
+            f.write(chunk)
+            written += len(chunk)
+
+
+def sink(fd, result):
+    received = 0
+    while True:
+        data = os.read(fd, 1024 * 1024)
+        if not data:
+            break
+
+        received += len(data)
+
+    os.close(fd)
+    result.append(received)
+
+
+def run(codec, threads, level, buffer_size, payload, total):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    listener.close()
+
+    src_rd, src_wr = os.pipe()
+    dst_rd, dst_wr = os.pipe()
+    options = {'codec': codec, 'level': level, 'threads': threads, 'buffer_size': buffer_size}
+    compress = dict(options, read_fd=FileDescriptor(src_rd), write_fd=FileDescriptor(os.dup(client.fileno())))
+    decompress = dict(options, read_fd=FileDescriptor(os.dup(server.fileno())), write_fd=FileDescriptor(dst_wr))
+    client.close()
+    server.close()
+
+    result = []
+    workers = [
+        threading.Thread(target=source, args=(src_wr, payload, total)),
+        threading.Thread(target=TransportCompressTask(Context()).run, args=(compress,)),
+        threading.Thread(target=TransportDecompressTask(Context()).run, args=(decompress,)),
+        threading.Thread(target=sink, args=(dst_rd, result)),
+    ]
+
+    started_at = time.monotonic()
+    for t in workers:
+        t.start()
+
+    for t in workers:
+        t.join()
+
+    elapsed = time.monotonic() - started_at
+    print('{0:>5} {1:>7} x{2:<2}: {3:.1f} MB/s ({4} of {5} bytes)'.format(
+        codec, level, threads, result[0] / elapsed / 1000000, result[0], total
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--size', default=1024, type=int, help='Amount of data to send in MiB')
+    parser.add_argument('-c', '--codecs', nargs='+', default=['ZLIB', 'LZ4', 'ZSTD'])
+    parser.add_argument('-t', '--threads', nargs='+', default=[1, 4], type=int)
+    parser.add_argument('-l', '--level', default='DEFAULT', choices=['FAST', 'DEFAULT', 'BEST'])
+    parser.add_argument('-b', '--buffer-size', default=1024 * 1024, type=int)
+    args = parser.parse_args()
+
+    payload = make_payload(16 * 1024 * 1024)
+    for codec in args.codecs:
+        # zlib is a single stream, threads do not apply to it
+        for threads in (args.threads if codec != 'ZLIB' else [1]):
+            run(codec, threads, args.level, args.buffer_size, payload, args.size * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    main()
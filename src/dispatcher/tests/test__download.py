@@ -0,0 +1,165 @@
+#
+# Copyright 2017 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import os
+import re
+import sys
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from lib import download  # noqa
+
+
+class FileServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super(FileServer, self).__init__(('127.0.0.1', 0), FileRequestHandler)
+        self.payload = os.urandom(3 * 1024 * 1024 + 12345)
+        self.ranges = True
+        self.etag = '"v1"'
+        self.drop_after = None
+        self.requests = []
+
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_headers(self, status, start, end):
+        self.send_response(status)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('ETag', self.server.etag)
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, end - 1, len(self.server.payload)))
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_headers(200, 0, len(self.server.payload))
+
+    def do_GET(self):
+        payload = self.server.payload
+        start, end, status = 0, len(payload), 200
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match and self.server.ranges and self.headers.get('If-Range', self.server.etag) == self.server.etag:
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else end
+            status = 206
+
+        self.server.requests.append((start, end, status))
+        self.send_headers(status, start, end)
+        data = payload[start:end]
+        if self.server.drop_after is not None:
+            # Simulate a dropped connection once, half way through
+            data = data[:self.server.drop_after]
+            self.server.drop_after = None
+            self.wfile.write(data)
+            self.close_connection = True
+            return
+
+        self.wfile.write(data)
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.server = FileServer()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.url = 'http://127.0.0.1:{0}/image.gz'.format(self.server.server_address[1])
+        self.path = os.path.join(self.tmpdir.name, 'image.gz')
+        self.digest = hashlib.sha256(self.server.payload).hexdigest()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def assertDownloaded(self, digest):
+        self.assertEqual(digest, self.digest)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.server.payload)
+
+        self.assertFalse(os.path.exists(self.path + '.part'))
+        self.assertFalse(os.path.exists(self.path + '.part.state'))
+
+    def test_sequential(self):
+        self.assertDownloaded(download.Download(self.url, self.path).run())
+
+    def test_parallel(self):
+        download.MIN_SEGMENT_SIZE = 512 * 1024
+        try:
+            digest = download.Download(self.url, self.path, connections=4, chunk_size=65536).run()
+        finally:
+            download.MIN_SEGMENT_SIZE = 16 * 1024 * 1024
+
+        self.assertDownloaded(digest)
+        self.assertEqual(len([r for r in self.server.requests if r[2] == 206]), 4)
+
+    def test_no_ranges(self):
+        self.server.ranges = False
+        self.assertDownloaded(download.Download(self.url, self.path).run())
+
+    def test_retry_resumes(self):
+        self.server.drop_after = 1024 * 1024
+        self.assertDownloaded(download.Download(self.url, self.path, chunk_size=65536).run())
+        self.assertEqual(self.server.requests[-1][0], 1024 * 1024)
+
+    def test_resume_from_partial(self):
+        self.server.drop_after = 1024 * 1024
+        with self.assertRaises(download.DownloadException):
+            download.Download(self.url, self.path, chunk_size=65536, retries=0).run()
+
+        self.assertTrue(os.path.exists(self.path + '.part.state'))
+        self.assertDownloaded(download.Download(self.url, self.path).run())
+        self.assertEqual(self.server.requests[-1][0], 1024 * 1024)
+
+    def test_changed_resource_restarts(self):
+        self.server.drop_after = 1024 * 1024
+        with self.assertRaises(download.DownloadException):
+            download.Download(self.url, self.path, chunk_size=65536, retries=0).run()
+
+        self.server.etag = '"v2"'
+        self.assertDownloaded(download.Download(self.url, self.path).run())
+        self.assertEqual(self.server.requests[-1][0], 0)
+
+    def test_progress(self):
+        reports = []
+        download.Download(self.url, self.path, progress=lambda *args: reports.append(args)).run()
+        self.assertEqual(reports[-1][:2], (len(self.server.payload), len(self.server.payload)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -220,6 +220,14 @@ class FreeIPAPlugin(DirectoryServicePlugin):
         group = self.search_one(self.group_dn, '(ipaUniqueID={0})'.format(id))
         return self.convert_group(group)
 
+    def getgruuids(self, ids):
+        logger.debug('getgruuids(uuids={0})'.format(ids))
+        if not ids:
+            return []
+
+        terms = ''.join('(ipaUniqueID={0})'.format(i) for i in ids)
+        return [self.convert_group(i) for i in self.search(self.group_dn, '(|{0})'.format(terms))]
+
     def getgrgid(self, gid):
         logger.debug('getgrgid(gid={0})'.format(gid))
         group = self.search_one(self.group_dn, '(gidNumber={0})'.format(gid))
@@ -212,6 +212,26 @@ class LDAPPlugin(DirectoryServicePlugin):
         group = self.search_one(self.group_dn, q)
         return self.convert_group(group)
 
+    def getgruuids(self, ids):
+        logger.debug('getgruuids(uuids={0})'.format(ids))
+        terms = []
+
+        for id in ids:
+            try:
+                checksum, gid = parse_uuid2(id)
+                if crc32(dn_to_domain(self.base_dn)) != checksum:
+                    continue
+
+                terms.append('(gidNumber={0})'.format(gid))
+            except ValueError:
+                terms.append('(entryUUID={0})'.format(id))
+
+        if not terms:
+            return []
+
+        result = self.search(self.group_dn, '(|{0})'.format(''.join(terms)))
+        return [self.convert_group(i) for i in result]
+
     def authenticate(self, user_name, password):
         with self.bind_lock:
             try:
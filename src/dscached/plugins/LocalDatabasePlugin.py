@@ -33,10 +33,16 @@ from plugin import DirectoryServicePlugin, DirectoryState
 class LocalDatabasePlugin(DirectoryServicePlugin):
     def __init__(self, context):
         def flush_users(ev):
+            context.users_cache.flush_negative()
+            context.membership_cache.clear()
+            context.update_enumeration(self, 'users', ev['ids'])
             for i in ev['ids']:
                 context.users_cache.flush(i)
 
         def flush_groups(ev):
+            context.groups_cache.flush_negative()
+            context.membership_cache.clear()
+            context.update_enumeration(self, 'groups', ev['ids'])
             for i in ev['ids']:
                 context.groups_cache.flush(i)
 
@@ -70,6 +76,9 @@ class LocalDatabasePlugin(DirectoryServicePlugin):
     def getgruuid(self, uuid):
         return self.datastore.get_one('groups', ('id', '=', uuid))
 
+    def getgruuids(self, uuids):
+        return self.datastore.query('groups', ('id', 'in', uuids))
+
     def change_password(self, user_name, password):
         user = self.datastore.get_one('users', ('username', '=', user_name))
         if not user:
@@ -538,6 +538,22 @@ class WinbindPlugin(DirectoryServicePlugin):
         guid = ldap3.utils.conv.escape_bytes(uuid.UUID(id).bytes_le)
         return self.convert_group(self.search_one(self.base_dn, '(objectGUID={0})'.format(guid)))
 
+    def getgruuids(self, ids):
+        logger.debug('getgruuids(uuids={0})'.format(ids))
+        if not self.is_joined():
+            logger.debug('getgruuids: not joined')
+            return []
+
+        if not ids:
+            return []
+
+        terms = ''.join(
+            '(objectGUID={0})'.format(ldap3.utils.conv.escape_bytes(uuid.UUID(i).bytes_le)) for i in ids
+        )
+
+        groups = (self.convert_group(i) for i in self.search(self.base_dn, '(|{0})'.format(terms)))
+        return [g for g in groups if g]
+
     def getgrgid(self, gid):
         logger.debug('getgrgid(gid={0})'.format(gid))
         if not self.is_joined():
@@ -40,7 +40,9 @@ import ipaddress
 import socket
 import netif
 from bsd import setproctitle
-from threading import RLock, Thread
+from threading import RLock, Thread, Condition
+from queue import Queue
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from datastore.config import ConfigStore
 from freenas.dispatcher.client import Client, ClientError
@@ -54,6 +56,10 @@ from plugin import DirectoryState
 
 
 NOGROUP_GID = 65533
+DEFAULT_CACHE_SIZE = 65536
+DEFAULT_NEGATIVE_CACHE_TTL = 60
+REFRESH_AHEAD_RATIO = 0.8
+DEFAULT_ENUMERATION_TTL = 300
 DEFAULT_CONFIGFILE = '/usr/local/etc/middleware.conf'
 DEFAULT_SOCKET_ADDRESS = 'unix:///var/run/dscached.sock'
 AF_MAP = {
@@ -154,6 +160,10 @@ class CacheItem(object):
     def expired(self):
         return self.created_at + timedelta(seconds=self.ttl) < datetime.utcnow()
 
+    @property
+    def stale(self):
+        return self.created_at + timedelta(seconds=self.ttl * REFRESH_AHEAD_RATIO) < datetime.utcnow()
+
     @property
     def annotated(self):
         return extend(self.value, {
@@ -168,76 +178,335 @@ class CacheItem(object):
 
 
 class TTLCacheStore(object):
-    def __init__(self):
+    def __init__(self, loader=None):
+        self.lock = RLock()
         self.id_store = {}
         self.name_store = {}
-        self.uuid_store = {}
+        self.uuid_store = OrderedDict()
+        self.negative_store = {}
+        self.max_size = DEFAULT_CACHE_SIZE
+        self.negative_ttl = DEFAULT_NEGATIVE_CACHE_TTL
+        self.loader = loader
+        self.refresh_queue = Queue()
+        self.refreshing = set()
         self.hits = 0
         self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+        if self.loader:
+            thread = Thread(target=self.refresh_worker, name='CacheRefreshThread', daemon=True)
+            thread.start()
 
     def __len__(self):
-        return len(self.id_store)
+        return len(self.uuid_store)
 
     def __getstate__(self):
         return {
             'size': len(self),
+            'max_size': self.max_size,
+            'negative_size': len(self.negative_store),
             'hits': self.hits,
-            'misses': self.misses
+            'misses': self.misses,
+            'negative_hits': self.negative_hits,
+            'evictions': self.evictions,
+            'refreshes': self.refreshes
         }
 
+    def configure(self, max_size, negative_ttl):
+        with self.lock:
+            self.max_size = max_size
+            self.negative_ttl = negative_ttl
+            self.evict()
+
     def get(self, id=None, uuid=None, name=None):
+        with self.lock:
+            if id is not None:
+                item = self.id_store.get(id)
+            elif uuid is not None:
+                item = self.uuid_store.get(uuid.lower())
+            elif name is not None:
+                item = self.name_store.get(name)
+            else:
+                raise AssertionError('Either id=, uuid= or name= parameter must be filled')
+
+            if item:
+                if item.expired:
+                    self.flush(item.uuid)
+                    self.misses += 1
+                    return
+
+                if item.stale:
+                    self.schedule_refresh(item)
+
+                self.uuid_store.move_to_end(item.uuid)
+                self.hits += 1
+                item.directory.stats['cache_hits'] += 1
+                return item
+
+            self.misses += 1
+            return
+
+    def get_negative(self, id=None, uuid=None, name=None):
+        key = self.negative_key(id, uuid, name)
+        with self.lock:
+            expires_at = self.negative_store.get(key)
+            if not expires_at:
+                return False
+
+            if expires_at < datetime.utcnow():
+                del self.negative_store[key]
+                return False
+
+            self.negative_hits += 1
+            return True
+
+    def set_negative(self, id=None, uuid=None, name=None):
+        if not self.negative_ttl:
+            return
+
+        key = self.negative_key(id, uuid, name)
+        with self.lock:
+            if len(self.negative_store) >= self.max_size:
+                self.expire_negative()
+
+            if len(self.negative_store) < self.max_size:
+                self.negative_store[key] = datetime.utcnow() + timedelta(seconds=self.negative_ttl)
+
+    def negative_key(self, id, uuid, name):
         if id is not None:
-            item = self.id_store.get(id)
+            return 'id', id
         elif uuid is not None:
-            item = self.uuid_store.get(uuid.lower())
+            return 'uuid', uuid.lower()
         elif name is not None:
-            item = self.name_store.get(name)
-        else:
-            raise AssertionError('Either id=, uuid= or name= parameter must be filled')
+            return 'name', name
 
-        if item:
-            if item.expired:
-                self.flush(item.uuid)
-                self.misses += 1
-                return
+        raise AssertionError('Either id=, uuid= or name= parameter must be filled')
 
-            self.hits += 1
-            return item
+    def flush(self, uuid):
+        with self.lock:
+            item = self.uuid_store.get(uuid)
+            if item:
+                with item.lock:
+                    if item.destroyed:
+                        return
 
-        self.misses += 1
-        return
+                    for i in item.names:
+                        if self.name_store.get(i) is item:
+                            del self.name_store[i]
 
-    def flush(self, uuid):
-        item = self.uuid_store.get(uuid)
-        if item:
-            with item.lock:
-                if item.destroyed:
-                    return
+                    if self.id_store.get(item.id) is item:
+                        del self.id_store[item.id]
 
-                for i in item.names:
-                    del self.name_store[i]
-                del self.uuid_store[item.uuid]
-                del self.id_store[item.id]
+                    del self.uuid_store[item.uuid]
+                    item.destroyed = True
+
+    def flush_negative(self):
+        with self.lock:
+            self.negative_store.clear()
 
     def query(self, filter=None, params=None):
         return query(self.id_store, *(filter or []), **(params or {}))
 
     def set(self, item):
-        with item.lock:
-            self.id_store[item.id] = item
-            self.uuid_store[item.uuid] = item
-            for i in item.names:
-                self.name_store[i] = item
+        with self.lock:
+            old = self.uuid_store.get(item.uuid)
+            if old:
+                self.flush(old.uuid)
+
+            with item.lock:
+                self.id_store[item.id] = item
+                self.uuid_store[item.uuid] = item
+                for i in item.names:
+                    self.name_store[i] = item
+
+            self.evict()
+
+    def evict(self):
+        while len(self.uuid_store) > self.max_size:
+            uuid = next(iter(self.uuid_store))
+            self.flush(uuid)
+            self.evictions += 1
 
     def expire(self):
-        for uuid, item in self.uuid_store.items():
-            if item.expired:
-                self.flush(uuid)
+        with self.lock:
+            for uuid, item in list(self.uuid_store.items()):
+                if item.expired:
+                    self.flush(uuid)
+
+            self.expire_negative()
+
+    def expire_negative(self):
+        now = datetime.utcnow()
+        for key, expires_at in list(self.negative_store.items()):
+            if expires_at < now:
+                del self.negative_store[key]
 
     def clear(self):
-        self.name_store.clear()
-        self.uuid_store.clear()
-        self.id_store.clear()
+        with self.lock:
+            self.name_store.clear()
+            self.uuid_store.clear()
+            self.id_store.clear()
+            self.negative_store.clear()
+
+    def schedule_refresh(self, item):
+        if not self.loader or item.uuid in self.refreshing:
+            return
+
+        self.refreshing.add(item.uuid)
+        self.refresh_queue.put(item)
+
+    def refresh_worker(self):
+        while True:
+            item = self.refresh_queue.get()
+            try:
+                new_item = self.loader(item)
+                if new_item:
+                    self.set(new_item)
+                    self.refreshes += 1
+                else:
+                    self.flush(item.uuid)
+            except BaseException as err:
+                logging.debug('Cannot refresh cache entry {0}: {1}'.format(item.uuid, str(err)))
+            finally:
+                with self.lock:
+                    self.refreshing.discard(item.uuid)
+
+
+class MembershipCacheStore(object):
+    def __init__(self):
+        self.lock = RLock()
+        self.store = OrderedDict()
+        self.max_size = DEFAULT_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getstate__(self):
+        return {
+            'size': len(self),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def configure(self, max_size):
+        with self.lock:
+            self.max_size = max_size
+            while len(self.store) > self.max_size:
+                self.store.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.store.get(key)
+            if entry:
+                gids, expires_at = entry
+                if expires_at >= datetime.utcnow():
+                    self.store.move_to_end(key)
+                    self.hits += 1
+                    return gids
+
+                del self.store[key]
+
+            self.misses += 1
+
+    def set(self, key, gids, ttl):
+        with self.lock:
+            self.store[key] = (gids, datetime.utcnow() + timedelta(seconds=ttl))
+            self.store.move_to_end(key)
+            while len(self.store) > self.max_size:
+                self.store.popitem(last=False)
+
+    def expire(self):
+        now = datetime.utcnow()
+        with self.lock:
+            for key, (gids, expires_at) in list(self.store.items()):
+                if expires_at < now:
+                    del self.store[key]
+
+    def clear(self):
+        with self.lock:
+            self.store.clear()
+
+
+class EnumerationSnapshot(object):
+    def __init__(self, directory, kind, name_field, loader):
+        self.directory = directory
+        self.kind = kind
+        self.name_field = name_field
+        self.loader = loader
+        self.lock = RLock()
+        self.entries = OrderedDict()
+        self.names = {}
+        self.built_at = None
+        self.build_time = None
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        return {
+            'directory': self.directory.name,
+            'kind': self.kind,
+            'size': len(self),
+            'hits': self.hits,
+            'built_at': self.built_at,
+            'build_time': self.build_time
+        }
+
+    @property
+    def built(self):
+        return self.built_at is not None
+
+    def stale(self, ttl):
+        return not self.built or self.built_at + timedelta(seconds=ttl) < datetime.utcnow()
+
+    def rebuild(self):
+        started_at = time.monotonic()
+        entries = OrderedDict()
+        names = {}
+
+        for i in self.loader(self.directory):
+            entries[i['id']] = i
+            names[i[self.name_field]] = i['id']
+
+        with self.lock:
+            self.entries = entries
+            self.names = names
+            self.built_at = datetime.utcnow()
+            self.build_time = time.monotonic() - started_at
+
+    def update(self, id, entry):
+        with self.lock:
+            old = self.entries.pop(id, None)
+            if old:
+                self.names.pop(old[self.name_field], None)
+
+            if entry:
+                self.entries[id] = entry
+                self.names[entry[self.name_field]] = id
+
+    def query(self, filter, params):
+        with self.lock:
+            self.hits += 1
+
+            # Serve exact id/name matches straight from the index
+            if len(filter) == 1 and len(filter[0]) == 3 and filter[0][1] == '=':
+                field, op, value = filter[0]
+                if field == 'id':
+                    entry = self.entries.get(value)
+                    return [entry] if entry else []
+
+                if field == self.name_field:
+                    entry = self.entries.get(self.names.get(value))
+                    return [entry] if entry else []
+
+            entries = list(self.entries.values())
+
+        return query(entries, *filter, stream=True, **params)
 
 
 class Directory(object):
@@ -255,6 +524,14 @@ class Directory(object):
         self.status_code = 0
         self.status_message = None
         self.state = DirectoryState.DISABLED
+        self.stats = {
+            'cache_hits': 0,
+            'lookups': 0,
+            'found': 0,
+            'not_found': 0,
+            'errors': 0,
+            'lookup_time': 0.0
+        }
 
         if definition['uid_range']:
             self.min_uid, self.max_uid = definition['uid_range']
@@ -296,6 +573,26 @@ class Directory(object):
             self.context.logger.error('Failed to configure {0}: {1}'.format(self.name, str(err)))
             self.context.logger.error('Stack trace: ', exc_info=True)
 
+    def lookup(self, method, *args):
+        started_at = time.monotonic()
+        self.stats['lookups'] += 1
+        try:
+            result = getattr(self.instance, method)(*args)
+        except:
+            self.stats['errors'] += 1
+            raise
+        finally:
+            self.stats['lookup_time'] += time.monotonic() - started_at
+
+        self.stats['found' if result else 'not_found'] += 1
+        return result
+
+    def get_stats(self):
+        lookups = self.stats['lookups']
+        return extend(self.stats, {
+            'average_latency': self.stats['lookup_time'] / lookups if lookups else 0.0
+        })
+
     def put_state(self, state):
         self.context.logger.info('Directory {0} state: {1}'.format(self.name, state.name))
         self.state = state
@@ -354,7 +651,10 @@ class ManagementService(RpcService):
         return {
             'users': self.context.users_cache.__getstate__(),
             'groups': self.context.groups_cache.__getstate__(),
-            'hosts': self.context.hosts_cache.__getstate__()
+            'hosts': self.context.hosts_cache.__getstate__(),
+            'memberships': self.context.membership_cache.__getstate__(),
+            'enumerations': [s.__getstate__() for s in list(self.context.enumerations.values())],
+            'directories': {d.name: d.get_stats() for d in self.context.directories}
         }
 
     def clean_cache(self):
@@ -362,11 +662,16 @@ class ManagementService(RpcService):
         for i in self.context.users_cache, self.context.groups_cache, self.context.hosts_cache:
             i.expire()
 
+        self.context.membership_cache.expire()
+
     def flush_cache(self):
         self.context.logger.warning('Flushing caches')
         for i in self.context.users_cache, self.context.groups_cache, self.context.hosts_cache:
             i.clear()
 
+        self.context.membership_cache.clear()
+        self.context.flush_enumerations()
+
     def normalize_parameters(self, plugin, parameters):
         cls = self.context.plugins.get(plugin)
         if not cls:
@@ -406,6 +711,7 @@ class ManagementService(RpcService):
         directory.enabled = ds_d['enabled']
         directory.parameters = ds_d['parameters']
         directory.configure()
+        self.context.flush_enumerations(directory)
 
     def get_status(self, id):
         directory = first_or_default(lambda d: d.id == id, self.context.directories)
@@ -469,6 +775,15 @@ class AccountService(RpcService):
                 continue
 
             try:
+                snapshot = self.context.get_enumeration(d, 'users')
+                if snapshot:
+                    for user in snapshot.query(filter, params):
+                        yield fix_passwords(user)
+                        if single:
+                            return
+
+                    continue
+
                 result = d.instance.getpwent(filter, params)
                 for user in result:
                     if not user:
@@ -494,6 +809,9 @@ class AccountService(RpcService):
 
             return fix_passwords(item.annotated)
 
+        if self.context.users_cache.get_negative(id=uid):
+            raise RpcException(errno.ENOENT, 'UID {0} not found'.format(uid))
+
         dirs = self.context.get_active_directories()
 
         for d in dirs:
@@ -501,7 +819,7 @@ class AccountService(RpcService):
                 continue
 
             try:
-                user = d.instance.getpwuid(uid)
+                user = d.lookup('getpwuid', uid)
             except:
                 continue
 
@@ -513,6 +831,9 @@ class AccountService(RpcService):
                 self.context.users_cache.set(item)
                 return fix_passwords(item.annotated)
 
+        if not skip_ad:
+            self.context.users_cache.set_negative(id=uid)
+
         raise RpcException(errno.ENOENT, 'UID {0} not found'.format(uid))
 
     @accepts(str, bool)
@@ -525,6 +846,10 @@ class AccountService(RpcService):
 
             return fix_passwords(item.annotated)
 
+        if self.context.users_cache.get_negative(name=user_name):
+            raise RpcException(errno.ENOENT, 'User {0} not found'.format(user_name))
+
+        lookup_name = user_name
         if '@' in user_name:
             # Fully qualified user name
             fqdn = True
@@ -539,7 +864,7 @@ class AccountService(RpcService):
                 continue
 
             try:
-                user = d.instance.getpwnam(user_name)
+                user = d.lookup('getpwnam', user_name)
             except:
                 continue
 
@@ -553,6 +878,9 @@ class AccountService(RpcService):
                 self.context.users_cache.set(item)
                 return fix_passwords(item.annotated)
 
+        if not skip_ad:
+            self.context.users_cache.set_negative(name=lookup_name)
+
         raise RpcException(errno.ENOENT, 'User {0} not found'.format(user_name))
 
     @accepts(str, bool)
@@ -565,12 +893,15 @@ class AccountService(RpcService):
 
             return fix_passwords(item.annotated)
 
+        if self.context.users_cache.get_negative(uuid=uuid):
+            raise RpcException(errno.ENOENT, 'UUID {0} not found'.format(uuid))
+
         for d in self.context.get_active_directories():
             if skip_ad and d.plugin_type == 'winbind':
                 continue
 
             try:
-                user = d.instance.getpwuuid(uuid)
+                user = d.lookup('getpwuuid', uuid)
             except:
                 continue
 
@@ -582,8 +913,27 @@ class AccountService(RpcService):
                 self.context.users_cache.set(item)
                 return fix_passwords(item.annotated)
 
+        if not skip_ad:
+            self.context.users_cache.set_negative(uuid=uuid)
+
         raise RpcException(errno.ENOENT, 'UUID {0} not found'.format(uuid))
 
+    def enumerate(self, directory):
+        for user in directory.instance.getpwent():
+            if not user:
+                continue
+
+            resolve_primary_group(self.context, user)
+            yield annotate(user, directory, 'username')
+
+    def reload_item(self, item):
+        user = item.directory.lookup('getpwuuid', item.uuid)
+        if not user:
+            return
+
+        resolve_primary_group(self.context, user)
+        return CacheItem(user['uid'], user['id'], item.names, copy.copy(user), item.directory, self.context.cache_ttl)
+
     @accepts(str, bool, bool)
     def getgroupmembership(self, user_name, skip_ad=False, include_primary_group=False):
         user = self.getpwnam(user_name, skip_ad)
@@ -592,21 +942,40 @@ class AccountService(RpcService):
         if include_primary_group and 'gid' in user:
             result.append(user['gid'])
 
-        def collect_groups(group):
-            result.append(group['gid'])
-            for i in group.get('parents', []):
-                g = self.context.group_service.getgruuid(i, skip_ad)
-                if g:
-                    collect_groups(g)
+        key = (user['id'], skip_ad)
+        gids = self.context.membership_cache.get(key)
+        if gids is None:
+            gids = self.resolve_membership(user, skip_ad)
+            self.context.membership_cache.set(key, gids, self.context.cache_ttl)
 
-        for i in user.get('groups', []):
-            try:
-                g = self.context.group_service.getgruuid(i, skip_ad)
-                collect_groups(g)
-            except:
-                continue
+        return result + gids
 
-        return result
+    def resolve_membership(self, user, skip_ad=False):
+        # Walk group hierarchy breadth-first, one bulk lookup per nesting level
+        gids = []
+        seen = set(user.get('groups', []))
+        pending = list(seen)
+
+        while pending:
+            groups = self.context.group_service.getgruuids(pending, skip_ad)
+            parents = []
+
+            for i in pending:
+                group = groups.get(i.lower())
+                if not group:
+                    continue
+
+                if group['gid'] not in gids:
+                    gids.append(group['gid'])
+
+                for p in group.get('parents', []):
+                    if p not in seen:
+                        seen.add(p)
+                        parents.append(p)
+
+            pending = parents
+
+        return gids
 
     @accepts(str, str)
     def authenticate(self, user_name, password):
@@ -664,6 +1033,15 @@ class GroupService(RpcService):
                 continue
 
             try:
+                snapshot = self.context.get_enumeration(d, 'groups')
+                if snapshot:
+                    for group in snapshot.query(filter, params):
+                        yield group
+                        if single:
+                            return
+
+                    continue
+
                 result = d.instance.getgrent(filter, params)
                 for group in result:
                     if not group:
@@ -678,6 +1056,61 @@ class GroupService(RpcService):
                 self.context.logger.error('Directory {0} exception during group iteration'.format(d.name), exc_info=True)
                 continue
 
+    def enumerate(self, directory):
+        for group in directory.instance.getgrent():
+            if not group:
+                continue
+
+            yield annotate(group, directory, 'name')
+
+    def reload_item(self, item):
+        group = item.directory.lookup('getgruuid', item.uuid)
+        if not group:
+            return
+
+        return CacheItem(group['gid'], group['id'], item.names, copy.copy(group), item.directory, self.context.cache_ttl)
+
+    def getgruuids(self, uuids, skip_ad=False):
+        result = {}
+        missing = []
+
+        for i in uuids:
+            item = self.context.groups_cache.get(uuid=i)
+            if item:
+                if not (skip_ad and item.directory.plugin_type == 'winbind'):
+                    result[item.uuid] = item.annotated
+
+                continue
+
+            if not self.context.groups_cache.get_negative(uuid=i):
+                missing.append(i)
+
+        for d in self.context.get_active_directories():
+            if not missing:
+                break
+
+            if skip_ad and d.plugin_type == 'winbind':
+                continue
+
+            try:
+                groups = d.lookup('getgruuids', missing)
+            except:
+                continue
+
+            for group in groups:
+                aliases = alias(d, group, 'name')
+                item = CacheItem(group['gid'], group['id'], aliases, copy.copy(group), d, self.context.cache_ttl)
+                self.context.groups_cache.set(item)
+                result[item.uuid] = item.annotated
+
+            missing = [i for i in missing if i.lower() not in result]
+
+        if not skip_ad:
+            for i in missing:
+                self.context.groups_cache.set_negative(uuid=i)
+
+        return result
+
     @accepts(str, bool)
     def getgrnam(self, name, skip_ad=False):
         # Try the cache first
@@ -688,6 +1121,10 @@ class GroupService(RpcService):
 
             return item.annotated
 
+        if self.context.groups_cache.get_negative(name=name):
+            raise RpcException(errno.ENOENT, 'Group {0} not found'.format(name))
+
+        lookup_name = name
         if '@' in name:
             # Fully qualified group name
             fqdn = True
@@ -702,7 +1139,7 @@ class GroupService(RpcService):
                 continue
 
             try:
-                group = d.instance.getgrnam(name)
+                group = d.lookup('getgrnam', name)
             except:
                 continue
 
@@ -715,6 +1152,9 @@ class GroupService(RpcService):
                 self.context.groups_cache.set(item)
                 return item.annotated
 
+        if not skip_ad:
+            self.context.groups_cache.set_negative(name=lookup_name)
+
         raise RpcException(errno.ENOENT, 'Group {0} not found'.format(name))
 
     @accepts(int, bool)
@@ -727,6 +1167,9 @@ class GroupService(RpcService):
 
             return item.annotated
 
+        if self.context.groups_cache.get_negative(id=gid):
+            raise RpcException(errno.ENOENT, 'GID {0} not found'.format(gid))
+
         dirs = self.context.get_active_directories()
 
         for d in dirs:
@@ -734,7 +1177,7 @@ class GroupService(RpcService):
                 continue
 
             try:
-                group = d.instance.getgrgid(gid)
+                group = d.lookup('getgrgid', gid)
             except:
                 continue
 
@@ -744,6 +1187,9 @@ class GroupService(RpcService):
                 self.context.groups_cache.set(item)
                 return item.annotated
 
+        if not skip_ad:
+            self.context.groups_cache.set_negative(id=gid)
+
         raise RpcException(errno.ENOENT, 'GID {0} not found'.format(gid))
 
     @accepts(str, bool)
@@ -756,12 +1202,15 @@ class GroupService(RpcService):
 
             return item.annotated
 
+        if self.context.groups_cache.get_negative(uuid=uuid):
+            raise RpcException(errno.ENOENT, 'UUID {0} not found'.format(uuid))
+
         for d in self.context.get_active_directories():
             if skip_ad and d.plugin_type == 'winbind':
                 continue
 
             try:
-                group = d.instance.getgruuid(uuid)
+                group = d.lookup('getgruuid', uuid)
             except:
                 continue
 
@@ -771,6 +1220,9 @@ class GroupService(RpcService):
                 self.context.groups_cache.set(item)
                 return item.annotated
 
+        if not skip_ad:
+            self.context.groups_cache.set_negative(uuid=uuid)
+
         raise RpcException(errno.ENOENT, 'UUID {0} not found'.format(uuid))
 
 
@@ -841,10 +1293,17 @@ class Main(object):
         self.plugin_dirs = []
         self.plugins = {}
         self.directories = []
-        self.users_cache = TTLCacheStore()
-        self.groups_cache = TTLCacheStore()
+        self.users_cache = TTLCacheStore(loader=lambda i: self.account_service.reload_item(i))
+        self.groups_cache = TTLCacheStore(loader=lambda i: self.group_service.reload_item(i))
         self.hosts_cache = TTLCacheStore()
+        self.membership_cache = MembershipCacheStore()
+        self.enumerations = {}
+        self.enumerations_lock = RLock()
+        self.enumeration_cv = Condition()
+        self.enumeration_ttl = DEFAULT_ENUMERATION_TTL
         self.cache_ttl = 7200
+        self.cache_size = DEFAULT_CACHE_SIZE
+        self.negative_cache_ttl = DEFAULT_NEGATIVE_CACHE_TTL
         self.search_order = []
         self.cache_enumerations = True
         self.cache_lookups = True
@@ -899,6 +1358,79 @@ class Main(object):
                 self.directories
             )
 
+    def get_enumeration(self, directory, kind):
+        if not self.cache_enumerations:
+            return
+
+        with self.enumerations_lock:
+            snapshot = self.enumerations.get((directory.id, kind))
+            if not snapshot:
+                if kind == 'users':
+                    snapshot = EnumerationSnapshot(directory, kind, 'username', self.account_service.enumerate)
+                else:
+                    snapshot = EnumerationSnapshot(directory, kind, 'name', self.group_service.enumerate)
+
+                self.enumerations[(directory.id, kind)] = snapshot
+
+        if not snapshot.built:
+            with snapshot.lock:
+                if not snapshot.built:
+                    snapshot.rebuild()
+
+        return snapshot
+
+    def update_enumeration(self, instance, kind, ids):
+        with self.enumerations_lock:
+            snapshots = [s for s in self.enumerations.values() if s.directory.instance is instance and s.kind == kind]
+
+        for snapshot in snapshots:
+            for id in ids:
+                if kind == 'users':
+                    entry = snapshot.directory.instance.getpwuuid(id)
+                    if entry:
+                        resolve_primary_group(self, entry)
+                        entry = annotate(entry, snapshot.directory, 'username')
+                else:
+                    entry = snapshot.directory.instance.getgruuid(id)
+                    if entry:
+                        entry = annotate(entry, snapshot.directory, 'name')
+
+                snapshot.update(id, entry)
+
+    def flush_enumerations(self, directory=None):
+        with self.enumerations_lock:
+            for key, snapshot in list(self.enumerations.items()):
+                if directory is None or snapshot.directory is directory:
+                    del self.enumerations[key]
+
+    def refresh_enumerations(self):
+        while True:
+            with self.enumeration_cv:
+                self.enumeration_cv.wait(max(self.enumeration_ttl, 1))
+
+            with self.enumerations_lock:
+                snapshots = list(self.enumerations.values())
+
+            for snapshot in snapshots:
+                if snapshot.directory.state != DirectoryState.BOUND:
+                    continue
+
+                if not snapshot.stale(self.enumeration_ttl):
+                    continue
+
+                try:
+                    snapshot.rebuild()
+                except BaseException as err:
+                    self.logger.warning('Cannot refresh {0} snapshot of directory {1}: {2}'.format(
+                        snapshot.kind,
+                        snapshot.directory.name,
+                        str(err)
+                    ))
+
+    def init_enumerations(self):
+        thread = Thread(target=self.refresh_enumerations, name='EnumerationThread', daemon=True)
+        thread.start()
+
     def get_home_directory(self, directory, username):
         if not self.home_directory_root:
             return '/nonexistent'
@@ -1008,8 +1540,22 @@ class Main(object):
         self.cache_ttl = self.configstore.get('directory.cache_ttl')
         self.cache_enumerations = self.configstore.get('directory.cache_enumerations')
         self.cache_lookups = self.configstore.get('directory.cache_lookups')
+        self.cache_size = self.configstore.get('directory.cache_size', DEFAULT_CACHE_SIZE)
+        self.negative_cache_ttl = self.configstore.get('directory.negative_cache_ttl', DEFAULT_NEGATIVE_CACHE_TTL)
+        self.enumeration_ttl = self.configstore.get('directory.enumeration_ttl', DEFAULT_ENUMERATION_TTL)
         self.home_directory_root = self.configstore.get('system.home_directory_root')
 
+        for i in self.users_cache, self.groups_cache, self.hosts_cache:
+            i.configure(self.cache_size, self.negative_cache_ttl)
+
+        self.membership_cache.configure(self.cache_size)
+
+        if not self.cache_enumerations:
+            self.flush_enumerations()
+
+        with self.enumeration_cv:
+            self.enumeration_cv.notify_all()
+
     def checkin(self):
         checkin()
 
@@ -1030,6 +1576,7 @@ class Main(object):
         self.scan_plugins()
         self.wait_for_etcd()
         self.init_directories()
+        self.init_enumerations()
         self.checkin()
         self.client.wait_forever()
 
@@ -76,6 +76,10 @@ class DirectoryServicePlugin(object):
     def getgrgid(self, gid):
         raise NotImplementedError()
 
+    def getgruuids(self, uuids):
+        # Plugins able to fetch several groups in one round trip should override this
+        return [g for g in (self.getgruuid(i) for i in uuids) if g]
+
     def configure(self, *args, **kwargs):
         pass
 
@@ -26,7 +26,6 @@
 #####################################################################
 
 import json
-from freenas.utils import create_with_mode
 
 
 def convert_rpm(rpm):
@@ -240,12 +239,11 @@ def run(context):
         'isns-server': context.configstore.get('service.iscsi.isns_servers')
     }
 
-    with create_with_mode('/etc/ctl.conf', 0o600) as f:
-        json.dump(config, f, indent=4)
+    changed = context.write_file('/etc/ctl.conf', json.dumps(config, indent=4), 0o600)
+    context.write_file('/etc/ctl.conf.shadow', json.dumps(redact(config), indent=4), 0o600)
+    if changed:
+        context.emit_event('etcd.file_generated', {
+            'name': '/etc/ctl.conf'
+        })
 
-    with create_with_mode('/etc/ctl.conf.shadow', 0o600) as f:
-        json.dump(redact(config), f, indent=4)
-
-    context.emit_event('etcd.file_generated', {
-        'name': '/etc/ctl.conf'
-    })
+    return changed
@@ -1,3 +1,9 @@
+<%!
+    prefetch = [
+        ('service.nfs.get_config',),
+        ('share.query', [('type', '=', 'nfs'), ('enabled', '=', True)])
+    ]
+%>\
 <%
     config = dispatcher.call_sync('service.nfs.get_config')
 
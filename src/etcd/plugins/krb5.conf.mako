@@ -1,3 +1,9 @@
+<%!
+    prefetch = [
+        ('kerberos.realm.get_default_realm',),
+        ('kerberos.realm.query',)
+    ]
+%>\
 <%
     default_realm = dispatcher.call_sync('kerberos.realm.get_default_realm')
 %>
@@ -1,3 +1,9 @@
+<%!
+    prefetch = [
+        ('service.afp.get_config',),
+        ('share.query', [('type', '=', 'afp'), ('enabled', '=', True)])
+    ]
+%>\
 <%
     from freenas.utils.permissions import perm_to_oct_string
 
@@ -1,3 +1,10 @@
+<%!
+    prefetch = [
+        ('service.webdav.get_config',),
+        ('user.query', [('username', '=', 'webdav')], {'single': True}),
+        ('share.query', [('type', '=', 'webdav')])
+    ]
+%>\
 <%
     import os
     import grp
@@ -1,3 +1,9 @@
+<%!
+    prefetch = [
+        ('service.rsyncd.get_config',),
+        ('rsyncd.module.query',)
+    ]
+%>\
 <%
     config = dispatcher.call_sync('service.rsyncd.get_config')
     modules = dispatcher.call_sync('rsyncd.module.query')
@@ -1,3 +1,9 @@
+<%!
+    prefetch = [
+        ('system.info.version',),
+        ('system.advanced.get_config',)
+    ]
+%>\
 <%
     freenas_version = dispatcher.call_sync('system.info.version')
     motd = dispatcher.call_sync('system.advanced.get_config')['motd']
@@ -1,3 +1,11 @@
+<%!
+    prefetch = [
+        ('system.advanced.get_config',),
+        ('system.general.get_config',),
+        ('service.nfs.get_config',),
+        ('tunable.query', [('type', '=', 'RC')])
+    ]
+%>\
 <%
     from bsd import sysctl
     from freenas.utils.permissions import perm_to_oct_string
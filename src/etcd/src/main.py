@@ -35,11 +35,13 @@ import errno
 import datastore
 import time
 import imp
+import hashlib
 import renderers
+from prefetch import GenerationBatch
 from bsd import setproctitle
 from datastore.config import ConfigStore
 from freenas.dispatcher.client import Client, ClientError
-from freenas.dispatcher.rpc import RpcService, RpcException
+from freenas.dispatcher.rpc import RpcService, RpcException, private
 from freenas.utils import configure_logging
 from freenas.utils.debug import DebugService
 from freenas.serviced import checkin
@@ -60,6 +62,12 @@ class ManagementService(RpcService):
     def rescan_plugins(self):
         self.context.scan_plugins()
 
+    def get_config_cache_stats(self):
+        return self.context.configstore.stats
+
+    def get_generation_stats(self):
+        return self.context.generation_stats
+
     def die(self):
         pass
 
@@ -71,60 +79,115 @@ class FileGenerationService(RpcService):
         self.datastore = ctx.datastore
 
     def generate_all(self):
+        deps = []
         for group in self.datastore.query('etcd.groups'):
-            self.generate_group(group['name'])
-
-    def generate_file(self, filename):
-        if filename not in self.context.managed_files.keys():
-            return
+            self.resolve_group(group['name'], deps)
 
-        text = self.context.generate_file(filename)
-        filepath = os.path.join(self.context.root, filename)
-        try:
-            with open(filepath, 'w', encoding='utf-8') as fd:
-                fd.write(text)
-        except FileNotFoundError as e:
-            self.context.logger.error('Failed to open {0}: {1}'.format(filepath, e), exc_info=True)
-            return
+        return self.generate_dependencies(deps)
 
-        self.context.emit_event('etcd.file_generated', {
-            'filename': filepath,
-        })
+    def generate_file(self, filename):
+        self.context.configstore.invalidate()
+        with GenerationBatch(self.context.client) as batch:
+            return self.write_file(filename, batch)
 
     def generate_plugin(self, name):
+        self.context.configstore.invalidate()
+        return self.run_plugin(name)
+
+    @private
+    def run_plugin(self, name):
         if name not in self.context.managed_files.keys():
-            return
+            return False
 
+        started_at = time.monotonic()
         try:
             pname = os.path.basename(name)
             plugin = imp.load_source(pname, self.context.managed_files[name])
         except:
             self.context.logger.error('Invalid plugin source file: {0}'.format(name), exc_info=True)
-            return
+            return False
 
         if not hasattr(plugin, 'run'):
             self.context.logger.error('Invalid plugin source {0}, no run method'.format(pname))
-            return
+            return False
 
         try:
-            plugin.run(self.context)
+            # Plugins write their files themselves; unless run() returns False assume something changed
+            changed = plugin.run(self.context) is not False
         except Exception as err:
             self.context.logger.error('Cannot run plugin {0}: {1}'.format(name, str(err)), exc_info=True)
+            return False
+
+        self.context.record_generation(name, started_at, changed)
+        return changed
 
     def generate_group(self, name):
+        return self.generate_dependencies(self.resolve_group(name, []))
+
+    @private
+    def write_file(self, filename, batch):
+        if filename not in self.context.managed_files.keys():
+            return False
+
+        started_at = time.monotonic()
+        client = batch.client_for(filename)
+        text = self.context.generate_file(filename, client)
+        filepath = os.path.join(self.context.root, filename)
+        try:
+            changed = self.context.write_file(filepath, text)
+        except FileNotFoundError as e:
+            self.context.logger.error('Failed to open {0}: {1}'.format(filepath, e), exc_info=True)
+            return False
+
+        self.context.record_generation(filename, started_at, changed, client)
+        if changed:
+            self.context.emit_event('etcd.file_generated', {
+                'filename': filepath,
+            })
+
+        return changed
+
+    @private
+    def resolve_group(self, name, deps):
+        # Flattens the group into the list of files and plugins to generate.
+        # Every dependency is listed once, even if several groups share it.
         group = self.datastore.get_one('etcd.groups', ('name', '=', name))
         if not group:
             raise RpcException(errno.ENOENT, 'Group {0} not found'.format(name))
 
+        deps.append('group:' + name)
         for i in group['dependencies']:
-            typ, fname = i.split(':')
+            if i in deps:
+                continue
 
-            if typ == 'file':
-                self.generate_file(fname)
-            elif typ == 'plugin':
-                self.generate_plugin(fname)
-            elif typ == 'group':
-                self.generate_group(fname)
+            typ, fname = i.split(':')
+            if typ == 'group':
+                self.resolve_group(fname, deps)
+            else:
+                deps.append(i)
+
+        return deps
+
+    @private
+    def generate_dependencies(self, deps):
+        # Config is cached for the duration of one request only: config.changed
+        # events may arrive after the RPC asking to render the new values
+        self.context.configstore.invalidate()
+        changed = []
+        with GenerationBatch(self.context.client) as batch:
+            for i in deps:
+                typ, fname = i.split(':')
+                if typ == 'file':
+                    batch.prefetch(self.context.get_prefetch(fname))
+
+            for i in deps:
+                typ, fname = i.split(':')
+                if typ == 'file' and self.write_file(fname, batch):
+                    changed.append(i)
+                elif typ == 'plugin' and self.run_plugin(fname):
+                    changed.append(i)
+
+        return changed
 
     def get_managed_files(self):
         return self.context.managed_files
@@ -146,6 +209,7 @@ class Main(object):
         self.plugin_dirs = []
         self.renderers = {}
         self.managed_files = {}
+        self.generation_stats = {}
 
     def init_datastore(self):
         try:
@@ -154,7 +218,8 @@ class Main(object):
             self.logger.error('Cannot initialize datastore: %s', str(err))
             sys.exit(1)
 
-        self.configstore = ConfigStore(self.datastore)
+        self.configstore = ConfigStore(self.datastore, cache=True)
+        self.configstore.add_listener(lambda keys: self.client.emit_event('config.changed', {'keys': keys}))
 
     def init_dispatcher(self):
         def on_error(reason, **kwargs):
@@ -220,7 +285,7 @@ class Main(object):
                     self.managed_files[name] = abspath
                     self.logger.info('Adding managed file %s [%s]', name, ext)
 
-    def generate_file(self, file_path):
+    def get_renderer(self, file_path):
         if file_path not in self.managed_files.keys():
             raise RpcException(errno.ENOENT, 'No such file')
 
@@ -229,13 +294,64 @@ class Main(object):
         if ext not in self.renderers.keys():
             raise RuntimeError("Can't find renderer for {0}".format(file_path))
 
-        renderer = self.renderers[ext]
+        return self.renderers[ext], template_path
+
+    def get_prefetch(self, file_path):
+        try:
+            renderer, template_path = self.get_renderer(file_path)
+            return renderer.get_prefetch(template_path)
+        except Exception as e:
+            # Rendering reports the problem
+            self.logger.debug('Cannot read prefetch declarations of {0}: {1}'.format(file_path, str(e)))
+            return []
+
+    def generate_file(self, file_path, client=None):
+        renderer, template_path = self.get_renderer(file_path)
         try:
-            return renderer.render_template(template_path)
+            return renderer.render_template(template_path, client)
         except Exception as e:
             self.logger.warn('Cannot generate file {0}: {1}'.format(file_path, str(e)))
             return "# FILE GENERATION FAILED: {0}\n".format(str(e))
 
+    def write_file(self, path, text, mode=None):
+        # Returns False, without touching the file, if it already has this content
+        data = text.encode('utf-8')
+        try:
+            with open(path, 'rb') as f:
+                if hashlib.sha256(f.read()).digest() == hashlib.sha256(data).digest():
+                    return False
+        except FileNotFoundError:
+            pass
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644 if mode is None else mode)
+        if mode is not None:
+            os.fchmod(fd, mode)
+
+        with open(fd, 'wb') as f:
+            f.write(data)
+
+        return True
+
+    def record_generation(self, name, started_at, changed, client=None):
+        duration = time.monotonic() - started_at
+        stats = self.generation_stats.setdefault(name, {
+            'count': 0,
+            'total_time': 0,
+            'changes': 0,
+            'rpc_calls': 0,
+            'rpc_fetches': 0
+        })
+        stats['count'] += 1
+        stats['changes'] += int(changed)
+        stats['total_time'] += duration
+        stats['last_time'] = duration
+        if client:
+            # Calls made by the template and how many of them were not already fetched for the batch
+            stats['rpc_calls'] += client.calls
+            stats['rpc_fetches'] += client.fetches
+
+        self.logger.debug('Generated {0} in {1:.1f} ms{2}'.format(name, duration * 1000, '' if changed else ' (unchanged)'))
+
     def emit_event(self, name, params):
         self.client.emit_event(name, params)
 
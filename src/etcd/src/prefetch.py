@@ -0,0 +1,111 @@
+#+
+# Copyright 2017 iXsystems, Inc.
+# All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted providing that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
+# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+#####################################################################
+
+import copy
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+PREFETCH_CONCURRENCY = 8
+
+
+def call_key(name, args):
+    return json.dumps([name, args], sort_keys=True, default=str)
+
+
+class GenerationBatch(object):
+    """
+    Memoizes dispatcher calls made by the templates rendered within one
+    generation request. Calls declared up front with `prefetch` are issued
+    concurrently; any other call is fetched on first use and shared with
+    later templates of the same batch.
+    """
+    def __init__(self, client, concurrency=PREFETCH_CONCURRENCY):
+        self.client = client
+        self.results = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.pool.shutdown(wait=False)
+
+    def get_future(self, name, args):
+        key = call_key(name, args)
+        with self.lock:
+            future = self.results.get(key)
+            if future:
+                return future, False
+
+            future = self.results[key] = Future()
+            return future, True
+
+    def fetch(self, future, name, args, **kwargs):
+        try:
+            future.set_result(self.client.call_sync(name, *args, **kwargs))
+        except BaseException as err:
+            future.set_exception(err)
+
+    def prefetch(self, calls):
+        for name, *args in calls:
+            future, owner = self.get_future(name, list(args))
+            if owner:
+                self.pool.submit(self.fetch, future, name, list(args))
+
+    def call_sync(self, name, *args, **kwargs):
+        future, owner = self.get_future(name, list(args))
+        if owner:
+            self.fetch(future, name, list(args), **kwargs)
+
+        # Templates are free to modify what they get
+        return copy.deepcopy(future.result()), owner
+
+    def client_for(self, name):
+        return TemplateClient(self, name)
+
+
+class TemplateClient(object):
+    """
+    Dispatcher client handed to a single template, counting its calls.
+    """
+    def __init__(self, batch, name):
+        self.batch = batch
+        self.name = name
+        self.calls = 0
+        self.fetches = 0
+
+    def call_sync(self, name, *args, **kwargs):
+        result, fetched = self.batch.call_sync(name, *args, **kwargs)
+        self.calls += 1
+        self.fetches += int(fetched)
+        return result
+
+    def __getattr__(self, item):
+        return getattr(self.batch.client, item)
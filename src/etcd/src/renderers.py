@@ -25,7 +25,7 @@
 #
 #####################################################################
 
-
+import os
 from mako import exceptions
 from mako.template import Template
 from datastore.config import ConfigStore
@@ -40,19 +40,36 @@ class TemplateFunctions:
 class MakoTemplateRenderer(object):
     def __init__(self, context):
         self.context = context
+        self.templates = {}
+
+    def get_template(self, path):
+        # Compiled templates are reused until the source file changes
+        mtime = os.stat(path).st_mtime_ns
+        cached = self.templates.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        tmpl = Template(filename=path)
+        self.templates[path] = (mtime, tmpl)
+        return tmpl
+
+    def get_prefetch(self, path):
+        # Templates list the calls they make in a module level block:
+        # <%! prefetch = [('service.nfs.get_config',)] %>
+        return getattr(self.get_template(path).module, 'prefetch', [])
 
-    def get_template_context(self):
+    def get_template_context(self, client=None):
         return {
             "disclaimer": TemplateFunctions.disclaimer,
             "config": self.context.configstore,
-            "dispatcher": self.context.client,
+            "dispatcher": client or self.context.client,
             "ds": self.context.datastore
         }
 
-    def render_template(self, path):
+    def render_template(self, path, client=None):
         try:
-            tmpl = Template(filename=path)
-            return tmpl.render(**self.get_template_context())
+            tmpl = self.get_template(path)
+            return tmpl.render(**self.get_template_context(client))
         except:
             self.context.logger.debug('Failed to render mako template: {0}'.format(
                 exceptions.text_error_template().render()
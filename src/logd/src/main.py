@@ -37,13 +37,15 @@ import logging
 import itertools
 import time
 import errno
+import select
+import contextlib
 import datastore
 import datastore.config
 from datetime import datetime
 from bsd import setproctitle
 from bsd import kinfo_getproc
 from bsd import SyslogPriority, SyslogFacility
-from freenas.dispatcher.server import Server
+from freenas.dispatcher.server import Server, ServerConnection
 from freenas.dispatcher.rpc import RpcContext, RpcService, RpcException, generator, get_sender
 from freenas.serviced import ServicedException, checkin, get_job_by_pid
 from freenas.utils import query as q
@@ -51,6 +53,8 @@ from freenas.utils.debug import DebugService
 
 
 FLUSH_INTERVAL = 180
+SUBSCRIPTION_INTERVAL = 0.5
+SUBSCRIPTION_MAX_BATCH = 1024
 RCVBUF_MINSIZE = 80 * 1024  # same as in syslogd
 SYSLOG_PATTERN = re.compile(r'<(?P<priority>\d+)>(?P<syslog_timestamp>\w+\s+\d+\s+\d+:\d+:\d+) (?P<identifier>[\w\[\]]+): (?P<message>.*)')
 KLOG_PATTERN = re.compile(r'<(?P<priority>\d+)>(?P<message>.*)')
@@ -76,6 +80,138 @@ def parse_priority(prio):
         return SyslogPriority(int(prio) & 0x7), facility
 
 
+class ProcessCache(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.kq = select.kqueue()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def start(self):
+        thread = threading.Thread(target=self.watch, name='Process cache thread', daemon=True)
+        thread.start()
+
+    def get(self, pid):
+        with self.lock:
+            entry = self.entries.get(pid)
+            if entry:
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+
+        entry = {'identifier': None, 'service': None}
+        try:
+            entry['identifier'] = kinfo_getproc(pid).command
+            alive = True
+        except OSError:
+            # Process is already gone; launchd may still know its job, but there is nothing to track
+            alive = False
+
+        try:
+            job = get_job_by_pid(pid, True)
+            entry['service'] = job['Label']
+        except ServicedException:
+            pass
+
+        if not alive:
+            return entry
+
+        ev = select.kevent(
+            pid,
+            select.KQ_FILTER_PROC,
+            select.KQ_EV_ADD | select.KQ_EV_ENABLE | select.KQ_EV_ONESHOT,
+            select.KQ_NOTE_EXIT | select.KQ_NOTE_EXEC,
+            0, 0
+        )
+
+        with self.lock:
+            try:
+                self.kq.control([ev], 0)
+            except OSError:
+                return entry
+
+            self.entries[pid] = entry
+
+        return entry
+
+    def invalidate(self, pid):
+        with self.lock:
+            if self.entries.pop(pid, None):
+                self.invalidations += 1
+
+    def watch(self):
+        while True:
+            for ev in self.kq.control(None, 64):
+                if ev.filter != select.KQ_FILTER_PROC:
+                    continue
+
+                self.invalidate(ev.ident)
+
+                # Still alive after exec, drop the remaining registration
+                if not ev.fflags & select.KQ_NOTE_EXIT:
+                    with contextlib.suppress(OSError):
+                        self.kq.control([select.kevent(ev.ident, select.KQ_FILTER_PROC, select.KQ_EV_DELETE)], 0)
+
+    def get_stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+class LogSubscription(object):
+    def __init__(self, sender, filter):
+        self.id = str(uuid.uuid4())
+        self.sender = sender
+        self.service = filter.get('service')
+        self.identifier = re.compile(filter['identifier']) if filter.get('identifier') else None
+        self.priority = None
+        self.pending = []
+        self.dropped = 0
+
+        if filter.get('priority'):
+            self.priority = parse_priority(filter['priority'])[0]
+
+    def match(self, item):
+        if self.service and item.get('service') != self.service:
+            return False
+
+        if self.priority is not None:
+            if int(getattr(SyslogPriority, item['priority'], SyslogPriority.DEBUG)) > int(self.priority):
+                return False
+
+        if self.identifier and not self.identifier.search(item.get('identifier') or ''):
+            return False
+
+        return True
+
+    def __getstate__(self):
+        return {
+            'id': self.id,
+            'service': self.service,
+            'priority': self.priority.name if self.priority is not None else None,
+            'identifier': self.identifier.pattern if self.identifier else None
+        }
+
+
+class LogdConnection(ServerConnection):
+    def __init__(self, parent):
+        super(LogdConnection, self).__init__(parent)
+        self.context = parent.context
+
+    def on_close(self, reason):
+        super(LogdConnection, self).on_close(reason)
+        self.context.drop_subscriptions(self)
+
+
 class LoggingService(RpcService):
     def __init__(self, context):
         self.context = context
@@ -96,15 +232,38 @@ class LoggingService(RpcService):
             entry['gid'] = creds['gid']
 
         if 'identifier' not in entry:
-            try:
-                proc = kinfo_getproc(entry['pid'])
-                entry['identifier'] = proc.command
-            except OSError:
-                entry['identifier'] = 'unknown'
+            proc = self.context.process_cache.get(entry['pid'])
+            entry['identifier'] = proc['identifier'] or 'unknown'
 
         entry['source'] = 'rpc'
         self.context.push(entry)
 
+    def subscribe(self, filter=None):
+        try:
+            sub = LogSubscription(get_sender(), filter or {})
+        except re.error as err:
+            raise RpcException(errno.EINVAL, 'Invalid identifier pattern: {0}'.format(err))
+
+        with self.context.subscription_lock:
+            self.context.subscriptions[sub.id] = sub
+
+        return sub.id
+
+    def unsubscribe(self, id):
+        with self.context.subscription_lock:
+            sub = self.context.subscriptions.get(id)
+            if not sub or sub.sender is not get_sender():
+                raise RpcException(errno.ENOENT, 'Subscription {0} not found'.format(id))
+
+            del self.context.subscriptions[id]
+
+    def get_cache_stats(self):
+        return self.context.process_cache.get_stats()
+
+    def get_subscriptions(self):
+        with self.context.subscription_lock:
+            return [s.__getstate__() for s in self.context.subscriptions.values()]
+
     @generator
     def query_boots(self, filter=None, params=None):
         if not self.context.datastore:
@@ -238,6 +397,9 @@ class Context(object):
         self.klog_reader = None
         self.flush = False
         self.flush_thread = None
+        self.process_cache = ProcessCache()
+        self.subscriptions = {}
+        self.subscription_lock = threading.Lock()
         self.datastore = None
         self.configstore = None
         self.started_at = datetime.utcnow()
@@ -263,7 +425,7 @@ class Context(object):
             sys.exit(1)
 
     def init_rpc_server(self):
-        self.server = Server(self)
+        self.server = Server(self, connection_class=LogdConnection)
         self.server.rpc = self.rpc
         self.rpc.streaming_enabled = True
         self.rpc.streaming_burst = 16
@@ -287,6 +449,10 @@ class Context(object):
         self.flush_thread = threading.Thread(target=self.do_flush, name='Flush thread')
         self.flush_thread.start()
 
+    def init_subscriptions(self):
+        thread = threading.Thread(target=self.do_subscriptions, name='Subscription thread', daemon=True)
+        thread.start()
+
     def load_configuration(self):
         syslog_server = self.configstore.get('system.syslog_server')
 
@@ -318,11 +484,9 @@ class Context(object):
             item['timestamp'] = datetime.now()
 
         if 'pid' in item:
-            try:
-                job = get_job_by_pid(item['pid'], True)
-                item['service'] = job['Label']
-            except ServicedException:
-                pass
+            proc = self.process_cache.get(item['pid'])
+            if proc['service']:
+                item['service'] = proc['service']
 
         with self.lock:
             priority, facility = parse_priority(item['priority'])
@@ -337,8 +501,48 @@ class Context(object):
             self.seqno += 1
 
         self.server.broadcast_event('logd.logging.message', item)
+        self.dispatch(item)
         self.forward(item)
 
+    def dispatch(self, item):
+        with self.subscription_lock:
+            for sub in self.subscriptions.values():
+                if sub.match(item):
+                    if len(sub.pending) < SUBSCRIPTION_MAX_BATCH:
+                        sub.pending.append(item)
+                    else:
+                        sub.dropped += 1
+
+    def drop_subscriptions(self, sender):
+        with self.subscription_lock:
+            for sub in list(self.subscriptions.values()):
+                if sub.sender is sender:
+                    del self.subscriptions[sub.id]
+
+    def do_subscriptions(self):
+        while True:
+            time.sleep(SUBSCRIPTION_INTERVAL)
+            with self.subscription_lock:
+                batches = []
+                for sub in self.subscriptions.values():
+                    if sub.pending or sub.dropped:
+                        batches.append((sub, sub.pending, sub.dropped))
+                        sub.pending = []
+                        sub.dropped = 0
+
+            for sub, entries, dropped in batches:
+                try:
+                    # 'dropped' counts matching entries that did not fit into the batch
+                    sub.sender.emit_event('logd.logging.batch', {
+                        'id': sub.id,
+                        'entries': entries,
+                        'dropped': dropped
+                    })
+                except BaseException as err:
+                    logging.info('Dropping subscription {0}: {1}'.format(sub.id, err))
+                    with self.subscription_lock:
+                        self.subscriptions.pop(sub.id, None)
+
     def forward(self, item):
         hostname = socket.gethostname()
         prio = SyslogPriority.INFO
@@ -390,9 +594,11 @@ class Context(object):
     def main(self):
         setproctitle('logd')
         self.init_configstore()
+        self.process_cache.start()
         self.init_syslog_server()
         self.init_klog()
         self.init_rpc_server()
+        self.init_subscriptions()
         self.init_flush()
         self.load_configuration()
         checkin()
@@ -55,6 +55,7 @@ from functools import reduce
 
 DEFAULT_CONFIGFILE = '/usr/local/etc/middleware.conf'
 INITIAL_DHCP_TIMEOUT = 180
+EVENT_COALESCE_INTERVAL = 0.5
 
 
 def cidr_to_netmask(cidr):
@@ -172,22 +173,54 @@ class RoutingSocketEventSource(threading.Thread):
         self.mtu_cache = {}
         self.flags_cache = {}
         self.link_state_cache = {}
+        self.changed_cv = Condition()
+        self.changed_ids = set()
 
     def build_cache(self):
         # Build a cache of certain interface states so we'll later know what has changed
         for i in list(netif.list_interfaces().values()):
+            self.cache_interface(i)
+
+    def cache_interface(self, iface):
+        try:
+            self.mtu_cache[iface.name] = iface.mtu
+            self.flags_cache[iface.name] = iface.flags
+            self.link_state_cache[iface.name] = iface.link_state
+        except OSError as err:
+            # Apparently interface doesn't exist anymore
+            if err.errno == errno.ENXIO:
+                self.uncache_interface(iface.name)
+            else:
+                self.context.logger.warn('Building interface cache for {0} failed: {1}'.format(iface.name, str(err)))
+
+    def uncache_interface(self, name):
+        self.mtu_cache.pop(name, None)
+        self.flags_cache.pop(name, None)
+        self.link_state_cache.pop(name, None)
+
+    def interface_changed(self, name):
+        with self.changed_cv:
+            self.changed_ids.add(name)
+            self.changed_cv.notify_all()
+
+    def emit_changes(self):
+        # Coalesce bursts of interface updates (eg. link flaps) into a single event
+        while True:
+            with self.changed_cv:
+                self.changed_cv.wait_for(lambda: self.changed_ids)
+
+            time.sleep(EVENT_COALESCE_INTERVAL)
+            with self.changed_cv:
+                ids = list(self.changed_ids)
+                self.changed_ids.clear()
+
             try:
-                self.mtu_cache[i.name] = i.mtu
-                self.flags_cache[i.name] = i.flags
-                self.link_state_cache[i.name] = i.link_state
-            except OSError as err:
-                # Apparently interface doesn't exist anymore
-                if err.errno == errno.ENXIO:
-                    self.mtu_cache.pop(i.name, None)
-                    self.flags_cache.pop(i.name, None)
-                    self.link_state_cache.pop(i.name, None)
-                else:
-                    self.context.logger.warn('Building interface cache for {0} failed: {1}'.format(i.name, str(err)))
+                self.client.emit_event('network.interface.changed', {
+                    'operation': 'update',
+                    'ids': ids
+                })
+            except RpcException as err:
+                self.context.logger.warning('Cannot emit interface change event: {0}'.format(str(err)))
 
     def alias_added(self, message):
         pass
@@ -200,6 +233,7 @@ class RoutingSocketEventSource(threading.Thread):
         rtsock.open()
 
         self.build_cache()
+        threading.Thread(target=self.emit_changes, name='Interface events thread', daemon=True).start()
 
         while True:
             message = rtsock.read_message()
@@ -210,12 +244,15 @@ class RoutingSocketEventSource(threading.Thread):
                 if message.type == netif.InterfaceAnnounceType.ARRIVAL:
                     self.context.interface_attached(message.interface)
                     self.client.emit_event('network.interface.attached', args)
+                    try:
+                        self.cache_interface(netif.get_interface(message.interface))
+                    except KeyError:
+                        pass
 
                 if message.type == netif.InterfaceAnnounceType.DEPARTURE:
                     self.context.interface_detached(message.interface)
                     self.client.emit_event('network.interface.detached', args)
-
-                self.build_cache()
+                    self.uncache_interface(message.interface)
 
             if type(message) is netif.InterfaceInfoMessage:
                 ifname = message.interface
@@ -246,12 +283,13 @@ class RoutingSocketEventSource(threading.Thread):
                         })
 
                 if self.flags_cache[ifname] != message.flags:
-                    if (netif.InterfaceFlags.UP in self.flags_cache) and (netif.InterfaceFlags.UP not in message.flags):
+                    old_flags = self.flags_cache[ifname]
+                    if (netif.InterfaceFlags.UP in old_flags) and (netif.InterfaceFlags.UP not in message.flags):
                         self.client.emit_event('network.interface.down', {
                             'interface': ifname,
                         })
 
-                    if (netif.InterfaceFlags.UP not in self.flags_cache) and (netif.InterfaceFlags.UP in message.flags):
+                    if (netif.InterfaceFlags.UP not in old_flags) and (netif.InterfaceFlags.UP in message.flags):
                         self.client.emit_event('network.interface.up', {
                             'interface': ifname,
                         })
@@ -262,15 +300,13 @@ class RoutingSocketEventSource(threading.Thread):
                         'new_flags': [f.name for f in message.flags]
                     })
 
-                self.client.emit_event('network.interface.changed', {
-                    'operation': 'update',
-                    'ids': [ifname]
-                })
-
-                self.build_cache()
+                self.mtu_cache[ifname] = message.mtu
+                self.flags_cache[ifname] = message.flags
+                self.link_state_cache[ifname] = message.link_state
+                self.interface_changed(ifname)
 
             if type(message) is netif.InterfaceAddrMessage:
-                entity = self.context.datastore.get_by_id('network.interfaces', message.interface)
+                entity = self.context.get_interface_config(message.interface)
                 if entity is None:
                     continue
 
@@ -302,10 +338,7 @@ class RoutingSocketEventSource(threading.Thread):
                         message.netmask
                     ))
 
-                self.client.emit_event('network.interface.changed', {
-                    'operation': 'update',
-                    'ids': [entity['id']]
-                })
+                self.interface_changed(entity['id'])
 
             if type(message) is netif.RoutingMessage:
                 if message.errno != 0:
@@ -437,6 +470,7 @@ class ConfigurationService(RpcService):
 
     @generator
     def configure_network(self):
+        self.context.load_interface_config()
         if self.config.get('network.autoconfigure'):
             # Try DHCP on each interface until we find lease. Mark failed ones as disabled.
             self.logger.warn('Network in autoconfiguration mode')
@@ -463,6 +497,7 @@ class ConfigurationService(RpcService):
                     })
 
                     self.datastore.update('network.interfaces', entity['id'], entity)
+                    self.context.set_interface_config(i.name, entity)
                     self.config.set('network.autoconfigure', False)
                     self.logger.info('Successfully configured interface {0}'.format(i.name))
                     return
@@ -631,6 +666,7 @@ class ConfigurationService(RpcService):
     @generator
     def configure_interface(self, name, restart_rtsold=True):
         entity = self.datastore.get_one('network.interfaces', ('id', '=', name))
+        self.context.set_interface_config(name, entity)
         if not entity:
             raise RpcException(errno.ENXIO, "Configuration for interface {0} not found".format(name))
 
@@ -827,6 +863,8 @@ class Main(object):
         self.logger = logging.getLogger('networkd')
         self.default_interface = None
         self.cv = Condition()
+        self.interfaces_lock = threading.Lock()
+        self.interfaces = {}
 
     def dhclient_pid(self, interface):
         path = os.path.join('/var/run', 'dhclient.{0}.pid'.format(interface))
@@ -990,12 +1028,27 @@ class Main(object):
 
         self.dhcp_clients[interface].request(renew=True, timeout=30)
 
+    def load_interface_config(self):
+        with self.interfaces_lock:
+            self.interfaces = {i['id']: i for i in self.datastore.query('network.interfaces')}
+
+    def get_interface_config(self, name):
+        with self.interfaces_lock:
+            return self.interfaces.get(name)
+
+    def set_interface_config(self, name, entity):
+        with self.interfaces_lock:
+            if entity:
+                self.interfaces[name] = entity
+            else:
+                self.interfaces.pop(name, None)
+
     def link_down(self, name):
         if name in self.dhcp_clients:
             self.deconfigure_dhcp(name)
 
     def link_up(self, name):
-        iface = self.datastore.get_by_id('network.interfaces', name)
+        iface = self.get_interface_config(name)
         if not iface:
             return
 
@@ -1058,6 +1111,8 @@ class Main(object):
         for i in self.datastore.query('network.interfaces', ('id', 'nin', existing), ('cloned', '=', False)):
             self.datastore.delete('network.interfaces', i['id'])
 
+        self.load_interface_config()
+
     def init_datastore(self):
         try:
             self.datastore = get_datastore(self.config)
@@ -1066,6 +1121,7 @@ class Main(object):
             sys.exit(1)
 
         self.configstore = ConfigStore(self.datastore)
+        self.configstore.add_listener(lambda keys: self.client.emit_event('config.changed', {'keys': keys}))
 
     def connect(self, resume=False):
         while True:
@@ -2,6 +2,8 @@ import falcon
 import logging
 import pprint
 
+from urllib.parse import urlencode
+
 from freenas.dispatcher.rpc import RpcException
 
 from swagger import normalize_schema
@@ -259,7 +261,17 @@ class ResourceQueryMixin:
                         val = False
                 return val
 
-            if key in ('limit', 'offset', 'count'):
+            if key == 'pretty':
+                # Output formatting option, handled by JSONTranslator
+                continue
+
+            if key in ('limit', 'offset'):
+                if not val.isdigit():
+                    raise falcon.HTTPBadRequest('Invalid parameter', '{0} must be a non-negative integer'.format(key))
+
+                urlparams[key] = int(val)
+                continue
+            elif key == 'count':
                 urlparams[key] = convert(val)
                 continue
             elif key == 'sort':
@@ -311,8 +323,46 @@ class EntityResource(Resource, ResourceQueryMixin):
                 else:
                     raise NotImplementedError('{0} not implemented'.format(typ))
             resp.status = falcon.HTTP_201
+        elif method == 'get':
+            self.paginate(req, resp)
         return rv
 
+    def paginate(self, req, resp):
+        """
+        Sets X-Total-Count and Link headers for paginated collection requests.
+        """
+        (filter, params), _ = self.run_get(req, {})
+        limit = params.get('limit')
+        offset = params.get('offset') or 0
+        if not limit and not offset:
+            return
+
+        typ, name = self._get_type_name(self.get)
+        if typ != 'rpc':
+            return
+
+        try:
+            total = req.context['client'].call_sync(name, filter, {'count': True})
+        except RpcException as e:
+            log.debug('Cannot count results of {0}: {1}'.format(name, str(e)))
+            return
+
+        def link(new_offset, rel):
+            query = dict(req.params)
+            query['offset'] = new_offset
+            return '<?{0}>; rel="{1}"'.format(urlencode(query, doseq=True), rel)
+
+        links = []
+        if limit and offset + limit < total:
+            links.append(link(offset + limit, 'next'))
+
+        if offset > 0:
+            links.append(link(max(offset - (limit or offset), 0), 'prev'))
+
+        resp.set_header('X-Total-Count', str(total))
+        if links:
+            resp.set_header('Link', ', '.join(links))
+
     def run_post(self, req, urlparams):
         args = []
         if 'doc' in req.context:
@@ -19,7 +19,8 @@ from freenas.serviced import checkin
 
 from gevent.pywsgi import WSGIHandler, WSGIServer
 
-from serializers import JsonEncoder
+from pool import ClientPool
+from serializers import JsonEncoder, is_collection, stream_json
 from swagger import SwaggerResource
 
 
@@ -61,12 +62,57 @@ class JSONTranslator(object):
                                    'UTF-8.')
 
     def process_response(self, req, resp, resource):
-        if 'result' in req.context:
-            resp.body = JsonEncoder(indent=True).encode(req.context['result'])
+        if 'result' not in req.context:
+            return
+
+        result = req.context['result']
+        indent = 4 if req.get_param_as_bool('pretty') else None
+
+        if is_collection(result):
+            ndjson = 'application/x-ndjson' in (req.accept or '')
+            if ndjson:
+                resp.content_type = 'application/x-ndjson'
+
+            resp.stream = stream_json(result, ndjson=ndjson, indent=indent)
+            return
+
+        resp.body = JsonEncoder(indent=indent, separators=None if indent else (',', ':')).encode(result)
+
+
+class ReleasingStream(object):
+    """
+    Response body that returns the dispatcher client to the pool once the
+    WSGI server is done with it, whether or not the body was ever iterated:
+    the server calls close() even when the client goes away before sending.
+    """
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+        self.released = False
+
+    def __iter__(self):
+        try:
+            yield from self.stream
+        finally:
+            self.close()
+
+    def close(self):
+        if self.released:
+            return
+
+        self.released = True
+        try:
+            if hasattr(self.stream, 'close'):
+                self.stream.close()
+        finally:
+            self.release()
 
 
 class AuthMiddleware(object):
 
+    def __init__(self, pool):
+        self.pool = pool
+
     def process_request(self, req, resp):
         # Do not require auth to access index
         if req.relative_uri == '/':
@@ -89,10 +135,7 @@ class AuthMiddleware(object):
             )
 
         try:
-            client = Client()
-            client.connect('unix:')
-            client.login_user(username, password, check_password=True)
-            req.context['client'] = client
+            req.context['client'] = self.pool.acquire(username, password)
         except RpcException as e:
             if e.code == errno.EACCES:
                 raise falcon.HTTPUnauthorized(
@@ -103,8 +146,16 @@ class AuthMiddleware(object):
             raise falcon.HTTPUnauthorized('Unknown authentication error', str(e), ['Basic realm="FreeNAS"'])
 
     def process_response(self, req, resp, resource):
-        if 'client' in req.context:
-            req.context['client'].disconnect()
+        if 'client' not in req.context:
+            return
+
+        client = req.context['client']
+        if resp.stream is None:
+            self.pool.release(client)
+            return
+
+        # Streamed results may still be read from the session, release it once done
+        resp.stream = ReleasingStream(resp.stream, lambda: self.pool.release(client))
 
 
 class RESTApi(object):
@@ -118,11 +169,13 @@ class RESTApi(object):
         self._used_schemas = set()
         self._services = {}
         self._tasks = {}
+        self.pool = ClientPool()
         self.api = falcon.API(middleware=[
-            AuthMiddleware(),
+            AuthMiddleware(self.pool),
             JSONTranslator(),
         ])
-        self.api.add_route('/', SwaggerResource(self))
+        self.swagger = SwaggerResource(self)
+        self.api.add_route('/', self.swagger)
 
         gevent.signal(signal.SIGINT, self.die)
 
@@ -184,9 +237,10 @@ class RESTApi(object):
         self.init_dispatcher()
         self.init_metadata()
         self.load_plugins()
+        self.swagger.build()
 
         server4 = WSGIServer(('0.0.0.0', 8889), self, handler_class=RESTWSGIHandler)
-        self._threads = [gevent.spawn(server4.serve_forever)]
+        self._threads = [gevent.spawn(server4.serve_forever), gevent.spawn(self.pool.run_expire)]
         checkin()
         gevent.joinall(self._threads)
 
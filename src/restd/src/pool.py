@@ -0,0 +1,114 @@
+import gevent
+import hashlib
+import logging
+import time
+
+from freenas.dispatcher.client import Client
+
+
+logger = logging.getLogger(__name__)
+
+
+class ClientPool(object):
+    """
+    Pool of dispatcher connections already logged in as a given user,
+    keyed by the credentials used to authenticate them.
+    """
+
+    def __init__(self, verify_ttl=60, idle_timeout=300, max_idle=8):
+        self.verify_ttl = verify_ttl
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self.idle = {}
+        self.verified = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(username, password):
+        digest = hashlib.sha256('{0}:{1}'.format(username, password).encode('utf8')).hexdigest()
+        return username, digest
+
+    def acquire(self, username, password):
+        key = self.get_key(username, password)
+        now = time.monotonic()
+        verified_at = self.verified.get(key)
+
+        if verified_at is not None and now - verified_at < self.verify_ttl:
+            clients = self.idle.get(key)
+            while clients:
+                client, released_at = clients.pop()
+                if client.connected:
+                    self.hits += 1
+                    client.pool_key = key
+                    return client
+        else:
+            # Credentials need to be checked again, drop sessions opened with them
+            self.evict(key)
+
+        self.misses += 1
+        client = Client()
+        client.connect('unix:')
+        try:
+            client.login_user(username, password, check_password=True)
+        except:
+            client.disconnect()
+            raise
+
+        self.verified[key] = time.monotonic()
+        client.pool_key = key
+        return client
+
+    def release(self, client):
+        key = getattr(client, 'pool_key', None)
+        if not client.connected:
+            return
+
+        clients = self.idle.setdefault(key, [])
+        if key not in self.verified or len(clients) >= self.max_idle:
+            client.disconnect()
+            return
+
+        clients.append((client, time.monotonic()))
+
+    def evict(self, key):
+        for client, released_at in self.idle.pop(key, []):
+            client.disconnect()
+
+        self.verified.pop(key, None)
+
+    def expire(self):
+        now = time.monotonic()
+        for key, clients in list(self.idle.items()):
+            alive = []
+            for client, released_at in clients:
+                if now - released_at > self.idle_timeout or not client.connected:
+                    client.disconnect()
+                    continue
+
+                alive.append((client, released_at))
+
+            if alive:
+                self.idle[key] = alive
+            else:
+                del self.idle[key]
+
+        for key, verified_at in list(self.verified.items()):
+            if now - verified_at > self.verify_ttl and key not in self.idle:
+                del self.verified[key]
+
+    def run_expire(self):
+        while True:
+            gevent.sleep(min(self.verify_ttl, self.idle_timeout))
+            try:
+                self.expire()
+            except:
+                logger.warning('Failed to expire idle dispatcher sessions', exc_info=True)
+
+    def __getstate__(self):
+        return {
+            'idle': sum(len(i) for i in self.idle.values()),
+            'users': len(self.idle),
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -3,8 +3,47 @@ from datetime import datetime
 import json
 
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
 class JsonEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
             return str(obj)
         return json.JSONEncoder.default(self, obj)
+
+
+def is_collection(obj):
+    return not isinstance(obj, (dict, str, bytes)) and hasattr(obj, '__iter__')
+
+
+def stream_json(items, ndjson=False, indent=None):
+    """
+    Encode an iterable as a JSON array (or newline delimited JSON) lazily,
+    yielding chunks of roughly STREAM_CHUNK_SIZE bytes.
+    """
+    if ndjson:
+        indent = None
+
+    encoder = JsonEncoder(indent=indent, separators=None if indent else (',', ':'))
+    separator = '\n' if ndjson else ','
+    chunk = [] if ndjson else ['[']
+    size = 0
+    first = True
+
+    for i in items:
+        if not first:
+            chunk.append(separator)
+
+        data = encoder.encode(i)
+        chunk.append(data)
+        size += len(data)
+        first = False
+
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+            size = 0
+
+    chunk.append('\n' if ndjson and not first else '' if ndjson else ']')
+    yield ''.join(chunk).encode('utf-8')
@@ -1,5 +1,10 @@
+import hashlib
 import logging
 
+import falcon
+
+from serializers import JsonEncoder
+
 logger = logging.getLogger('swagger')
 
 
@@ -23,9 +28,26 @@ class SwaggerResource(object):
 
     def __init__(self, rest):
         self.rest = rest
+        self.document = None
+        self.etag = None
 
     def on_get(self, req, resp):
+        if self.document is None:
+            self.build()
+
+        resp.etag = self.etag
+        resp.cache_control = ['no-cache']
+        if req.get_header('If-None-Match') == self.etag:
+            resp.status = falcon.HTTP_304
+            return
 
+        resp.data = self.document
+
+    def build(self):
+        """
+        The API document only depends on the loaded plugins and dispatcher
+        metadata, so it is generated once at startup.
+        """
         result = {
             'swagger': '2.0',
             'info': {
@@ -86,4 +108,5 @@ class SwaggerResource(object):
                 schemas_done.add(name)
         result['definitions'] = definitions
 
-        req.context['result'] = result
+        self.document = JsonEncoder(indent=True).encode(result).encode('utf-8')
+        self.etag = '"{0}"'.format(hashlib.sha1(self.document).hexdigest())
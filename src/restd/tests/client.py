@@ -8,13 +8,13 @@ class Client(object):
         self.base_path = base_path or ''
         self.uri = uri
 
-    def request(self, method, path, params=None, data=None):
+    def request(self, method, path, params=None, data=None, headers=None):
         r = requests.request(
             method,
             self.uri + self.base_path + path,
             params=params,
             data=json.dumps(data) if data else None,
-            headers={'Content-Type': "application/json"},
+            headers=dict({'Content-Type': "application/json"}, **(headers or {})),
             auth=self.auth,
         )
         return r
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Simple load generator for restd, reports requests/sec for a single endpoint.
+
+Run it against a build with and without the pooled dispatcher sessions to
+compare, e.g.:
+
+    ./loadtest.py -a freenas.local -u root -p secret -e system/info -n 2000 -c 16
+"""
+import argparse
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from client import Client
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-a', '--address', required=True)
+    parser.add_argument('-u', '--username')
+    parser.add_argument('-p', '--password')
+    parser.add_argument('-P', '--port')
+    parser.add_argument('-e', '--endpoint', default='session/whoami')
+    parser.add_argument('-n', '--requests', default=1000, type=int)
+    parser.add_argument('-c', '--concurrency', default=8, type=int)
+    args = parser.parse_args()
+
+    client = Client(
+        'http://{0}{1}'.format(args.address, ':{0}'.format(args.port) if args.port else ''),
+        '/api/v2.0/',
+        username=args.username,
+        password=args.password,
+    )
+
+    def request(_):
+        started_at = time.monotonic()
+        r = client.get(args.endpoint)
+        return r.status_code, time.monotonic() - started_at
+
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(request, range(args.requests)))
+
+    elapsed = time.monotonic() - started_at
+    latencies = sorted(l for _, l in results)
+    failed = sum(1 for status, _ in results if status >= 400)
+
+    print('Requests:     {0} ({1} failed)'.format(len(results), failed))
+    print('Concurrency:  {0}'.format(args.concurrency))
+    print('Elapsed:      {0:.2f} s'.format(elapsed))
+    print('Requests/sec: {0:.1f}'.format(len(results) / elapsed))
+    print('Latency p50:  {0:.1f} ms'.format(latencies[len(latencies) // 2] * 1000))
+    print('Latency p99:  {0:.1f} ms'.format(latencies[int(len(latencies) * 0.99)] * 1000))
+
+
+if __name__ == '__main__':
+    main()
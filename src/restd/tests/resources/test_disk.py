@@ -56,3 +56,19 @@ class DiskTestCase(CRUDTestCase):
         ])
         data = r.json()
         self.assertEqual(disk['path'], data)
+
+    def test_050_pagination(self):
+        r = self.client.get(self.name, params={
+            'limit': 1,
+        })
+        self.assertEqual(r.status_code, 200, msg=r.text)
+        self.assertLessEqual(len(r.json()), 1)
+        self.assertIn('X-Total-Count', r.headers)
+        if int(r.headers['X-Total-Count']) > 1:
+            self.assertIn('rel="next"', r.headers.get('Link', ''))
+
+    def test_051_pagination_invalid(self):
+        r = self.client.get(self.name, params={
+            'limit': 'abc',
+        })
+        self.assertEqual(r.status_code, 400, msg=r.text)
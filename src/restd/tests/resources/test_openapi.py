@@ -8,3 +8,12 @@ class OpenAPITestCase(RESTTestCase):
         self.assertEqual(r.status_code, 200, msg=r.text)
         data = r.json()
         self.assertIsInstance(data, dict)
+
+    def test_030_etag(self):
+        r = self.client.get('')
+        self.assertEqual(r.status_code, 200, msg=r.text)
+        etag = r.headers.get('ETag')
+        self.assertIsNotNone(etag)
+
+        r = self.client.request('GET', '', headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 304, msg=r.text)
@@ -32,6 +32,7 @@ import logging
 import argparse
 import pytz
 import errno
+import threading
 from bsd import setproctitle
 from datetime import datetime, timezone
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -48,6 +49,8 @@ from store import FreeNASJobStore
 
 
 DEFAULT_CONFIGFILE = '/usr/local/etc/middleware.conf'
+FINAL_TASK_STATES = ('FINISHED', 'FAILED', 'ABORTED')
+CHECK_RUNNING_INTERVAL = 60
 ctx = None
 
 
@@ -63,22 +66,9 @@ class ManagementService(RpcService):
     @generator
     def query(self, filter=None, params=None):
         def serialize(job):
-            last_task = None
-            current_task = None
-            current_progress = None
-
             schedule = {f.name: f for f in job.trigger.fields}
             schedule['timezone'] = job.trigger.timezone
-
-            last_run = self.context.datastore_log.query(
-                'schedulerd.runs',
-                ('job_id', '=', job.id),
-                sort='created_at',
-                single=True
-            )
-
-            if last_run:
-                last_task = self.context.datastore_log.get_by_id('tasks', last_run['task_id'])
+            last_run = self.context.last_runs.get(job.id)
 
             return {
                 'id': job.id,
@@ -90,8 +80,8 @@ class ManagementService(RpcService):
                 'protected': job.kwargs['protected'],
                 'status': {
                     'next_run_time': job.next_run_time,
-                    'last_run_time': last_run['created_at'] if last_run else None,
-                    'last_run_status': last_task['state'] if last_task else None,
+                    'last_run_time': last_run['started_at'] if last_run else None,
+                    'last_run_status': last_run['state'] if last_run else None,
                     'current_run_id': self.context.active_tasks.get(job.id)
                 },
                 'schedule': schedule
@@ -203,7 +193,10 @@ class Context(object):
         self.configstore = None
         self.client = None
         self.scheduler = None
+        self.lock = threading.RLock()
         self.active_tasks = {}
+        self.running = {}
+        self.last_runs = {}
 
     def init_datastore(self):
         try:
@@ -225,11 +218,53 @@ class Context(object):
         self.client.on_error(on_error)
         self.connect()
 
+    def init_last_runs(self):
+        for i in self.datastore_log.query('schedulerd.last_runs'):
+            self.last_runs[i['id']] = i
+
+        # Backfill jobs which ran before last runs were materialized
+        for job in self.datastore.query('calendar_tasks', select='id'):
+            if job in self.last_runs:
+                continue
+
+            last_run = self.datastore_log.query(
+                'schedulerd.runs',
+                ('job_id', '=', job),
+                sort='-created_at',
+                single=True
+            )
+
+            if not last_run:
+                continue
+
+            task = self.datastore_log.get_by_id('tasks', last_run['task_id'])
+            self.update_last_run(job, {
+                'task_id': last_run['task_id'],
+                'started_at': last_run['created_at'],
+                'state': task['state'] if task else None
+            })
+
+    def update_last_run(self, job_id, run):
+        run['id'] = job_id
+        with self.lock:
+            self.last_runs[job_id] = run
+
+        self.datastore_log.upsert('schedulerd.last_runs', job_id, run)
+
     def init_scheduler(self):
         store = FreeNASJobStore()
         self.scheduler = BackgroundScheduler(jobstores={'default': store, 'temp': MemoryJobStore()}, timezone=pytz.utc)
         self.scheduler.start()
 
+        # Catches runs whose task.changed event was missed, so they do not block the job for good
+        self.scheduler.add_job(
+            self.check_running,
+            'interval',
+            id='check-running',
+            jobstore='temp',
+            seconds=CHECK_RUNNING_INTERVAL
+        )
+
     def connect(self):
         while True:
             try:
@@ -240,20 +275,73 @@ class Context(object):
                 self.client.register_service('scheduler.debug', DebugService())
                 self.client.resume_service('scheduler.management')
                 self.client.resume_service('scheduler.debug')
+                self.client.register_event_handler('task.changed', self.on_task_changed)
+                self.check_running()
                 return
             except (OSError, RpcException) as err:
                 self.logger.warning('Cannot connect to dispatcher: {0}, retrying in 1 second'.format(str(err)))
                 time.sleep(1)
 
     def run_job(self, *args, **kwargs):
-        tid = self.client.call_sync('task.submit_with_env', args[0], args[1:], {
-            'RUN_AS_USER': 'root',
-            'CALENDAR_TASK_NAME': kwargs.get('name')
+        with self.lock:
+            if kwargs['id'] in self.active_tasks:
+                self.logger.warning('Job {0} is still running, skipping'.format(kwargs['id']))
+                return
+
+            # Reserve the job while the task is being submitted
+            self.active_tasks[kwargs['id']] = None
+
+        try:
+            tid = self.client.call_sync('task.submit_with_env', args[0], args[1:], {
+                'RUN_AS_USER': 'root',
+                'CALENDAR_TASK_NAME': kwargs.get('name')
+            })
+        except BaseException:
+            with self.lock:
+                self.active_tasks.pop(kwargs['id'], None)
+            raise
+
+        with self.lock:
+            self.active_tasks[kwargs['id']] = tid
+            self.running[tid] = kwargs
+
+        self.update_last_run(kwargs['id'], {
+            'task_id': tid,
+            'started_at': datetime.utcnow(),
+            'state': 'CREATED'
         })
 
-        self.active_tasks[kwargs['id']] = tid
-        self.client.call_sync('task.wait', tid, timeout=None)
-        result = self.client.call_sync('task.status', tid)
+    def on_task_changed(self, args):
+        with self.lock:
+            ids = [i for i in args['ids'] if i in self.running]
+
+        for i in ids:
+            result = self.client.call_sync('task.status', i)
+            if result and result['state'] in FINAL_TASK_STATES:
+                self.task_done(result)
+
+    def check_running(self):
+        with self.lock:
+            ids = list(self.running)
+
+        for i in ids:
+            try:
+                result = self.client.call_sync('task.status', i)
+            except RpcException:
+                continue
+
+            if result and result['state'] in FINAL_TASK_STATES:
+                self.task_done(result)
+
+    def task_done(self, result):
+        with self.lock:
+            kwargs = self.running.pop(result['id'], None)
+            if not kwargs:
+                return
+
+            self.active_tasks.pop(kwargs['id'], None)
+
+        tid = result['id']
         if result['state'] != 'FINISHED':
             try:
                 self.client.call_sync('alert.emit', {
@@ -261,16 +349,23 @@ class Context(object):
                     'title': 'Task {0} failed'.format(kwargs.get('name', tid)),
                     'description': 'Task {0} has failed: {1}'.format(
                         kwargs.get('name', tid),
-                        result['error']['message']
+                        result['error']['message'] if result.get('error') else result['state']
                     ),
                 })
             except RpcException as e:
                 self.logger.error('Failed to emit alert', exc_info=True)
 
-        del self.active_tasks[kwargs['id']]
+        run = self.last_runs.get(kwargs['id'], {})
+        self.update_last_run(kwargs['id'], {
+            'task_id': tid,
+            'started_at': run.get('started_at'),
+            'finished_at': datetime.utcnow(),
+            'state': result['state']
+        })
+
         self.datastore_log.insert('schedulerd.runs', {
             'job_id': kwargs['id'],
-            'task_id': result['id']
+            'task_id': tid
         })
 
     def emit_event(self, name, params):
@@ -288,6 +383,7 @@ class Context(object):
         setproctitle('schedulerd')
         self.config = args.c
         self.init_datastore()
+        self.init_last_runs()
         self.init_scheduler()
         self.init_dispatcher()
         self.checkin()